@@ -188,7 +188,7 @@ class AgentContext:
             ),
             "no": self.no,
             "log_guid": self.log.guid,
-            "log_version": len(self.log.updates),
+            "log_version": self.log.version,
             "log_length": len(self.log.logs),
             "paused": self.paused,
             "last_message": (
@@ -341,6 +341,36 @@ class LoopData:
             setattr(self, key, value)
 
 
+class ContextWindow:
+    """Last prompt sent to the chat model, text and tokens are only rendered when requested."""
+
+    def __init__(self, prompt: list[BaseMessage]):
+        self.prompt = prompt
+        self._text: str | None = None
+        self._tokens: int | None = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = ChatPromptTemplate.from_messages(self.prompt).format()
+        return self._text
+
+    @property
+    def tokens(self) -> int:
+        if self._tokens is None:
+            self._tokens = tokens.approximate_tokens(self.text)
+        return self._tokens
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"text": self.text, "tokens": self.tokens}
+
+    def to_saved(self) -> dict[str, Any] | None:
+        # saving never renders the prompt, only a token count already computed is kept
+        if self._tokens is None:
+            return None
+        return {"tokens": self._tokens}
+
+
 class Agent:
 
     DATA_NAME_SUPERIOR = "_superior"
@@ -367,6 +397,11 @@ class Agent:
         self.intervention: UserMessage | None = None
         self.data: dict[str, Any] = {}  # free data object all the tools can use
 
+        # prompt assembly caches reused between message loop iterations
+        self.history_langchain_cache = history.LangchainOutputCache()
+        self._system_prompt_key: tuple[str, ...] = ()
+        self._system_message: SystemMessage | None = None
+
         extension.call_extensions_sync("agent_init", self)
 
     @extension.extensible
@@ -389,6 +424,9 @@ class Agent:
                     self.loop_data.iteration += 1
                     self.loop_data.params_temporary = {}  # clear temporary params
                     last_response_stream_full = ""
+                    # incremental parsers of the raw response and of the text passed to extensions
+                    response_root = extract_tools.JsonRootStream()
+                    response_view = extract_tools.JsonRootStream()
 
                     # call message_loop_start extensions
                     await extension.call_extensions_async(
@@ -407,17 +445,18 @@ class Agent:
                         await self.handle_intervention()
 
 
-                        async def reasoning_callback(chunk: str, full: str):
+                        async def reasoning_callback(chunk: str, full: str, parts: list[str] | None = None):
                             await self.handle_intervention()
                             if chunk == full:
                                 printer.print("Reasoning: ")  # start of reasoning
                             # Pass chunk and full data to extensions for processing
                             stream_data = {"chunk": chunk, "full": full}
-                            await extension.call_extensions_async(
+                            await extension.call_stream_extensions_async(
                                 "reasoning_stream_chunk",
                                 self,
                                 loop_data=self.loop_data,
                                 stream_data=stream_data,
+                                parts=parts,
                             )
                             # Stream masked chunk after extensions processed it
                             if stream_data.get("chunk"):
@@ -425,7 +464,7 @@ class Agent:
                             # Use the potentially modified full text for downstream processing
                             await self.handle_reasoning_stream(stream_data["full"])
 
-                        async def stream_callback(chunk: str, full: str):
+                        async def stream_callback(chunk: str, full: str, parts: list[str] | None = None):
                             nonlocal last_response_stream_full
                             await self.handle_intervention()
                             # output the agent response stream
@@ -435,9 +474,9 @@ class Agent:
                             stream_data = {"chunk": chunk, "full": full}
                             stop_response: str | None = None
 
-                            snapshot = extract_tools.extract_json_root_string(full)
+                            snapshot = response_root.update(full).root
                             if snapshot:
-                                parsed_snapshot = extract_tools.json_parse_dirty(snapshot)
+                                parsed_snapshot = response_root.parsed
                                 if parsed_snapshot is not None:
                                     try:
                                         await self.validate_tool_request(parsed_snapshot)
@@ -452,17 +491,21 @@ class Agent:
                                             stream_data["chunk"] = snapshot
                                         stop_response = snapshot
 
-                            await extension.call_extensions_async(
+                            await extension.call_stream_extensions_async(
                                 "response_stream_chunk",
                                 self,
                                 loop_data=self.loop_data,
                                 stream_data=stream_data,
+                                parts=parts,
                             )
                             # Stream masked chunk after extensions processed it
                             if stream_data.get("chunk"):
                                 printer.stream(stream_data["chunk"])
                             # Use the potentially modified full text for downstream processing
-                            await self.handle_response_stream(stream_data["full"])
+                            await self.handle_response_stream(
+                                stream_data["full"],
+                                parsed=response_view.update(stream_data["full"]).parsed,
+                            )
                             last_response_stream_full = stream_data["full"]
                             if stop_response is not None:
                                 return stop_response
@@ -552,8 +595,11 @@ class Agent:
             "message_loop_prompts_after", self, loop_data=loop_data
         )
 
-        # concatenate system prompt
-        system_text = "\n\n".join(loop_data.system)
+        # concatenate system prompt, reuse the message if no section changed
+        system_key = tuple(loop_data.system)
+        if self._system_message is None or system_key != self._system_prompt_key:
+            self._system_message = SystemMessage(content="\n\n".join(system_key))
+            self._system_prompt_key = system_key
 
         # join extras
         extras = history.Message(  # type: ignore[abstract]
@@ -567,29 +613,31 @@ class Agent:
         ).output()
         loop_data.extras_temporary.clear()
 
-        # convert history + extras to LLM format
-        history_langchain: list[BaseMessage] = history.output_langchain(
+        # convert history + extras to LLM format, only messages new since last time are converted
+        history_langchain: list[BaseMessage] = self.history_langchain_cache.output_langchain(
             loop_data.history_output + extras
         )
 
         # build full prompt from system prompt, message history and extrS
         full_prompt: list[BaseMessage] = [
-            SystemMessage(content=system_text),
+            self._system_message,
             *history_langchain,
         ]
-        full_text = ChatPromptTemplate.from_messages(full_prompt).format()
-
-        # store as last context window content
-        self.set_data(
-            Agent.DATA_NAME_CTX_WINDOW,
-            {
-                "text": full_text,
-                "tokens": tokens.approximate_tokens(full_text),
-            },
-        )
+
+        # store as last context window content, text and tokens are rendered on demand
+        self.set_data(Agent.DATA_NAME_CTX_WINDOW, ContextWindow(full_prompt))
 
         return full_prompt
 
+    def get_context_window(self) -> dict[str, Any] | None:
+        window = self.get_data(Agent.DATA_NAME_CTX_WINDOW)
+        if isinstance(window, ContextWindow):
+            return window.to_dict()
+        if isinstance(window, dict):
+            # loaded from a saved chat, the prompt text is only known until the next iteration
+            return {"text": window.get("text", ""), "tokens": window.get("tokens", 0)}
+        return None
+
     @extension.extensible
     async def handle_exception(self, location: str, exception: Exception):
         if exception:
@@ -992,12 +1040,13 @@ class Agent:
             text=stream,
         )
 
-    async def handle_response_stream(self, stream: str):
+    async def handle_response_stream(self, stream: str, parsed: dict | None = None):
         await self.handle_intervention()
         try:
             if len(stream) < 25:
                 return  # no reason to try
-            response = DirtyJson.parse_string(stream)
+            # parsed is the incrementally parsed stream, full parse only without it
+            response = parsed if parsed is not None else DirtyJson.parse_string(stream)
             if isinstance(response, dict):
                 await extension.call_extensions_async(
                     "response_stream",
@@ -1,15 +1,13 @@
 from helpers.api import ApiHandler, Input, Output, Request, Response
 
-from helpers import tokens
-
 
 class GetCtxWindow(ApiHandler):
     async def process(self, input: Input, request: Request) -> Output:
         ctxid = input.get("context", [])
         context = self.use_context(ctxid)
         agent = context.streaming_agent or context.agent0
-        window = agent.get_data(agent.DATA_NAME_CTX_WINDOW)
-        if not window or not isinstance(window, dict):
+        window = agent.get_context_window()
+        if not window:
             return {"content": "", "tokens": 0}
 
         text = window["text"]
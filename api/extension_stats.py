@@ -0,0 +1,35 @@
+from helpers.api import ApiHandler, Request, Response
+from helpers import extension
+
+
+class ExtensionStats(ApiHandler):
+    """Extension point call counts and timings, collection is toggled with {"enabled": bool}."""
+
+    @classmethod
+    def requires_auth(cls) -> bool:
+        return False
+
+    @classmethod
+    def requires_csrf(cls) -> bool:
+        return False
+
+    @classmethod
+    def requires_api_key(cls) -> bool:
+        return False
+
+    @classmethod
+    def requires_loopback(cls) -> bool:
+        return True
+
+    @classmethod
+    def get_methods(cls) -> list[str]:
+        return ["GET", "POST"]
+
+    async def process(self, input: dict, request: Request) -> dict | Response:
+        if "enabled" in input:
+            extension.set_stats_enabled(bool(input["enabled"]))
+        stats = extension.get_stats()
+        if input.get("reset"):
+            extension.reset_stats()
+
+        return {"enabled": extension.is_stats_enabled(), "stats": stats}
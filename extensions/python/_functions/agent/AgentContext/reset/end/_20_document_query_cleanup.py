@@ -0,0 +1,12 @@
+import sys
+
+from helpers.extension import Extension
+
+
+class DocumentQueryCleanup(Extension):
+    def execute(self, data: dict = {}, **kwargs):
+        # stores only exist once the document query tool has loaded the module
+        document_query = sys.modules.get("helpers.document_query")
+        args = data.get("args") or ()
+        if document_query and args:
+            document_query.DocumentQueryStore.drop(args[0].id)
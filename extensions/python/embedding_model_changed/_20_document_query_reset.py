@@ -0,0 +1,12 @@
+import sys
+
+from helpers.extension import Extension
+
+
+class DocumentQueryReset(Extension):
+
+    async def execute(self, **kwargs):
+        # indexed vectors belong to the previous model, stores are rebuilt on next use
+        document_query = sys.modules.get("helpers.document_query")
+        if document_query:
+            document_query.DocumentQueryStore.clear()
@@ -12,4 +12,5 @@ class SaveChat(Extension):
         if self.agent.context.type == AgentContextType.BACKGROUND:
             return
 
-        persist_chat.save_tmp_chat(self.agent.context)
+        # serialize on the event loop, write the changed segments off it
+        await persist_chat.save_tmp_chat_async(self.agent.context)
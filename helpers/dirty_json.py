@@ -1,4 +1,5 @@
 import json
+import re
 
 def try_parse(json_string: str):
     try:
@@ -15,7 +16,20 @@ def stringify(obj, **kwargs):
     return json.dumps(obj, ensure_ascii=False, **kwargs)
 
 
+# runs of plain string characters end at the closing quote or an escape
+_STRING_STOP = {quote: re.compile(f"[{quote}\\\\]") for quote in ['"', "'", "`"]}
+
+_NO_SLOT = object()  # no value being parsed in the container
+_ITEM = object()  # array item being parsed
+
+
 class DirtyJson:
+    """Forgiving JSON parser.
+
+    `parse` reads a complete string, `feed` accepts the input in chunks and resumes
+    where the previous chunk ended, so streamed text is parsed only once in total.
+    While streaming, `get_partial` returns the value parsed so far."""
+
     def __init__(self):
         self._reset()
 
@@ -27,10 +41,16 @@ class DirtyJson:
         self.stack = []
         self.completed = False
         self._parsing_started = False
+        self._final = True  # no more input will come, end of input ends values
+        self._parser = None  # suspended parser generator while streaming
+        self._finished = False
+        self._slots = []  # key (objects) or _ITEM (arrays) being parsed, per stack entry
+        self._partial_string = None
 
     def _pop_stack(self, root_closed: bool = False):
         """Pop from the parsing stack and mark completed only on an explicit root close."""
         self.stack.pop()
+        self._slots.pop()
         if root_closed and self._parsing_started and not self.stack:
             self.completed = True
 
@@ -61,11 +81,58 @@ class DirtyJson:
 
     def feed(self, chunk):
         self.json_string += chunk
-        if not self.current_char and self.json_string:
-            self.current_char = self.json_string[0]
+        if self._finished:
+            return self.result
+        self._final = False
+        if self.index < len(self.json_string):
+            self.current_char = self.json_string[self.index]
         self._parse()
+        return self.result if self._finished else self.get_partial()
+
+    def finish(self):
+        """End a fed stream, values still open are closed like at the end of a parsed string."""
+        self._final = True
+        if not self._finished:
+            self._parse()
         return self.result
 
+    def get_partial(self):
+        """Copy of the value parsed so far, including a string value still being read."""
+        if not self.stack:
+            return self.result
+        value = self._partial_string
+        for container, slot in zip(reversed(self.stack), reversed(self._slots)):
+            container = container.copy()
+            if value is not None and slot is not _NO_SLOT:
+                if slot is _ITEM:
+                    container.append(value)
+                else:
+                    container[slot] = value
+            value = container
+        return value
+
+    def _parse(self):
+        # runs until the root value is parsed or, while streaming, the input runs out
+        if self._parser is None:
+            self._parser = self._parse_root()
+        try:
+            next(self._parser)
+        except StopIteration:
+            self._parser = None
+            self._finished = True
+
+    def _parse_root(self):
+        self.result = yield from self._parse_value()
+
+    def _wait(self, lookahead=0):
+        # suspend until the character at index + lookahead is available or the input is final
+        while not self._final and self.index + lookahead >= len(self.json_string):
+            yield
+        if self.index < len(self.json_string):
+            self.current_char = self.json_string[self.index]
+        else:
+            self.current_char = None
+
     def _advance(self, count=1):
         self.index += count
         if self.index < len(self.json_string):
@@ -74,90 +141,84 @@ class DirtyJson:
             self.current_char = None
 
     def _skip_whitespace(self):
-        while self.current_char is not None:
+        while True:
+            yield from self._wait()
+            if self.current_char is None:
+                break
             if self.current_char.isspace():
                 self._advance()
-            elif (
-                self.current_char == "/" and self._peek(1) == "/"
-            ):  # Single-line comment
-                self._skip_single_line_comment()
-            elif (
-                self.current_char == "/" and self._peek(1) == "*"
-            ):  # Multi-line comment
-                self._skip_multi_line_comment()
+            elif self.current_char == "/":
+                yield from self._wait(1)
+                if self._peek(1) == "/":  # Single-line comment
+                    yield from self._skip_single_line_comment()
+                elif self._peek(1) == "*":  # Multi-line comment
+                    yield from self._skip_multi_line_comment()
+                else:
+                    break
             else:
                 break
 
     def _skip_single_line_comment(self):
-        while self.current_char is not None and self.current_char != "\n":
+        while True:
+            yield from self._wait()
+            if self.current_char is None or self.current_char == "\n":
+                break
             self._advance()
         if self.current_char == "\n":
             self._advance()
 
     def _skip_multi_line_comment(self):
         self._advance(2)  # Skip /*
-        while self.current_char is not None:
-            if self.current_char == "*" and self._peek(1) == "/":
-                self._advance(2)  # Skip */
+        while True:
+            yield from self._wait()
+            if self.current_char is None:
                 break
+            if self.current_char == "*":
+                yield from self._wait(1)
+                if self._peek(1) == "/":
+                    self._advance(2)  # Skip */
+                    break
             self._advance()
 
-    def _parse(self):
-        if self.completed and not self.stack:
-            return
-        if self.result is None:
-            self.result = self._parse_value()
-        else:
-            self._continue_parsing()
-
-    def _continue_parsing(self):
-        while self.current_char is not None:
-            if self.completed and not self.stack:
-                return
-            if isinstance(self.result, dict):
-                self._parse_object_content()
-            elif isinstance(self.result, list):
-                self._parse_array_content()
-            elif isinstance(self.result, str):
-                self.result = self._parse_string()
-            else:
-                break
-
     def _parse_value(self):
-        self._skip_whitespace()
+        yield from self._skip_whitespace()
         if self.current_char == "{":
             # Only treat doubled braces as a wrapper at the root; nested objects
             # must keep their closing braces paired correctly.
-            if not self.stack and self._peek(1) == "{":  # Handle {{
-                self._advance(2)
-            return self._parse_object()
+            if not self.stack:
+                yield from self._wait(1)
+                if self._peek(1) == "{":  # Handle {{
+                    self._advance(2)
+            return (yield from self._parse_object())
         elif self.current_char == "[":
-            return self._parse_array()
+            return (yield from self._parse_array())
         elif self.current_char in ['"', "'", "`"]:
+            yield from self._wait(2)
             if self._peek(2) == self.current_char * 2:  # type: ignore
-                return self._parse_multiline_string()
-            return self._parse_string()
+                return (yield from self._parse_multiline_string())
+            return (yield from self._parse_string())
         elif self.current_char and (
             self.current_char.isdigit() or self.current_char in ["-", "+"]
         ):
-            return self._parse_number()
-        elif self._match("true"):
+            return (yield from self._parse_number())
+        elif (yield from self._match("true")):
             return True
-        elif self._match("false"):
+        elif (yield from self._match("false")):
             return False
-        elif self._match("null") or self._match("undefined"):
+        elif (yield from self._match("null")) or (yield from self._match("undefined")):
             return None
         elif self.current_char:
-            return self._parse_unquoted_string()
+            return (yield from self._parse_unquoted_string())
         return None
 
-    def _match(self, text: str) -> bool:
+    def _match(self, text: str):
         # first char should match current char
         if not self.current_char or self.current_char.lower() != text[0].lower():
             return False
 
         # peek remaining chars
         remaining = len(text) - 1
+        yield from self._wait(remaining)
         if self._peek(remaining).lower() == text[1:].lower():
             self._advance(len(text))
             return True
@@ -167,16 +228,21 @@ class DirtyJson:
         obj = {}
         self._advance()  # Skip opening brace
         self.stack.append(obj)
+        self._slots.append(_NO_SLOT)
         self._parsing_started = True
-        self._parse_object_content()
+        yield from self._parse_object_content()
         return obj
 
     def _parse_object_content(self):
-        while self.current_char is not None:
-            self._skip_whitespace()
+        while True:
+            yield from self._wait()
+            if self.current_char is None:
+                return
+            yield from self._skip_whitespace()
             if self.current_char == "}":
                 # Root-level wrapper outputs may end in "}}"; nested objects must
-                # still close one brace at a time.
+                # still close one brace at a time. The second brace is not waited
+                # for, a stream may well end right after the root closes.
                 if len(self.stack) == 1 and self._peek(1) == "}":  # Handle }}
                     self._advance(2)
                 else:
@@ -187,21 +253,24 @@ class DirtyJson:
                 self._pop_stack()
                 return  # End of input reached while parsing object
 
-            key = self._parse_key()
+            key = yield from self._parse_key()
             value = None
-            self._skip_whitespace()
+            yield from self._skip_whitespace()
 
             if self.current_char == ":":
                 self._advance()
-                value = self._parse_value()
+                self._slots[-1] = key
+                value = yield from self._parse_value()
             elif self.current_char is None:
                 value = None  # End of input reached after key
             else:
-                value = self._parse_value()
+                self._slots[-1] = key
+                value = yield from self._parse_value()
 
             self.stack[-1][key] = value
+            self._slots[-1] = _NO_SLOT
 
-            self._skip_whitespace()
+            yield from self._skip_whitespace()
             if self.current_char == ",":
                 self._advance()
                 continue
@@ -212,19 +281,22 @@ class DirtyJson:
                 continue
 
     def _parse_key(self):
-        self._skip_whitespace()
+        yield from self._skip_whitespace()
         if self.current_char in ['"', "'"]:
-            return self._parse_string()
+            return (yield from self._parse_string())
         else:
-            return self._parse_unquoted_key()
+            return (yield from self._parse_unquoted_key())
 
     def _parse_unquoted_key(self):
         result = ""
-        while (
-            self.current_char is not None
-            and not self.current_char.isspace()
-            and self.current_char not in [":", ",", "}", "]"]
-        ):
+        while True:
+            yield from self._wait()
+            if (
+                self.current_char is None
+                or self.current_char.isspace()
+                or self.current_char in [":", ",", "}", "]"]
+            ):
+                break
             result += self.current_char
             self._advance()
         return result
@@ -233,24 +305,30 @@ class DirtyJson:
         arr = []
         self._advance()  # Skip opening bracket
         self.stack.append(arr)
+        self._slots.append(_NO_SLOT)
         self._parsing_started = True
-        self._parse_array_content()
+        yield from self._parse_array_content()
         return arr
 
     def _parse_array_content(self):
-        while self.current_char is not None:
-            self._skip_whitespace()
+        while True:
+            yield from self._wait()
+            if self.current_char is None:
+                return
+            yield from self._skip_whitespace()
             if self.current_char == "]":
                 self._advance()
                 self._pop_stack(root_closed=True)
                 return
-            value = self._parse_value()
+            self._slots[-1] = _ITEM
+            value = yield from self._parse_value()
             self.stack[-1].append(value)
-            self._skip_whitespace()
+            self._slots[-1] = _NO_SLOT
+            yield from self._skip_whitespace()
             if self.current_char == ",":
                 self._advance()
                 # handle trailing commas, end of array
-                self._skip_whitespace()
+                yield from self._skip_whitespace()
                 if self.current_char is None or self.current_char == "]":
                     if self.current_char == "]":
                         self._advance()
@@ -263,10 +341,16 @@ class DirtyJson:
     def _parse_string(self):
         result = ""
         quote_char = self.current_char
+        stop = _STRING_STOP[quote_char]  # type: ignore
         self._advance()  # Skip opening quote
-        while self.current_char is not None and self.current_char != quote_char:
+        while True:
+            self._partial_string = result
+            yield from self._wait()
+            if self.current_char is None or self.current_char == quote_char:
+                break
             if self.current_char == "\\":
                 self._advance()
+                yield from self._wait()
                 if self.current_char in ['"', "'", "\\", "/", "b", "f", "n", "r", "t"]:
                     result += {
                         "b": "\b",
@@ -274,14 +358,16 @@ class DirtyJson:
                         "n": "\n",
                         "r": "\r",
                         "t": "\t",
-                    }.get(self.current_char, self.current_char)
+                    }.get(self.current_char, self.current_char)  # type: ignore
                 elif self.current_char == "u":
                     self._advance()  # Skip 'u'
                     unicode_char = ""
                     # Try to collect exactly 4 hex digits
                     for _ in range(4):
+                        yield from self._wait()
                         if self.current_char is None or not self.current_char.isalnum():
                             # If we can't get 4 hex digits, treat it as a literal '\u' followed by whatever we got
+                            self._partial_string = None
                             return result + "\\u" + unicode_char
                         unicode_char += self.current_char
                         self._advance()
@@ -291,31 +377,46 @@ class DirtyJson:
                         # If invalid hex value, treat as literal
                         result += "\\u" + unicode_char
                     continue
+                self._advance()
             else:
-                result += self.current_char
-            self._advance()
+                # copy the run of plain characters up to the next quote or escape at once
+                match = stop.search(self.json_string, self.index)
+                end = match.start() if match else len(self.json_string)
+                result += self.json_string[self.index : end]
+                self._advance(end - self.index)
         if self.current_char == quote_char:
             self._advance()  # Skip closing quote
+        self._partial_string = None
         return result
 
     def _parse_multiline_string(self):
         result = ""
         quote_char = self.current_char
         self._advance(3)  # Skip first quote
-        while self.current_char is not None:
-            if self.current_char == quote_char and self._peek(2) == quote_char * 2:  # type: ignore
-                self._advance(3)  # Skip first quote
+        while True:
+            self._partial_string = result
+            yield from self._wait()
+            if self.current_char is None:
                 break
+            if self.current_char == quote_char:
+                yield from self._wait(2)
+                if self._peek(2) == quote_char * 2:  # type: ignore
+                    self._advance(3)  # Skip first quote
+                    break
             result += self.current_char
             self._advance()
+        self._partial_string = None
         return result.strip()
 
     def _parse_number(self):
         number_str = ""
-        while self.current_char is not None and (
-            self.current_char.isdigit()
-            or self.current_char in ["-", "+", ".", "e", "E"]
-        ):
+        while True:
+            yield from self._wait()
+            if self.current_char is None or not (
+                self.current_char.isdigit()
+                or self.current_char in ["-", "+", ".", "e", "E"]
+            ):
+                break
             number_str += self.current_char
             self._advance()
         try:
@@ -325,27 +426,22 @@ class DirtyJson:
 
     def _parse_unquoted_string(self):
         result = ""
-        while self.current_char is not None and self.current_char not in [
-            ":",
-            ",",
-            "}",
-            "]",
-        ]:
+        while True:
+            yield from self._wait()
+            if self.current_char is None or self.current_char in [
+                ":",
+                ",",
+                "}",
+                "]",
+            ]:
+                break
             result += self.current_char
             self._advance()
         self._advance()
         return result.strip()
 
     def _peek(self, n):
-        peek_index = self.index + 1
-        result = ""
-        for _ in range(n):
-            if peek_index < len(self.json_string):
-                result += self.json_string[peek_index]
-                peek_index += 1
-            else:
-                break
-        return result
+        return self.json_string[self.index + 1 : self.index + 1 + n]
 
     def get_start_pos(self, input_str: str) -> int:
         chars = ["{", "[", '"']
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from helpers import files
+
+CACHE_FILE = "tmp/document_query/documents.sqlite"
+CACHE_MAX_BYTES = 1024 * 1024 * 1024  # evict least recently used entries above this size
+CACHE_EVICT_RATIO = 0.9  # evict down to this fraction of the limit
+
+
+class DocumentCache:
+    """Parsed document segments (e.g. batches of PDF pages) keyed by content hash and text chunks
+    keyed by text hash + splitter params, stored compressed in a single SQLite file with LRU eviction.
+
+    Chunk vectors are not stored here, they are served by the embedding cache keyed by chunk text."""
+
+    def __init__(self, path: str | None = None, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path or ":memory:"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key BLOB PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries(used)")
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_content_key(mimetype: str, content: bytes) -> bytes:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(b"segments\0")
+        h.update(mimetype.encode("utf-8"))
+        h.update(b"\0")
+        h.update(content)
+        return h.digest()
+
+    @staticmethod
+    def make_chunks_key(text: str, chunk_size: int, chunk_overlap: int) -> bytes:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"chunks\0{chunk_size}\0{chunk_overlap}\0".encode("utf-8"))
+        h.update(text.encode("utf-8", "surrogatepass"))
+        return h.digest()
+
+    def get_segments(self, key: bytes) -> list[str] | None:
+        return self._get_list(key)
+
+    def set_segments(self, key: bytes, segments: list[str]):
+        self._set_list(key, segments)
+
+    def get_chunks(self, key: bytes) -> list[str] | None:
+        return self._get_list(key)
+
+    def set_chunks(self, key: bytes, chunks: list[str]):
+        self._set_list(key, chunks)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._size = 0
+
+    def _get_list(self, key: bytes) -> list[str] | None:
+        value = self._get(key)
+        return json.loads(value) if value is not None else None
+
+    def _set_list(self, key: bytes, items: list[str]):
+        self._set(key, json.dumps(items, ensure_ascii=False).encode("utf-8", "surrogatepass"))
+
+    def _get(self, key: bytes) -> bytes | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE entries SET used = ? WHERE key = ?", (time.time(), key)
+            )
+        return zlib.decompress(row[0])
+
+    def _set(self, key: bytes, value: bytes):
+        blob = zlib.compress(value, 1)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, used) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+            self._size += len(blob) - (row[0] if row else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * CACHE_EVICT_RATIO
+        while self._size > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            evicted = []
+            for key, size in rows:
+                if self._size <= target:
+                    break
+                evicted.append((key,))
+                self._size -= size
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+
+_cache: DocumentCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> DocumentCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = files.get_abs_path(CACHE_FILE)
+                files.make_dirs(CACHE_FILE)
+                _cache = DocumentCache(path)
+    return _cache
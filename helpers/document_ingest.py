@@ -0,0 +1,204 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Iterable
+
+from helpers import dotenv
+
+DEFAULT_WORKERS = 2  # worker processes, overridden by A0_DOCUMENT_WORKERS
+PDF_PAGES_PER_TASK = 10  # pages parsed by one worker call, results stream back per task
+TASKS_PER_WORKER = 2  # tasks of one document queued ahead, the rest is submitted as results arrive
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_workers() -> int:
+    try:
+        workers = int(dotenv.get_dotenv_value("A0_DOCUMENT_WORKERS", 0) or 0)
+    except ValueError:
+        workers = 0
+    return workers if workers > 0 else DEFAULT_WORKERS
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawned workers do not inherit locks held by threads of this process
+            _executor = ProcessPoolExecutor(
+                max_workers=get_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _reset_executor(executor: ProcessPoolExecutor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a picklable function in the ingest worker pool."""
+    executor = get_executor()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        raise
+
+
+async def imap(
+    func: Callable[..., Any], args_list: Iterable[tuple], window: int = 0
+) -> AsyncIterator[Any]:
+    """
+    Run func for every args tuple in the worker pool and yield the results in order.
+
+    At most window calls are queued ahead, closing the iterator cancels calls not started yet,
+    calls already running in a worker finish in the background.
+    """
+    executor = get_executor()
+    window = window or get_workers() * TASKS_PER_WORKER
+    loop = asyncio.get_running_loop()
+    args_iter = iter(args_list)
+    pending: deque[asyncio.Future] = deque()
+
+    def submit() -> bool:
+        args = next(args_iter, None)
+        if args is None:
+            return False
+        pending.append(loop.run_in_executor(executor, func, *args))
+        return True
+
+    try:
+        while len(pending) < window and submit():
+            pass
+        while pending:
+            result = await pending.popleft()
+            submit()
+            yield result
+    except BrokenProcessPool:
+        # a worker died (e.g. crashed in a native parser), the next call starts a fresh pool
+        _reset_executor(executor)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def parse_pdf(
+    path: str, progress: Callable[[int, int], None] | None = None
+) -> AsyncIterator[str]:
+    """Yield the text of a PDF in batches of pages, progress receives (parsed pages, total pages)."""
+    total = await run(pdf_page_count, path)
+    batches = [
+        (path, start, min(start + PDF_PAGES_PER_TASK, total))
+        for start in range(0, total, PDF_PAGES_PER_TASK)
+    ]
+    parsed = 0
+    async for text in imap(parse_pdf_pages, batches):
+        parsed = min(parsed + PDF_PAGES_PER_TASK, total)
+        if progress:
+            progress(parsed, total)
+        yield text
+
+
+@contextmanager
+def temp_file(content: bytes, suffix: str):
+    """Write content to a temporary file for parsers that need a path, removed on exit."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as file:
+        file.write(content)
+        path = file.name
+    try:
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+# functions below run in the worker processes
+
+
+def pdf_page_count(path: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(path) as doc:
+        return doc.page_count
+
+
+def parse_pdf_pages(path: str, start: int, end: int) -> str:
+    import pymupdf
+    from langchain_community.document_loaders.pdf import PyMuPDFLoader
+    from langchain_community.document_loaders.parsers.images import TesseractBlobParser
+
+    # the pages are copied to a separate PDF, the loader always reads whole files
+    with pymupdf.open(path) as src, pymupdf.open() as part:
+        part.insert_pdf(src, from_page=start, to_page=end - 1)
+        part_bytes = part.tobytes()
+
+    with temp_file(part_bytes, ".pdf") as part_path:
+        try:
+            loader = PyMuPDFLoader(
+                part_path,
+                mode="single",
+                extract_tables="markdown",
+                extract_images=True,
+                images_inner_format="text",
+                images_parser=TesseractBlobParser(),
+                pages_delimiter="\n",
+            )
+            contents = "\n".join([element.page_content for element in loader.load()])
+        except Exception as e:
+            from helpers.print_style import PrintStyle
+
+            PrintStyle.error(
+                f"document_ingest::parse_pdf_pages: Error loading with PyMuPDF: {e}"
+            )
+            contents = ""
+
+    if not contents:
+        import pdf2image
+        import pytesseract
+
+        # scanned pages without a text layer
+        pages = pdf2image.convert_from_path(path, first_page=start + 1, last_page=end)  # type: ignore
+        for page in pages:
+            contents += pytesseract.image_to_string(page) + "\n\n"
+
+    return contents
+
+
+def parse_html(html: str, source: str) -> str:
+    from langchain_core.documents import Document
+    from langchain_community.document_transformers import MarkdownifyTransformer
+
+    parts = [Document(page_content=html, metadata={"source": source})]
+    return "\n".join(
+        [
+            element.page_content
+            for element in MarkdownifyTransformer().transform_documents(parts)
+        ]
+    )
+
+
+def parse_unstructured(path: str) -> str:
+    os.environ["USER_AGENT"] = "@mixedbread-ai/unstructured"
+    from langchain_unstructured import UnstructuredLoader
+
+    loader = UnstructuredLoader(
+        file_path=path,
+        mode="single",
+        partition_via_api=False,
+        # chunking_strategy="by_page",
+        strategy="hi_res",
+    )
+    return "\n".join([element.page_content for element in loader.load()])
@@ -2,25 +2,23 @@ import mimetypes
 import os
 import asyncio
 import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import aclosing, contextmanager
+from dataclasses import dataclass
 
 from helpers.vector_db import VectorDB
 
-os.environ["USER_AGENT"] = "@mixedbread-ai/unstructured"  # noqa E402
-from langchain_unstructured import UnstructuredLoader  # noqa E402
-
 from urllib.parse import urlparse
-from typing import Callable, Sequence, List, Optional, Tuple
+from typing import AsyncIterator, Callable, Sequence, List, Optional, Tuple
 from datetime import datetime
 
-from langchain_community.document_loaders.pdf import PyMuPDFLoader
-from langchain_community.document_transformers import MarkdownifyTransformer
-from langchain_community.document_loaders.parsers.images import TesseractBlobParser
-
 from langchain_core.documents import Document
 from langchain.schema import SystemMessage, HumanMessage
 
 from helpers.print_style import PrintStyle
-from helpers import files, errors
+from helpers import files, errors, document_cache, document_ingest
 from helpers.network import HttpFetchResult, fetch_public_http_resource
 from agent import Agent
 
@@ -29,30 +27,69 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 DEFAULT_SEARCH_THRESHOLD = 0.5
 MAX_REMOTE_DOCUMENT_BYTES = 50 * 1024 * 1024
+MEMORY_BUDGET_BYTES = 256 * 1024 * 1024  # indexed documents of all stores, least recently used are evicted above
+REMOTE_DOCUMENT_TTL = 15 * 60  # seconds before an indexed remote document is fetched again
+
+
+@dataclass
+class IndexedDocument:
+    content_key: bytes  # hash of the source content, b"" when unknown
+    ids: list[str]
+    size: int  # estimated memory of chunk texts and vectors
+    version: tuple[int, int] | None  # (mtime_ns, size) of a local file
+    checked_at: float
 
 
 class DocumentQueryStore:
     """
     FAISS Store for document query results.
     Manages documents identified by URI for storage, retrieval, and searching.
+
+    One store is kept per agent context, documents of all stores share a memory budget
+    and the least recently used ones are evicted from their store.
     """
 
     # Default chunking parameters
     DEFAULT_CHUNK_SIZE = 1000
     DEFAULT_CHUNK_OVERLAP = 100
 
-    # Cache for initialized stores
+    # Cache for initialized stores, by context id
     _stores: dict[str, "DocumentQueryStore"] = {}
+    # indexed documents of all stores, least recently used first
+    _lru: OrderedDict[tuple[str, str], "DocumentQueryStore"] = OrderedDict()
+    _lru_bytes = 0
+    _lock = threading.RLock()
 
     @staticmethod
     def get(agent: Agent):
-        """Create a DocumentQueryStore instance for the specified agent."""
+        """Get the DocumentQueryStore of the agent's context."""
         if not agent or not agent.config:
             raise ValueError("Agent and agent config must be provided")
 
-        # Initialize store
-        store = DocumentQueryStore(agent)
-        return store
+        with DocumentQueryStore._lock:
+            store = DocumentQueryStore._stores.get(agent.context.id)
+            if store is None:
+                store = DocumentQueryStore(agent)
+                DocumentQueryStore._stores[agent.context.id] = store
+            store.agent = agent
+            return store
+
+    @staticmethod
+    def drop(context_id: str):
+        """Release the store of a context."""
+        with DocumentQueryStore._lock:
+            store = DocumentQueryStore._stores.pop(context_id, None)
+            if store:
+                for uri in list(store.documents):
+                    store._untrack(uri)
+
+    @staticmethod
+    def clear():
+        """Release all stores, e.g. when the embedding model changes."""
+        with DocumentQueryStore._lock:
+            DocumentQueryStore._stores = {}
+            DocumentQueryStore._lru = OrderedDict()
+            DocumentQueryStore._lru_bytes = 0
 
     def __init__(
         self,
@@ -60,7 +97,11 @@ class DocumentQueryStore:
     ):
         """Initialize a DocumentQueryStore instance."""
         self.agent = agent
+        self.context_id = agent.context.id
         self.vector_db: VectorDB | None = None
+        self.documents: dict[str, IndexedDocument] = {}
+        self._init_lock = asyncio.Lock()
+        self._searches = 0  # searches in flight, they may run in worker threads
 
     @staticmethod
     def normalize_uri(uri: str) -> str:
@@ -93,11 +134,90 @@ class DocumentQueryStore:
 
         return normalized
 
-    def init_vector_db(self):
-        return VectorDB(self.agent, cache=True)
+    @staticmethod
+    def get_source_version(document_uri: str) -> tuple[int, int] | None:
+        """(mtime_ns, size) of a local document, None for remote or missing ones."""
+        if not document_uri.startswith("file://"):
+            return None
+        try:
+            stat = os.stat(document_uri.removeprefix("file://"))
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def is_current(self, document_uri: str, version: tuple[int, int] | None) -> bool:
+        """
+        Check if a document is indexed and its source has not changed since.
+
+        Local files are compared by version, remote documents are current for REMOTE_DOCUMENT_TTL.
+        """
+        entry = self.documents.get(self.normalize_uri(document_uri))
+        if not entry:
+            return False
+        if version is not None:
+            return entry.version == version
+        if document_uri.startswith("file://"):
+            return False
+        return time.monotonic() - entry.checked_at < REMOTE_DOCUMENT_TTL
+
+    def has_content(
+        self, document_uri: str, content_key: bytes, version: tuple[int, int] | None
+    ) -> bool:
+        """
+        Check if a document is indexed from the same content, marks it current if so.
+        """
+        entry = self.documents.get(self.normalize_uri(document_uri))
+        if not entry or not content_key or entry.content_key != content_key:
+            return False
+        entry.version = version
+        entry.checked_at = time.monotonic()
+        return True
+
+    def split_text(self, text: str) -> list[str]:
+        """Split text into chunks, chunks of a text seen before are served from the document cache."""
+        cache = document_cache.get_cache()
+        key = cache.make_chunks_key(
+            text, self.DEFAULT_CHUNK_SIZE, self.DEFAULT_CHUNK_OVERLAP
+        )
+        chunks = cache.get_chunks(key)
+        if chunks is None:
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.DEFAULT_CHUNK_SIZE,
+                chunk_overlap=self.DEFAULT_CHUNK_OVERLAP,
+            )
+            chunks = text_splitter.split_text(text)
+            cache.set_chunks(key, chunks)
+        return chunks
+
+    def split_segments(self, segments: Sequence[str]) -> list[str]:
+        """Chunks of all segments, chunks never span two segments."""
+        return [chunk for segment in segments for chunk in self.split_text(segment)]
+
+    async def embed_chunks(self, text: str):
+        """Embed the chunks of a text ahead of indexing, the vectors are served from the embedding cache later."""
+        vector_db = await self.get_vector_db()
+        chunks = await asyncio.to_thread(self.split_text, text)
+        if chunks:
+            await vector_db.embeddings.aembed_documents(chunks)
+
+    async def init_vector_db(self):
+        return await VectorDB.create(self.agent, cache=True)
+
+    async def get_vector_db(self) -> VectorDB:
+        # concurrent callers share one initialization
+        async with self._init_lock:
+            if not self.vector_db:
+                self.vector_db = await self.init_vector_db()
+            return self.vector_db
 
     async def add_document(
-        self, text: str, document_uri: str, metadata: dict | None = None
+        self,
+        text: str,
+        document_uri: str,
+        metadata: dict | None = None,
+        content_key: bytes = b"",
+        version: tuple[int, int] | None = None,
+        segments: list[str] | None = None,
     ) -> tuple[bool, list[str]]:
         """
         Add a document to the store with the given URI.
@@ -106,6 +226,9 @@ class DocumentQueryStore:
             text: The document text content
             document_uri: The URI that uniquely identifies this document
             metadata: Optional metadata for the document
+            content_key: Hash of the source content, lets an unchanged source skip re-indexing
+            version: Version of a local source file, see get_source_version
+            segments: Parsed segments the text consists of, chunked separately when given
 
         Returns:
             True if successful, False otherwise
@@ -122,10 +245,7 @@ class DocumentQueryStore:
         doc_metadata["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.DEFAULT_CHUNK_SIZE, chunk_overlap=self.DEFAULT_CHUNK_OVERLAP
-        )
-        chunks = text_splitter.split_text(text)
+        chunks = await asyncio.to_thread(self.split_segments, segments or [text])
 
         # Create documents
         docs = []
@@ -141,10 +261,20 @@ class DocumentQueryStore:
 
         try:
             # Initialize vector db if not already initialized
-            if not self.vector_db:
-                self.vector_db = self.init_vector_db()
+            vector_db = await self.get_vector_db()
 
-            ids = await self.vector_db.insert_documents(docs)
+            ids = await vector_db.insert_documents(docs)
+            self._track(
+                document_uri,
+                IndexedDocument(
+                    content_key=content_key,
+                    ids=ids,
+                    size=sum(len(chunk) for chunk in chunks)
+                    + len(chunks) * vector_db.index.d * 4,
+                    version=version,
+                    checked_at=time.monotonic(),
+                ),
+            )
             PrintStyle.standard(
                 f"Added document '{document_uri}' with {len(docs)} chunks"
             )
@@ -178,6 +308,8 @@ class DocumentQueryStore:
             PrintStyle.error(f"Document not found: {document_uri}")
             return None
 
+        self.touch(document_uri)
+
         # Combine chunks into a single document
         chunks = sorted(docs, key=lambda x: x.metadata.get("chunk_index", 0))
         full_content = "\n".join(chunk.page_content for chunk in chunks)
@@ -255,6 +387,8 @@ class DocumentQueryStore:
         # Normalize the URI
         document_uri = self.normalize_uri(document_uri)
 
+        self._untrack(document_uri)
+
         chunks = await self.vector_db.search_by_metadata(
             filter=f"document_uri == '{document_uri}'",
         )
@@ -299,9 +433,10 @@ class DocumentQueryStore:
 
         # Perform search
         try:
-            results = await self.vector_db.search_by_similarity_threshold(
-                query=query, limit=limit, threshold=threshold, filter=filter
-            )
+            with self._searching():
+                results = await self.vector_db.search_by_similarity_threshold(
+                    query=query, limit=limit, threshold=threshold, filter=filter
+                )
 
             PrintStyle.standard(f"Search '{query}' returned {len(results)} results")
             return results
@@ -328,6 +463,50 @@ class DocumentQueryStore:
             query, limit, threshold, f"document_uri == '{document_uri}'"
         )
 
+    async def search_documents_many(
+        self,
+        queries: Sequence[str],
+        document_uris: Sequence[str],
+        limit: int = 10,
+        threshold: float = 0.5,
+    ) -> List[List[Document]]:
+        """
+        Search several queries within a set of documents at once.
+
+        Args:
+            queries: The search query strings
+            document_uris: URIs of the documents to search within
+            limit: Maximum number of results per query
+            threshold: Minimum similarity score threshold (0-1)
+
+        Returns:
+            List of matching document chunks for each query
+        """
+
+        # DB not initialized, no documents inside
+        if not self.vector_db or not queries:
+            return [[] for _ in queries]
+
+        # the URI set is resolved by the metadata index, only chunks of these documents are scored
+        uris = sorted({self.normalize_uri(uri) for uri in document_uris})
+        try:
+            with self._searching():
+                results = await self.vector_db.search_many_by_similarity_threshold(
+                    queries=queries,
+                    limit=limit,
+                    threshold=threshold,
+                    filter=f"document_uri in {uris!r}",
+                )
+            for uri in uris:
+                self.touch(uri)
+            PrintStyle.standard(
+                f"Search of {len(queries)} queries returned {sum(len(r) for r in results)} results"
+            )
+            return results
+        except Exception as e:
+            PrintStyle.error(f"Error searching documents: {str(e)}")
+            return [[] for _ in queries]
+
     async def list_documents(self) -> List[str]:
         """
         Get a list of all document URIs in the store.
@@ -349,6 +528,64 @@ class DocumentQueryStore:
 
         return sorted(list(uris))
 
+    def _track(self, document_uri: str, entry: IndexedDocument):
+        with DocumentQueryStore._lock:
+            self._untrack(document_uri)
+            self.documents[document_uri] = entry
+            if DocumentQueryStore._stores.get(self.context_id) is not self:
+                return  # dropped meanwhile, nothing else references this store
+            DocumentQueryStore._lru[(self.context_id, document_uri)] = self
+            DocumentQueryStore._lru_bytes += entry.size
+            self._evict_over_budget()
+
+    def _untrack(self, document_uri: str):
+        with DocumentQueryStore._lock:
+            entry = self.documents.pop(document_uri, None)
+            if entry and DocumentQueryStore._lru.pop(
+                (self.context_id, document_uri), None
+            ):
+                DocumentQueryStore._lru_bytes -= entry.size
+
+    def touch(self, document_uri: str):
+        """Mark a document as recently used."""
+        with DocumentQueryStore._lock:
+            key = (self.context_id, document_uri)
+            if key in DocumentQueryStore._lru:
+                DocumentQueryStore._lru.move_to_end(key)
+
+    @contextmanager
+    def _searching(self):
+        # searches run in worker threads, evictions from this store wait until none is in flight
+        with DocumentQueryStore._lock:
+            self._searches += 1
+        try:
+            yield
+        finally:
+            with DocumentQueryStore._lock:
+                self._searches -= 1
+                if not self._searches:
+                    DocumentQueryStore._evict_over_budget()
+
+    @staticmethod
+    def _evict_over_budget():
+        # the most recently used document always stays, even when it exceeds the budget alone
+        lru = DocumentQueryStore._lru
+        for key in list(lru)[:-1]:
+            if DocumentQueryStore._lru_bytes <= MEMORY_BUDGET_BYTES:
+                break
+            store = lru[key]
+            if store._searches:
+                continue  # evicted when its searches finish
+            _context_id, document_uri = key
+            entry = store.documents.get(document_uri)
+            store._untrack(document_uri)
+            if entry and store.vector_db:
+                # mutations run on the event loop, searches of this store are not in flight
+                existing = [doc.metadata["id"] for doc in store.vector_db.db.get_by_ids(entry.ids)]
+                if existing:
+                    store.vector_db.db.delete(existing)
+            PrintStyle.standard(f"Evicted document '{document_uri}' from memory")
+
 
 class DocumentQueryHelper:
 
@@ -372,39 +609,38 @@ class DocumentQueryHelper:
         await asyncio.gather(
             *[self.document_get_content(uri, True) for uri in document_uris]
         )
+        # queries are optimized concurrently, the model's rate limiter paces the calls
+        self.progress_callback(f"Optimizing {len(questions)} queries")
         await self.agent.handle_intervention()
-        selected_chunks = {}
-        for question in questions:
-            self.progress_callback(f"Optimizing query: {question}")
-            await self.agent.handle_intervention()
-            human_content = f'Search Query: "{question}"'
-            system_content = self.agent.parse_prompt(
-                "fw.document_query.optmimize_query.md"
-            )
-
-            optimized_query = (
-                await self.agent.call_utility_model(
-                    system=system_content, message=human_content
+        system_content = self.agent.parse_prompt(
+            "fw.document_query.optmimize_query.md"
+        )
+        optimized_queries = await asyncio.gather(
+            *[
+                self.agent.call_utility_model(
+                    system=system_content, message=f'Search Query: "{question}"'
                 )
-            ).strip()
+                for question in questions
+            ]
+        )
+        optimized_queries = list(
+            dict.fromkeys(query.strip() for query in optimized_queries)
+        )
 
-            await self.agent.handle_intervention()
+        await self.agent.handle_intervention()
+        for optimized_query in optimized_queries:
             self.progress_callback(f"Searching documents with query: {optimized_query}")
 
-            normalized_uris = [self.store.normalize_uri(uri) for uri in document_uris]
-            doc_filter = " or ".join(
-                [f"document_uri == '{uri}'" for uri in normalized_uris]
-            )
-
-            chunks = await self.store.search_documents(
-                query=optimized_query,
-                limit=100,
-                threshold=DEFAULT_SEARCH_THRESHOLD,
-                filter=doc_filter,
-            )
+        results = await self.store.search_documents_many(
+            queries=optimized_queries,
+            document_uris=document_uris,
+            limit=100,
+            threshold=DEFAULT_SEARCH_THRESHOLD,
+        )
 
+        selected_chunks = {}
+        for chunks in results:
             self.progress_callback(f"Found {len(chunks)} chunks")
-
             for chunk in chunks:
                 selected_chunks[chunk.metadata["id"]] = chunk
 
@@ -451,6 +687,26 @@ class DocumentQueryHelper:
         mimetype = mimetype or "application/octet-stream"
         remote_resource: HttpFetchResult | None = None
 
+        if scheme == "file":
+            try:
+                document_uri = files.fix_dev_path(url.path)
+            except Exception as e:
+                raise ValueError(f"Invalid document path '{url.path}'") from e
+
+        if encoding:
+            raise ValueError(
+                f"Compressed documents are unsupported '{encoding}' ({document_uri})"
+            )
+
+        # Use the store's normalization method
+        document_uri_norm = self.store.normalize_uri(document_uri)
+        version = self.store.get_source_version(document_uri_norm)
+
+        # an indexed document with an unchanged source is neither fetched nor parsed again
+        await self.agent.handle_intervention()
+        if self.store.is_current(document_uri_norm, version):
+            return await self._get_stored_content(document_uri_norm)
+
         if scheme in ["http", "https"]:
             remote_resource = await asyncio.to_thread(
                 fetch_public_http_resource,
@@ -463,74 +719,89 @@ class DocumentQueryHelper:
             ):
                 mimetype = remote_resource.content_type
 
-        if scheme == "file":
-            try:
-                document_uri = files.fix_dev_path(url.path)
-            except Exception as e:
-                raise ValueError(f"Invalid document path '{url.path}'") from e
-
-        if encoding:
-            raise ValueError(
-                f"Compressed documents are unsupported '{encoding}' ({document_uri})"
-            )
-
         if mimetype == "application/octet-stream":
             raise ValueError(
                 f"Unsupported document mimetype '{mimetype}' ({document_uri})"
             )
 
-        # Use the store's normalization method
-        document_uri_norm = self.store.normalize_uri(document_uri)
+        if remote_resource is not None:
+            content = remote_resource.content
+        elif scheme == "file":
+            content = await asyncio.to_thread(files.read_file_bin, document_uri)
+        else:
+            raise ValueError(f"Unsupported scheme: {scheme}")
+        content_key = document_cache.DocumentCache.make_content_key(mimetype, content)
 
         await self.agent.handle_intervention()
-        exists = await self.store.document_exists(document_uri_norm)
-        document_content = ""
-        if not exists:
+        if self.store.has_content(document_uri_norm, content_key, version):
+            return await self._get_stored_content(document_uri_norm)
+
+        # parsed segments are cached by content, a document seen before is not parsed again
+        cache = document_cache.get_cache()
+        segments = await asyncio.to_thread(cache.get_segments, content_key)
+        embedding: list[asyncio.Task] = []
+        if segments is None:
+            segments = []
+            self.progress_callback(f"Parsing document")
+            try:
+                async with aclosing(
+                    self.parse_document(document_uri, mimetype, content, remote_resource)
+                ) as parsed:
+                    async for segment in parsed:
+                        segments.append(segment)
+                        # chunks are embedded while the next pages are parsed
+                        if add_to_db:
+                            embedding.append(
+                                asyncio.create_task(self.store.embed_chunks(segment))
+                            )
+                        await self.agent.handle_intervention()
+            except BaseException:
+                for task in embedding:
+                    task.cancel()
+                raise
+            # failed extractions are not cached, they are retried next time
+            if any(segments):
+                await asyncio.to_thread(cache.set_segments, content_key, segments)
+        document_content = "\n".join(segments)
+
+        if add_to_db:
+            self.progress_callback(f"Indexing document")
+            await asyncio.gather(*embedding)
             await self.agent.handle_intervention()
-            if mimetype.startswith("image/"):
-                document_content = self.handle_image_document(
-                    document_uri, scheme, remote_resource=remote_resource
-                )
-            elif mimetype == "text/html":
-                document_content = self.handle_html_document(
-                    document_uri, scheme, remote_resource=remote_resource
-                )
-            elif mimetype.startswith("text/") or mimetype == "application/json":
-                document_content = self.handle_text_document(
-                    document_uri, scheme, remote_resource=remote_resource
+            async with self.store_lock:
+                success, ids = await self.store.add_document(
+                    document_content,
+                    document_uri_norm,
+                    content_key=content_key,
+                    version=version,
+                    segments=segments,
                 )
-            elif mimetype == "application/pdf":
-                document_content = self.handle_pdf_document(
-                    document_uri, scheme, remote_resource=remote_resource
-                )
-            else:
-                document_content = self.handle_unstructured_document(
-                    document_uri, scheme, remote_resource=remote_resource
-                )
-            if add_to_db:
-                self.progress_callback(f"Indexing document")
-                await self.agent.handle_intervention()
-                async with self.store_lock:
-                    success, ids = await self.store.add_document(
-                        document_content, document_uri_norm
-                    )
-                if not success:
-                    self.progress_callback(f"Failed to index document")
-                    raise ValueError(
-                        f"DocumentQueryHelper::document_get_content: Failed to index document: {document_uri_norm}"
-                    )
-                self.progress_callback(f"Indexed {len(ids)} chunks")
-        else:
-            await self.agent.handle_intervention()
-            doc = await self.store.get_document(document_uri_norm)
-            if doc:
-                document_content = doc.page_content
-            else:
+            if not success:
+                self.progress_callback(f"Failed to index document")
                 raise ValueError(
-                    f"DocumentQueryHelper::document_get_content: Document not found: {document_uri_norm}"
+                    f"DocumentQueryHelper::document_get_content: Failed to index document: {document_uri_norm}"
                 )
+            self.progress_callback(f"Indexed {len(ids)} chunks")
         return document_content
 
+    async def _get_stored_content(self, document_uri_norm: str) -> str:
+        await self.agent.handle_intervention()
+        # the parsed text is preferred over chunks joined back together
+        entry = self.store.documents.get(document_uri_norm)
+        if entry and entry.content_key:
+            segments = await asyncio.to_thread(
+                document_cache.get_cache().get_segments, entry.content_key
+            )
+            if segments is not None:
+                self.store.touch(document_uri_norm)
+                return "\n".join(segments)
+        doc = await self.store.get_document(document_uri_norm)
+        if doc:
+            return doc.page_content
+        raise ValueError(
+            f"DocumentQueryHelper::document_get_content: Document not found: {document_uri_norm}"
+        )
+
     @staticmethod
     def _decode_remote_text(remote_resource: HttpFetchResult) -> str:
         encoding = remote_resource.encoding or "utf-8"
@@ -557,192 +828,93 @@ class DocumentQueryHelper:
 
         return ".bin"
 
-    def handle_image_document(
+    async def parse_document(
         self,
         document: str,
-        scheme: str,
+        mimetype: str,
+        content: bytes,
         remote_resource: HttpFetchResult | None = None,
-    ) -> str:
-        return self.handle_unstructured_document(
-            document, scheme, remote_resource=remote_resource
-        )
+    ) -> AsyncIterator[str]:
+        """Yield the text of a document in segments, parsers run in the document ingest worker pool."""
+        if mimetype.startswith("image/"):
+            handler = self.handle_image_document
+        elif mimetype == "text/html":
+            handler = self.handle_html_document
+        elif mimetype.startswith("text/") or mimetype == "application/json":
+            handler = self.handle_text_document
+        elif mimetype == "application/pdf":
+            handler = self.handle_pdf_document
+        else:
+            handler = self.handle_unstructured_document
 
-    def handle_html_document(
+        async with aclosing(handler(document, content, remote_resource)) as segments:
+            async for segment in segments:
+                yield segment
+
+    async def handle_image_document(
         self,
         document: str,
-        scheme: str,
+        content: bytes,
         remote_resource: HttpFetchResult | None = None,
-    ) -> str:
-        if scheme in ["http", "https"]:
-            if remote_resource is None:
-                raise ValueError("Missing prefetched remote HTML content")
+    ) -> AsyncIterator[str]:
+        async with aclosing(
+            self.handle_unstructured_document(document, content, remote_resource)
+        ) as segments:
+            async for segment in segments:
+                yield segment
+
+    async def handle_html_document(
+        self,
+        document: str,
+        content: bytes,
+        remote_resource: HttpFetchResult | None = None,
+    ) -> AsyncIterator[str]:
+        if remote_resource is not None:
             html_content = self._decode_remote_text(remote_resource)
-            parts = [Document(page_content=html_content, metadata={"source": document})]
-        elif scheme == "file":
-            # Use RFC file operations instead of TextLoader
-            file_content_bytes = files.read_file_bin(document)
-            file_content = file_content_bytes.decode("utf-8")
-            # Create Document manually since we're not using TextLoader
-            parts = [Document(page_content=file_content, metadata={"source": document})]
         else:
-            raise ValueError(f"Unsupported scheme: {scheme}")
+            html_content = content.decode("utf-8")
+        yield await document_ingest.run(document_ingest.parse_html, html_content, document)
 
-        return "\n".join(
-            [
-                element.page_content
-                for element in MarkdownifyTransformer().transform_documents(parts)
-            ]
-        )
-
-    def handle_text_document(
+    async def handle_text_document(
         self,
         document: str,
-        scheme: str,
+        content: bytes,
         remote_resource: HttpFetchResult | None = None,
-    ) -> str:
-        if scheme in ["http", "https"]:
-            if remote_resource is None:
-                raise ValueError("Missing prefetched remote text content")
-            file_content = self._decode_remote_text(remote_resource)
-            elements = [
-                Document(page_content=file_content, metadata={"source": document})
-            ]
-        elif scheme == "file":
-            # Use RFC file operations instead of TextLoader
-            file_content_bytes = files.read_file_bin(document)
-            file_content = file_content_bytes.decode("utf-8")
-            # Create Document manually since we're not using TextLoader
-            elements = [
-                Document(page_content=file_content, metadata={"source": document})
-            ]
+    ) -> AsyncIterator[str]:
+        if remote_resource is not None:
+            yield self._decode_remote_text(remote_resource)
         else:
-            raise ValueError(f"Unsupported scheme: {scheme}")
+            yield content.decode("utf-8")
 
-        return "\n".join([element.page_content for element in elements])
-
-    def handle_pdf_document(
+    async def handle_pdf_document(
         self,
         document: str,
-        scheme: str,
+        content: bytes,
         remote_resource: HttpFetchResult | None = None,
-    ) -> str:
-        temp_file_path = ""
-        if scheme == "file":
-            # Use RFC file operations to read the PDF file as binary
-            file_content_bytes = files.read_file_bin(document)
-            # Create a temporary file for PyMuPDFLoader since it needs a file path
-            import tempfile
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                temp_file.write(file_content_bytes)
-                temp_file_path = temp_file.name
-        elif scheme in ["http", "https"]:
-            import tempfile
-
-            if remote_resource is None:
-                raise ValueError("Missing prefetched remote PDF content")
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                temp_file.write(remote_resource.content)
-                temp_file_path = temp_file.name
-        else:
-            raise ValueError(f"Unsupported scheme: {scheme}")
-
-        if not os.path.exists(temp_file_path):
-            raise ValueError(
-                f"DocumentQueryHelper::handle_pdf_document: Temporary file not found: {temp_file_path}"
-            )
-
-        try:
-            try:
-                loader = PyMuPDFLoader(
-                    temp_file_path,
-                    mode="single",
-                    extract_tables="markdown",
-                    extract_images=True,
-                    images_inner_format="text",
-                    images_parser=TesseractBlobParser(),
-                    pages_delimiter="\n",
-                )
-                elements: list[Document] = loader.load()
-                contents = "\n".join([element.page_content for element in elements])
-            except Exception as e:
-                PrintStyle.error(
-                    f"DocumentQueryHelper::handle_pdf_document: Error loading with PyMuPDF: {e}"
-                )
-                contents = ""
-
-            if not contents:
-                import pdf2image
-                import pytesseract
-
-                PrintStyle.debug(
-                    f"DocumentQueryHelper::handle_pdf_document: FALLBACK Converting PDF to images: {temp_file_path}"
-                )
-
-                # Convert PDF to images
-                pages = pdf2image.convert_from_path(temp_file_path)  # type: ignore
-                for page in pages:
-                    contents += pytesseract.image_to_string(page) + "\n\n"
-
-            return contents
-        finally:
-            os.unlink(temp_file_path)
-
-    def handle_unstructured_document(
+    ) -> AsyncIterator[str]:
+        def progress(parsed: int, total: int):
+            self.progress_callback(f"Parsed {parsed}/{total} pages")
+
+        # PyMuPDFLoader needs a file path, pages are parsed in batches by the workers
+        with document_ingest.temp_file(content, ".pdf") as temp_file_path:
+            async with aclosing(
+                document_ingest.parse_pdf(temp_file_path, progress)
+            ) as pages:
+                async for text in pages:
+                    yield text
+
+    async def handle_unstructured_document(
         self,
         document: str,
-        scheme: str,
+        content: bytes,
         remote_resource: HttpFetchResult | None = None,
-    ) -> str:
-        elements: list[Document] = []
-        if scheme in ["http", "https"]:
-            if remote_resource is None:
-                raise ValueError("Missing prefetched remote document content")
-            import tempfile
-
-            temp_file_path = ""
+    ) -> AsyncIterator[str]:
+        # Get file extension to preserve it for proper processing
+        if remote_resource is not None:
             suffix = self._get_temp_file_suffix(document, remote_resource)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
-                temp_file.write(remote_resource.content)
-                temp_file_path = temp_file.name
-
-            try:
-                loader = UnstructuredLoader(
-                    file_path=temp_file_path,
-                    mode="single",
-                    partition_via_api=False,
-                    # chunking_strategy="by_page",
-                    strategy="hi_res",
-                )
-                elements = loader.load()
-            finally:
-                os.unlink(temp_file_path)
-        elif scheme == "file":
-            # Use RFC file operations to read the file as binary
-            file_content_bytes = files.read_file_bin(document)
-            # Create a temporary file for UnstructuredLoader since it needs a file path
-            import tempfile
-            import os
-
-            # Get file extension to preserve it for proper processing
-            _, ext = os.path.splitext(document)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp_file:
-                temp_file.write(file_content_bytes)
-                temp_file_path = temp_file.name
-
-            try:
-                loader = UnstructuredLoader(
-                    file_path=temp_file_path,
-                    mode="single",
-                    partition_via_api=False,
-                    # chunking_strategy="by_page",
-                    strategy="hi_res",
-                )
-                elements = loader.load()
-            finally:
-                # Clean up temporary file
-                os.unlink(temp_file_path)
         else:
-            raise ValueError(f"Unsupported scheme: {scheme}")
-
-        return "\n".join([element.page_content for element in elements])
+            _, suffix = os.path.splitext(document)
+        with document_ingest.temp_file(content, suffix) as temp_file_path:
+            yield await document_ingest.run(
+                document_ingest.parse_unstructured, temp_file_path
+            )
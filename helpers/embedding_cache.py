@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, List
+
+from langchain_core.embeddings import Embeddings
+
+from helpers import files
+
+CACHE_FILE = "tmp/memory/embeddings.sqlite"
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # evict least recently used vectors above this size
+CACHE_EVICT_RATIO = 0.9  # evict down to this fraction of the limit
+
+# model kwargs that do not change the returned vectors, left out of the model id
+NEUTRAL_KWARGS = {"api_key", "timeout", "stream_timeout", "num_retries", "max_retries", "extra_headers"}
+
+
+class EmbeddingCache:
+    """Embedding vectors keyed by model id + content hash, stored in a single SQLite file with LRU eviction."""
+
+    def __init__(self, path: str | None = None, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path or ":memory:"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings(used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dimensions (model TEXT PRIMARY KEY, dimensions INTEGER NOT NULL)"
+        )
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(model_id: str, text: str) -> bytes:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(model_id.encode("utf-8"))
+        h.update(b"\0")
+        h.update(text.encode("utf-8", "surrogatepass"))
+        return h.digest()
+
+    def get_many(self, keys: List[bytes]) -> dict[bytes, List[float]]:
+        if not keys:
+            return {}
+        found: dict[bytes, List[float]] = {}
+        now = time.time()
+        with self._lock:
+            # sqlite limits the number of bound parameters, query in slices
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET used = ? WHERE key IN ({marks})",
+                        [now, *part],
+                    )
+        return found
+
+    def set_many(self, items: dict[bytes, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for key, blob, used in rows:
+                    cur = self._conn.execute(
+                        "INSERT OR IGNORE INTO embeddings (key, vector, size, used) VALUES (?, ?, ?, ?)",
+                        (key, blob, len(blob), used),
+                    )
+                    if cur.rowcount:
+                        self._size += len(blob)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * CACHE_EVICT_RATIO
+        while self._size > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            evicted = []
+            for key, size in rows:
+                if self._size <= target:
+                    break
+                evicted.append((key,))
+                self._size -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+
+    def get_dimensions(self, model_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dimensions FROM dimensions WHERE model = ?", (model_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def set_dimensions(self, model_id: str, dimensions: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dimensions (model, dimensions) VALUES (?, ?)",
+                (model_id, dimensions),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._size = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves vectors from an EmbeddingCache and only embeds missing texts."""
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_id: str,
+        cache: EmbeddingCache,
+        dimensions_cache: EmbeddingCache | None = None,
+    ):
+        self.underlying = underlying
+        self.model_id = model_id
+        self.cache = cache
+        self.dimensions_cache = dimensions_cache or cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found = self._lookup(texts)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            vectors = self.underlying.embed_documents([texts[i] for i in missing])
+            self._store(keys, missing, vectors, found)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found = await asyncio.to_thread(self._lookup, texts)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            vectors = await self.underlying.aembed_documents([texts[i] for i in missing])
+            await asyncio.to_thread(self._store, keys, missing, vectors, found)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def get_dimensions(self) -> int:
+        dimensions = self.dimensions_cache.get_dimensions(self.model_id)
+        if not dimensions:
+            dimensions = len(self.embed_query("example"))
+            self.dimensions_cache.set_dimensions(self.model_id, dimensions)
+        return dimensions
+
+    async def aget_dimensions(self) -> int:
+        dimensions = self.dimensions_cache.get_dimensions(self.model_id)
+        if not dimensions:
+            dimensions = len(await self.aembed_query("example"))
+            self.dimensions_cache.set_dimensions(self.model_id, dimensions)
+        return dimensions
+
+    def _lookup(self, texts: List[str]) -> tuple[List[bytes], dict[bytes, List[float]]]:
+        keys = [EmbeddingCache.make_key(self.model_id, text) for text in texts]
+        return keys, self.cache.get_many(list(set(keys)))
+
+    @staticmethod
+    def _missing(texts: List[str], keys: List[bytes], found: dict[bytes, List[float]]) -> List[int]:
+        # first index of every text not in cache, duplicates are embedded once
+        missing: dict[bytes, int] = {}
+        for i, key in enumerate(keys):
+            if key not in found and key not in missing:
+                missing[key] = i
+        return list(missing.values())
+
+    def _store(
+        self,
+        keys: List[bytes],
+        missing: List[int],
+        vectors: List[List[float]],
+        found: dict[bytes, List[float]],
+    ):
+        new = {keys[i]: vector for i, vector in zip(missing, vectors)}
+        found.update(new)
+        self.cache.set_many(new)
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = files.get_abs_path(CACHE_FILE)
+                files.make_dirs(CACHE_FILE)
+                _cache = EmbeddingCache(path)
+    return _cache
+
+
+def get_model_id(model: Embeddings) -> str:
+    """Cache namespace of an embedding model: provider, name and a hash of the kwargs that change the vectors."""
+    config: Any = getattr(model, "a0_model_conf", None)
+    if config is None:
+        return getattr(model, "model_name", "default")
+    model_id = f"{config.provider}/{config.name}"
+    relevant = {k: v for k, v in config.build_kwargs().items() if k not in NEUTRAL_KWARGS}
+    if relevant:
+        encoded = json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")
+        model_id += "#" + hashlib.blake2b(encoded, digest_size=8).hexdigest()
+    return model_id
+
+
+def get_cached_embeddings(
+    model: Embeddings, model_id: str, persistent: bool = True
+) -> CachedEmbeddings:
+    # dimensions are always remembered on disk, vectors only when persistent
+    shared = get_cache()
+    cache = shared if persistent else EmbeddingCache()
+    return CachedEmbeddings(model, model_id, cache, dimensions_cache=shared)
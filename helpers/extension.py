@@ -1,4 +1,5 @@
 from abc import abstractmethod
+from dataclasses import asdict, dataclass
 from typing import Any, Awaitable, Type, cast
 from helpers import modules, files
 from helpers import cache
@@ -6,6 +7,7 @@ from typing import TYPE_CHECKING
 from functools import wraps
 import inspect
 import os
+import time
 
 from helpers.print_style import PrintStyle
 
@@ -17,9 +19,9 @@ DEFAULT_EXTENSIONS_FOLDER = "python/extensions"
 USER_EXTENSIONS_FOLDER = "usr/extensions"
 
 _EXTENSIONS_CACHE_AREA = "extension_folder_classes(extensions)"
-_CLASSES_CACHE_AREA = "extension_classes(extensions)"
+_DISPATCH_CACHE_AREA = "extension_dispatch(extensions)"
 # cache.toggle_area(_EXTENSIONS_CACHE_AREA, False)
-# cache.toggle_area(_CLASSES_CACHE_AREA, False)
+# cache.toggle_area(_DISPATCH_CACHE_AREA, False)
 
 
 class _Unset:
@@ -27,25 +29,97 @@ class _Unset:
 
 
 _UNSET = _Unset()
-_EXTENSIONS_LOG_COUNTS: dict[str, int] = {}
 
+# how stream chunk extensions receive coalesced stream deltas, see call_stream_extensions_async
+STREAM_DELIVERY_BATCH = "batch"
+STREAM_DELIVERY_CHUNK = "chunk"
 
-# debug - extensions call counter
-def _log_extension_call(name: str):
-    try:
-        every = int(os.getenv("EXTENSIONS_LOG", "0"))
-    except ValueError:
-        return
 
-    if every <= 0:
-        return
+@dataclass(slots=True)
+class ExtensionPointStats:
+    calls: int = 0  # dispatches of the extension point, including empty ones
+    executions: int = 0  # extension executions
+    seconds: float = 0.0  # time spent in extensions
+
+
+_stats: dict[str, ExtensionPointStats] = {}
+_stats_enabled = False
+
+
+def set_stats_enabled(enabled: bool):
+    """Toggle collection of extension point call counts and timings, off by default."""
+    global _stats_enabled
+    _stats_enabled = enabled
+
+
+def is_stats_enabled() -> bool:
+    return _stats_enabled
+
+
+def get_stats() -> dict[str, dict[str, Any]]:
+    """Collected statistics per extension point, most time consuming first."""
+    ordered = sorted(_stats.items(), key=lambda item: (item[1].seconds, item[1].calls), reverse=True)
+    return {point: asdict(stats) for point, stats in ordered}
+
+
+def reset_stats():
+    _stats.clear()
+
+
+def _record_stats(extension_point: str, executions: int, seconds: float):
+    stats = _stats.get(extension_point)
+    if stats is None:
+        stats = _stats[extension_point] = ExtensionPointStats()
+    stats.calls += 1
+    stats.executions += executions
+    stats.seconds += seconds
+
 
-    _EXTENSIONS_LOG_COUNTS[name] = _EXTENSIONS_LOG_COUNTS.get(name, 0) + 1
-    _EXTENSIONS_LOG_COUNTS["_total"] = _EXTENSIONS_LOG_COUNTS.get("_total", 0) + 1
+class _DispatchTable:
+    """Extension classes per extension point for one (profile, project), resolved on first use.
 
-    if _EXTENSIONS_LOG_COUNTS["_total"] % every == 0:
-        for key, count in _EXTENSIONS_LOG_COUNTS.items():
-            print(f"{str(count):<6} {key}")
+    Also keeps extension instances called without an agent, an instance is reused as long as
+    its class keeps no state of its own on it. Instances bound to an agent are created per call,
+    extensions may use self.agent from background tasks and a kept one would pin its agent."""
+
+    def __init__(self):
+        self.points: dict[str, tuple[Type["Extension"], ...]] = {}
+        self.unbound_instances: dict[type, "Extension"] = {}
+        self.stateful: set[type] = set()
+
+    def get(self, extension_point: str, agent: "Agent|None") -> tuple[Type["Extension"], ...]:
+        classes = self.points.get(extension_point)
+        if classes is None:
+            classes = self.points[extension_point] = _resolve_extension_classes(extension_point, agent)
+        return classes
+
+    def instance(self, cls: Type["Extension"], agent: "Agent|None") -> "Extension":
+        extension = self.unbound_instances.pop(cls, None) if agent is None else None
+        return extension if extension is not None else cls(agent=agent)
+
+    def release(self, extension: "Extension", agent: "Agent|None"):
+        cls = type(extension)
+        if agent is not None or cls in self.stateful:
+            return
+        if extension.__dict__.keys() <= _STATELESS_ATTRIBUTES and not extension.kwargs:
+            self.unbound_instances[cls] = extension
+        else:
+            self.stateful.add(cls)
+
+
+_STATELESS_ATTRIBUTES = {"agent", "kwargs"}
+
+
+def _get_dispatch_table(agent: "Agent|None") -> _DispatchTable:
+    key = cache.determine_cache_key(agent)
+    table = cache.get(_DISPATCH_CACHE_AREA, key)
+    if table is None:
+        table = _DispatchTable()
+        cache.add(_DISPATCH_CACHE_AREA, key, table)
+    return table
+
+
+_agent_class: type | None = None
 
 
 # decorator to enable implicit extension points in existing functions
@@ -96,10 +170,18 @@ def extensible(func):
 
     Finally, if ``data["exception"]`` contains an exception it is raised;
     otherwise ``data["result"]`` is returned.
+
+    Both paths are derived once when the function is decorated. When neither
+    extension point has any extensions, the function is called directly.
     """
 
     def _get_agent(args, kwargs):
-        from agent import Agent
+        global _agent_class
+        if _agent_class is None:
+            from agent import Agent
+
+            _agent_class = Agent
+        Agent = _agent_class
 
         candidate = kwargs.get("agent")
         if isinstance(candidate, Agent) and bool(getattr(candidate, "__dict__", None)):
@@ -111,7 +193,7 @@ def extensible(func):
 
         return None
 
-    def _prepare_inputs(args, kwargs):
+    def _get_points():
         module_name = getattr(func, "__module__", "")
         qual_name = getattr(func, "__qualname__", "")
         if not module_name or not qual_name:
@@ -123,10 +205,20 @@ def extensible(func):
             return None
 
         base_path = os.path.join("_functions", *module_parts, *qual_parts)
-        start_point = os.path.join(base_path, "start")
-        end_point = os.path.join(base_path, "end")
+        return os.path.join(base_path, "start"), os.path.join(base_path, "end")
+
+    points = _get_points()
+
+    def _prepare_inputs(args, kwargs):
+        if points is None:
+            return None
 
         agent = _get_agent(args, kwargs)
+        table = _get_dispatch_table(agent)
+        start_classes = table.get(points[0], agent)
+        end_classes = table.get(points[1], agent)
+        if not start_classes and not end_classes:
+            return None
 
         data = {
             "args": args,
@@ -135,7 +227,7 @@ def extensible(func):
             "exception": None,
         }
 
-        return start_point, end_point, agent, data
+        return agent, table, start_classes, end_classes, data
 
     def _process_result(data):
         exc = data.get("exception")
@@ -164,10 +256,10 @@ def extensible(func):
         if prepared is None:
             return await func(*args, **kwargs)
 
-        start_point, end_point, agent, data = prepared
+        agent, table, start_classes, end_classes, data = prepared
 
         # call pre-extensions
-        await call_extensions_async(start_point, agent=agent, data=data)
+        await _execute_async(points[0], start_classes, table, agent, data=data)
 
         # call the original if pre-extensions don't return a result
         if (result := _process_result(data)) is _UNSET:
@@ -178,7 +270,7 @@ def extensible(func):
                 data["exception"] = e
 
         # call post-extensions
-        await call_extensions_async(end_point, agent=agent, data=data)
+        await _execute_async(points[1], end_classes, table, agent, data=data)
 
         result = _process_result(data)
         return None if result is _UNSET else result
@@ -188,17 +280,17 @@ def extensible(func):
         if prepared is None:
             return func(*args, **kwargs)
 
-        start_point, end_point, agent, data = prepared
+        agent, table, start_classes, end_classes, data = prepared
 
         # call pre-extensions
-        call_extensions_sync(start_point, agent=agent, data=data)
+        _execute_sync(points[0], start_classes, table, agent, data=data)
 
         # call the original if pre-extensions don't return a result
         if (result := _process_result(data)) is _UNSET:
             _call_original(data)
 
         # call post-extensions
-        call_extensions_sync(end_point, agent=agent, data=data)
+        _execute_sync(points[1], end_classes, table, agent, data=data)
 
         result = _process_result(data)
         return None if result is _UNSET else result
@@ -211,6 +303,10 @@ def extensible(func):
 
 class Extension:
 
+    # stream chunk extension points deliver one call per coalesced batch,
+    # extensions that need every single delta set this to STREAM_DELIVERY_CHUNK
+    stream_delivery: str = STREAM_DELIVERY_BATCH
+
     def __init__(self, agent: "Agent|None", **kwargs):
         self.agent: "Agent|None" = agent
         self.kwargs = kwargs
@@ -223,31 +319,130 @@ class Extension:
 async def call_extensions_async(
     extension_point: str, agent: "Agent|None" = None, **kwargs
 ):
-    _log_extension_call(extension_point)
-
     # fetch classes for this extension point and agent
+    table = _get_dispatch_table(agent)
     classes = _get_extension_classes(extension_point, agent=agent, **kwargs)
 
     # execute unique extensions
+    await _execute_async(extension_point, classes, table, agent, **kwargs)
+
+
+async def _execute_async(
+    extension_point: str,
+    classes: tuple[Type[Extension], ...],
+    table: _DispatchTable,
+    agent: "Agent|None",
+    **kwargs,
+):
+    if not classes:
+        if _stats_enabled:
+            _record_stats(extension_point, 0, 0.0)
+        return
+
+    started = time.perf_counter() if _stats_enabled else 0.0
     for cls in classes:
-        result = cls(agent=agent).execute(**kwargs)
+        instance = table.instance(cls, agent)
+        result = instance.execute(**kwargs)
         if isinstance(result, Awaitable):
             await result
+        table.release(instance, agent)
+    if _stats_enabled:
+        _record_stats(extension_point, len(classes), time.perf_counter() - started)
 
 
-def call_extensions_sync(extension_point: str, agent: "Agent|None" = None, **kwargs):
-    _log_extension_call(extension_point)
+async def call_stream_extensions_async(
+    extension_point: str,
+    agent: "Agent|None" = None,
+    stream_data: dict[str, Any] | None = None,
+    parts: list[str] | None = None,
+    **kwargs,
+):
+    """Call stream chunk extensions with a batch of coalesced deltas.
+
+    ``stream_data["chunk"]`` holds the batch and ``parts`` the deltas it was joined from.
+    Batch extensions are called once, chunk extensions once per delta with ``stream_data``
+    narrowed to that delta, their outputs are joined back into ``stream_data``."""
+    stream_data = stream_data if stream_data is not None else {"chunk": "", "full": ""}
+    table = _get_dispatch_table(agent)
+    classes = _get_extension_classes(extension_point, agent=agent, stream_data=stream_data, **kwargs)
+    if not classes:
+        if _stats_enabled:
+            _record_stats(extension_point, 0, 0.0)
+        return
 
+    started = time.perf_counter() if _stats_enabled else 0.0
+    executions = 0
+    for cls in classes:
+        instance = table.instance(cls, agent)
+        # once an earlier extension has rewritten the batch, its original deltas no longer apply
+        if (
+            cls.stream_delivery != STREAM_DELIVERY_CHUNK
+            or not parts
+            or len(parts) < 2
+            or "".join(parts) != stream_data.get("chunk")
+        ):
+            result = instance.execute(stream_data=stream_data, **kwargs)
+            if isinstance(result, Awaitable):
+                await result
+            table.release(instance, agent)
+            executions += 1
+            continue
+
+        # every delta sees the full text as it was when the delta arrived
+        full = stream_data.get("full", "")
+        chunk = stream_data["chunk"]
+        before = full[: len(full) - len(chunk)] if full.endswith(chunk) else None
+        outputs: list[str] = []
+        for part in parts:
+            if before is not None:
+                before += part
+            part_data = {"chunk": part, "full": before if before is not None else full}
+            result = instance.execute(stream_data=part_data, **kwargs)
+            if isinstance(result, Awaitable):
+                await result
+            outputs.append(part_data.get("chunk") or "")
+            executions += 1
+        table.release(instance, agent)
+        # the last delta saw the complete text, keep its version of it
+        stream_data["full"] = part_data.get("full", full)
+        stream_data["chunk"] = "".join(outputs)
+        parts = outputs
+    if _stats_enabled:
+        _record_stats(extension_point, executions, time.perf_counter() - started)
+
+
+def call_extensions_sync(extension_point: str, agent: "Agent|None" = None, **kwargs):
     # fetch classes for this extension point and agent
+    table = _get_dispatch_table(agent)
     classes = _get_extension_classes(extension_point, agent=agent, **kwargs)
 
     # execute unique extensions
+    _execute_sync(extension_point, classes, table, agent, **kwargs)
+
+
+def _execute_sync(
+    extension_point: str,
+    classes: tuple[Type[Extension], ...],
+    table: _DispatchTable,
+    agent: "Agent|None",
+    **kwargs,
+):
+    if not classes:
+        if _stats_enabled:
+            _record_stats(extension_point, 0, 0.0)
+        return
+
+    started = time.perf_counter() if _stats_enabled else 0.0
     for cls in classes:
-        result = cls(agent=agent).execute(**kwargs)
+        instance = table.instance(cls, agent)
+        result = instance.execute(**kwargs)
         if isinstance(result, Awaitable):
             raise ValueError(
                 f"Extension {cls.__name__} returned awaitable in sync mode"
             )
+        table.release(instance, agent)
+    if _stats_enabled:
+        _record_stats(extension_point, len(classes), time.perf_counter() - started)
 
 
 def get_webui_extensions(
@@ -281,13 +476,14 @@ def get_webui_extensions(
 
 def _get_extension_classes(
     extension_point: str, agent: "Agent|None" = None, **kwargs
-) -> list[Type[Extension]]:
-    from helpers import subagents
+) -> tuple[Type[Extension], ...]:
+    return _get_dispatch_table(agent).get(extension_point, agent)
 
-    cache_key = cache.determine_cache_key(agent, extension_point)
-    cached = cache.get(_CLASSES_CACHE_AREA, cache_key)
-    if cached is not None:
-        return cached
+
+def _resolve_extension_classes(
+    extension_point: str, agent: "Agent|None" = None
+) -> tuple[Type[Extension], ...]:
+    from helpers import subagents
 
     # search for extension folders in all agent's paths
     paths = subagents.get_paths(agent, "extensions/python", extension_point)
@@ -300,11 +496,9 @@ def _get_extension_classes(
         file = _get_file_from_module(cls.__module__)
         if file not in unique:
             unique[file] = cls
-    classes = sorted(
-        unique.values(), key=lambda cls: _get_file_from_module(cls.__module__)
+    return tuple(
+        sorted(unique.values(), key=lambda cls: _get_file_from_module(cls.__module__))
     )
-    cache.add(_CLASSES_CACHE_AREA, cache_key, classes)
-    return classes
 
 
 def _get_file_from_module(module_name: str) -> str:
@@ -330,7 +524,7 @@ def register_extensions_watchdogs():
 
     def extensions_changed(items: list[watchdog.WatchItem]):
         cache.clear(_EXTENSIONS_CACHE_AREA)
-        cache.clear(_CLASSES_CACHE_AREA)
+        cache.clear(_DISPATCH_CACHE_AREA)
         PrintStyle.debug("Extensions watchdog triggered:", items)
 
     # extensions and usr/extensions
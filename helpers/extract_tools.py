@@ -42,6 +42,67 @@ def extract_json_root_string(content: str) -> str | None:
     return content[start : start + parser.index]
 
 
+class JsonRootStream:
+    """Incremental counterpart of extract_json_root_string for streamed responses.
+
+    Each update only feeds the text added since the previous one to a DirtyJson parser,
+    text that changed in place (e.g. masked) restarts the parser."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.text = ""
+        self.start = -1  # position of the root "{", -1 while not found
+        self.disabled = False  # root is an array, not a tool request
+        self.parser: DirtyJson | None = None
+
+    def update(self, full: str) -> "JsonRootStream":
+        if not full.startswith(self.text):
+            self.reset()
+        delta_start = len(self.text)
+        self.text = full
+
+        if self.disabled:
+            return self
+        if self.parser is None:
+            start = full.find("{", delta_start)
+            first_array = full.find("[", delta_start, start if start != -1 else len(full))
+            if first_array != -1:
+                self.disabled = True
+                return self
+            if start == -1:
+                return self
+            self.start = start
+            self.parser = DirtyJson()
+            delta_start = start
+
+        try:
+            self.parser.feed(full[delta_start:])
+        except Exception:
+            self.disabled = True
+        return self
+
+    @property
+    def completed(self) -> bool:
+        return self.parser is not None and not self.disabled and self.parser.completed
+
+    @property
+    def root(self) -> str | None:
+        """The root object string once it has been closed."""
+        if not self.completed:
+            return None
+        return self.text[self.start : self.start + self.parser.index]  # type: ignore
+
+    @property
+    def parsed(self) -> dict[str, Any] | None:
+        """Copy of the root object parsed so far, None before it starts."""
+        if self.parser is None or self.disabled:
+            return None
+        value = self.parser.get_partial()
+        return value.copy() if isinstance(value, dict) else None
+
+
 def extract_json_object_string(content):
     start = content.find("{")
     if start == -1:
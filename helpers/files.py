@@ -31,55 +31,9 @@ class VariablesPlugin(ABC):
 def load_plugin_variables(
     file: str, backup_dirs: list[str] | None = None, **kwargs
 ) -> dict[str, Any]:
-    if not file.endswith(".md"):
-        return {}
-
-    if backup_dirs is None:
-        backup_dirs = []
-
-    try:
-        # Create filename and directories list
-        plugin_filename = basename(file, ".md") + ".py"
-        directories = [dirname(file)] + backup_dirs
-        plugin_file = find_file_in_dirs(plugin_filename, directories)
-    except FileNotFoundError:
-        plugin_file = None
-
-    if plugin_file and exists(plugin_file):
+    from helpers import prompt_templates
 
-        from helpers import modules
-
-        classes = modules.load_classes_from_file(
-            plugin_file, VariablesPlugin, one_per_file=False
-        )
-        for cls in classes:
-            return cls().get_variables(file, backup_dirs, **kwargs)  # type: ignore < abstract class here is ok, it is always a subclass
-
-        # load python code and extract variables variables from it
-        # module = None
-        # module_name = dirname(plugin_file).replace("/", ".") + "." + basename(plugin_file, '.py')
-
-        # try:
-        #     spec = importlib.util.spec_from_file_location(module_name, plugin_file)
-        #     if not spec:
-        #         return {}
-        #     module = importlib.util.module_from_spec(spec)
-        #     sys.modules[spec.name] = module
-        #     spec.loader.exec_module(module)  # type: ignore
-        # except ImportError:
-        #     return {}
-
-        # if module is None:
-        #     return {}
-
-        # # Get all classes in the module
-        # class_list = inspect.getmembers(module, inspect.isclass)
-        # # Filter for classes that are subclasses of VariablesPlugin
-        # # iterate backwards to skip imported superclasses
-        # for cls in reversed(class_list):
-        #     if cls[1] is not VariablesPlugin and issubclass(cls[1], VariablesPlugin):
-        #         return cls[1]().get_variables()  # type: ignore
-    return {}
+    return prompt_templates.load_variables(file, backup_dirs, **kwargs)
 
 
 from helpers.strings import sanitize_string
@@ -88,20 +42,17 @@ from helpers.strings import sanitize_string
 def parse_file(
     _filename: str, _directories: list[str] | None = None, _encoding="utf-8", **kwargs
 ):
+    from helpers import prompt_templates
+
     if _directories is None:
         _directories = []
 
-    # Find the file in the directories
-    absolute_path = find_file_in_dirs(_filename, _directories)
+    # Find the file in the directories, the source is read and unfenced once per file version
+    template = prompt_templates.get_template(_filename, _directories, _encoding)
 
-    # Read the file content
-    with open(absolute_path, "r", encoding=_encoding) as f:
-        # content = remove_code_fences(f.read())
-        content = f.read()
-
-    is_json = is_full_json_template(content)
-    content = remove_code_fences(content)
-    variables = load_plugin_variables(absolute_path, _directories, **kwargs) or {}  # type: ignore
+    is_json = template.is_json
+    content = template.unfenced
+    variables = load_plugin_variables(template.path, _directories, **kwargs) or {}  # type: ignore
     variables.update(kwargs)
     if is_json:
         content = replace_placeholders_json(content, **variables)
@@ -123,43 +74,10 @@ def parse_file(
 def read_prompt_file(
     _file: str, _directories: list[str] | None = None, _encoding="utf-8", **kwargs
 ):
-    if _directories is None:
-        _directories = []
-
-    # If filename contains folder path, extract it and add to directories
-    if os.path.dirname(_file):
-        folder_path = os.path.dirname(_file)
-        _file = os.path.basename(_file)
-        _directories = [folder_path] + _directories
-
-    # Find the file in the directories
-    absolute_path = find_file_in_dirs(_file, _directories)
-    source_dir = os.path.dirname(absolute_path)
-
-    # Read the file content
-    with open(absolute_path, "r", encoding=_encoding) as f:
-        content = f.read()
-
-    variables = load_plugin_variables(_file, _directories, **kwargs) or {}  # type: ignore
-    variables.update(kwargs)
-
-    # evaluate conditions
-    content = evaluate_text_conditions(content, **variables)
-
-    # Replace placeholders with values from kwargs
-    content = replace_placeholders_text(content, **variables)
-
-    # Process include statements (with source tracking for {{include original}})
-    content = process_includes(
-        # here we use kwargs, the plugin variables are not inherited
-        content,
-        _directories,
-        _source_file=_file,
-        _source_dir=source_dir,
-        **kwargs,
-    )
+    # templates are compiled once per file version, see helpers/prompt_templates.py
+    from helpers import prompt_templates
 
-    return content
+    return prompt_templates.render_prompt_file(_file, _directories, _encoding, **kwargs)
 
 
 def evaluate_text_conditions(_content: str, **kwargs):
@@ -74,6 +74,9 @@ class Record:
         cls = data["_cls"]
         return globals()[cls].from_dict(data, history=history)
 
+    def invalidate_tokens(self):
+        pass
+
     def output_langchain(self):
         return output_langchain(self.output())
 
@@ -87,20 +90,24 @@ class Message(Record):
         self.ai = ai
         self.content = content
         self.summary: str = ""
-        self.tokens: int = tokens or self.calculate_tokens()
+        # tokens are calculated lazily on first use and cached until content changes
+        self.tokens: int = tokens
 
     def get_tokens(self) -> int:
         if not self.tokens:
             self.tokens = self.calculate_tokens()
         return self.tokens
 
+    def invalidate_tokens(self):
+        self.tokens = 0
+
     def calculate_tokens(self):
         text = self.output_text()
         return tokens.approximate_tokens(text)
 
     def set_summary(self, summary: str):
         self.summary = summary
-        self.tokens = self.calculate_tokens()
+        self.invalidate_tokens()
 
     async def compress(self):
         return False
@@ -127,9 +134,13 @@ class Message(Record):
     @staticmethod
     def from_dict(data: dict, history: "History"):
         content = data.get("content", "Content lost")
-        msg = Message(ai=data["ai"], content=content, id=data.get("id", ""))
+        msg = Message(
+            ai=data["ai"],
+            content=content,
+            tokens=data.get("tokens", 0),
+            id=data.get("id", ""),
+        )
         msg.summary = data.get("summary", "")
-        msg.tokens = data.get("tokens", 0)
         return msg
 
 
@@ -138,18 +149,37 @@ class Topic(Record):
         self.history = history
         self.summary: str = ""
         self.messages: list[Message] = []
+        self._tokens: int | None = None  # cached aggregate, None when dirty
+        self.version = 0  # incremented on changes other than appended messages
 
     def get_tokens(self):
-        if self.summary:
-            return tokens.approximate_tokens(self.summary)
-        else:
-            return sum(msg.get_tokens() for msg in self.messages)
+        if self._tokens is None:
+            if self.summary:
+                self._tokens = tokens.approximate_tokens(self.summary)
+            else:
+                self._tokens = sum(msg.get_tokens() for msg in self.messages)
+        return self._tokens
+
+    def invalidate_tokens(self):
+        self._tokens = None
+        self.version += 1
+        self.history.invalidate_tokens()
 
     def add_message(
         self, ai: bool, content: MessageContent, tokens: int = 0, id: str = ""
     ) -> Message:
         msg = Message(ai=ai, content=content, tokens=tokens, id=id)
         self.messages.append(msg)
+        # update the ledger incrementally instead of invalidating the aggregate
+        if self._tokens is not None and not self.summary:
+            self._tokens += msg.get_tokens()
+        return msg
+
+    def pop_message(self) -> Message | None:
+        if not self.messages:
+            return None
+        msg = self.messages.pop()
+        self.invalidate_tokens()
         return msg
 
     def output(self) -> list[OutputMessage]:
@@ -161,6 +191,7 @@ class Topic(Record):
 
     async def summarize(self):
         self.summary = await self.summarize_messages(self.messages)
+        self.invalidate_tokens()
         return self.summary
 
     def compress_large_messages(self, message_ratio: float = CURRENT_TOPIC_RATIO * LARGE_MESSAGE_TO_CURRENT_TOPIC_RATIO) -> bool:
@@ -201,6 +232,7 @@ class Topic(Record):
                 )
                 msg.set_summary(_json_dumps(trunc))
 
+            self.invalidate_tokens()
             return True
         return False
 
@@ -225,6 +257,7 @@ class Topic(Record):
         )
         sum_msg = Message(False, sum_msg_content)
         self.messages[1 : cnt_to_sum + 1] = [sum_msg]
+        self.invalidate_tokens()
         return True
 
     async def summarize_messages(self, messages: list[Message]):
@@ -259,12 +292,21 @@ class Bulk(Record):
         self.history = history
         self.summary: str = ""
         self.records: list[Record] = []
+        self._tokens: int | None = None  # cached aggregate, None when dirty
+        self.version = 0  # incremented on every change
 
     def get_tokens(self):
-        if self.summary:
-            return tokens.approximate_tokens(self.summary)
-        else:
-            return sum([r.get_tokens() for r in self.records])
+        if self._tokens is None:
+            if self.summary:
+                self._tokens = tokens.approximate_tokens(self.summary)
+            else:
+                self._tokens = sum([r.get_tokens() for r in self.records])
+        return self._tokens
+
+    def invalidate_tokens(self):
+        self._tokens = None
+        self.version += 1
+        self.history.invalidate_tokens()
 
     def output(
         self, human_label: str = "user", ai_label: str = "ai"
@@ -285,6 +327,7 @@ class Bulk(Record):
                 "fw.topic_summary.msg.md", content=self.output_text()
             ),
         )
+        self.invalidate_tokens()
         return self.summary
 
     def to_dict(self):
@@ -312,6 +355,9 @@ class History(Record):
         self.topics: list[Topic] = []
         self.current = Topic(history=self)
         self.agent: Agent = agent
+        # cached sums over bulks and closed topics, None when dirty
+        self._bulks_tokens: int | None = None
+        self._topics_tokens: int | None = None
 
     def get_tokens(self) -> int:
         return (
@@ -320,16 +366,24 @@ class History(Record):
             + self.get_current_topic_tokens()
         )
 
+    def invalidate_tokens(self):
+        self._bulks_tokens = None
+        self._topics_tokens = None
+
     def is_over_limit(self):
         limit = self._get_ctx_size_for_history()
         total = self.get_tokens()
         return total > limit
 
     def get_bulks_tokens(self) -> int:
-        return sum(record.get_tokens() for record in self.bulks)
+        if self._bulks_tokens is None:
+            self._bulks_tokens = sum(record.get_tokens() for record in self.bulks)
+        return self._bulks_tokens
 
     def get_topics_tokens(self) -> int:
-        return sum(record.get_tokens() for record in self.topics)
+        if self._topics_tokens is None:
+            self._topics_tokens = sum(record.get_tokens() for record in self.topics)
+        return self._topics_tokens
 
     def get_current_topic_tokens(self) -> int:
         return self.current.get_tokens()
@@ -343,6 +397,8 @@ class History(Record):
     def new_topic(self):
         if self.current.messages:
             self.topics.append(self.current)
+            if self._topics_tokens is not None:
+                self._topics_tokens += self.current.get_tokens()
             self.current = Topic(history=self)
 
     def output(self) -> list[OutputMessage]:
@@ -353,6 +409,21 @@ class History(Record):
         result += self.current.output()
         return result
 
+    def output_text_tail(self, max_chars: int, human_label="user", ai_label="ai") -> str:
+        """Last max_chars characters of output_text, only the newest records are stringified."""
+        if max_chars <= 0:
+            return self.output_text(human_label, ai_label)
+        self.trim_embeds(self._get_max_embeds())
+        parts: list[str] = []
+        size = -1  # no separator before the first part
+        for record in reversed(self.bulks + self.topics + [self.current]):
+            for out in reversed(record.output()):
+                parts.append(_stringify_output(out, ai_label, human_label))
+                size += len(parts[-1]) + 1
+                if size >= max_chars:
+                    return "\n".join(reversed(parts))[-max_chars:]
+        return "\n".join(reversed(parts))
+
     def trim_embeds(self, max_embeds: int) -> int:
         if max_embeds == -1:
             return 0
@@ -399,6 +470,8 @@ class History(Record):
             for message in reversed(record.messages):
                 embeds_count, removed_now = self._trim_embeds_in_record(message, embeds_count, max_embeds)
                 removed += removed_now
+            if removed:
+                record.invalidate_tokens()
             return embeds_count, removed
 
         if isinstance(record, Bulk):
@@ -406,6 +479,8 @@ class History(Record):
             for nested in reversed(record.records):
                 embeds_count, removed_now = self._trim_embeds_in_record(nested, embeds_count, max_embeds)
                 removed += removed_now
+            if removed:
+                record.invalidate_tokens()
             return embeds_count, removed
 
         return embeds_count, 0
@@ -416,6 +491,7 @@ class History(Record):
         history.bulks = [Bulk.from_dict(b, history=history) for b in data["bulks"]]
         history.topics = [Topic.from_dict(t, history=history) for t in data["topics"]]
         history.current = Topic.from_dict(data["current"], history=history)
+        history.invalidate_tokens()
         return history
 
     def to_dict(self):
@@ -503,6 +579,7 @@ class History(Record):
             await bulk.summarize()
             self.bulks.append(bulk)
             self.topics[:count] = []
+            self.invalidate_tokens()
             return True
         return False
 
@@ -512,6 +589,7 @@ class History(Record):
         # remove oldest bulk if necessary
         if not compressed:
             self.bulks.pop(0)
+            self.invalidate_tokens()
             return True
         return compressed
 
@@ -527,6 +605,7 @@ class History(Record):
             ]
         )
         self.bulks = bulks
+        self.invalidate_tokens()
         return True
 
     async def merge_bulks(self, bulks: list[Bulk]) -> Bulk:
@@ -624,18 +703,54 @@ def group_messages_abab(messages: list[BaseMessage]) -> list[BaseMessage]:
 def output_langchain(messages: list[OutputMessage]):
     result = []
     for m in messages:
-        content = _output_content_langchain(content=m["content"])
-        if not content or (isinstance(content, str) and not content.strip()):
-            continue # skip empty messages, models 
-        if m["ai"]:
-            result.append(AIMessage(content))  # type: ignore
-        else:
-            result.append(HumanMessage(content))  # type: ignore
+        msg = _output_message_langchain(m)
+        if msg is not None:
+            result.append(msg)
     # ensure message type alternation
     result = group_messages_abab(result)
     return result
 
 
+class LangchainOutputCache:
+    """Converts outputs to langchain messages, reusing conversions for the unchanged prefix of the previous call."""
+
+    def __init__(self):
+        self._outputs: list[OutputMessage] = []
+        self._converted: list[BaseMessage | None] = []
+
+    def output_langchain(self, messages: list[OutputMessage]) -> list[BaseMessage]:
+        prefix = 0
+        limit = min(len(self._outputs), len(messages))
+        while prefix < limit and _is_same_output(self._outputs[prefix], messages[prefix]):
+            prefix += 1
+
+        converted = self._converted[:prefix]
+        converted += [_output_message_langchain(m) for m in messages[prefix:]]
+        self._outputs = list(messages)
+        self._converted = converted
+
+        # ensure message type alternation, merging creates new instances so cached ones stay intact
+        return group_messages_abab([m for m in converted if m is not None])
+
+    def clear(self):
+        self._outputs = []
+        self._converted = []
+
+
+def _output_message_langchain(message: OutputMessage) -> BaseMessage | None:
+    content = _output_content_langchain(content=message["content"])
+    if not content or (isinstance(content, str) and not content.strip()):
+        return None  # skip empty messages, models
+    if message["ai"]:
+        return AIMessage(content)  # type: ignore
+    return HumanMessage(content)  # type: ignore
+
+
+def _is_same_output(a: OutputMessage, b: OutputMessage) -> bool:
+    # records keep their content objects, identity is enough to detect an unchanged message
+    return a["ai"] == b["ai"] and a["content"] is b["content"]
+
+
 def output_text(messages: list[OutputMessage], ai_label="ai", human_label="human"):
     return "\n".join(_stringify_output(o, ai_label, human_label) for o in messages)
 
@@ -7,7 +7,7 @@ from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Any, Literal, Optional, TYPE_CHECKING, TypeVar, cast
 
-from helpers.secrets import get_secrets_manager
+from helpers.secrets import SecretsMasker, get_secrets_manager
 from helpers.strings import truncate_text_by_ratio
 
 
@@ -217,12 +217,20 @@ class LogOutput:
 
 
 class Log:
+    """
+    Log items of a context with a version incremented on every item update.
+
+    Clients poll with the version they have seen, the index keeps only the latest version
+    of each item ordered by version, so changes since a version are found without
+    scanning older ones and the index never grows beyond the number of items.
+    """
 
     def __init__(self):
         self._lock = threading.RLock()
         self.context: "AgentContext|None" = None  # set from outside
         self.guid: str = str(uuid.uuid4())
-        self.updates: list[int] = []
+        self.version: int = 0
+        self._changed: OrderedDict[int, int] = OrderedDict()  # item no -> version, by version
         self.logs: list[LogItem] = []
         self.progress: str = ""
         self.progress_no: int = 0
@@ -289,26 +297,28 @@ class Log:
         with self._lock:
             current_type = self.logs[no].type
         type_for_truncation = type if type is not None else current_type
+        # resolve the secrets masker once for all fields of this update
+        masker = self._get_masker()
 
         heading_out: str | None = None
         if heading is not None:
-            heading_out = _truncate_heading(self._mask_recursive(heading))
+            heading_out = _truncate_heading(self._mask_recursive(heading, masker))
 
         content_out: str | None = None
         if content is not None:
-            content_out = _truncate_content(self._mask_recursive(content), type_for_truncation)
+            content_out = _truncate_content(self._mask_recursive(content, masker), type_for_truncation)
 
         kvps_out: OrderedDict | None = None
         if kvps is not None:
             kvps_out_tmp = OrderedDict(copy.deepcopy(kvps))
-            kvps_out_tmp = self._mask_recursive(kvps_out_tmp)
+            kvps_out_tmp = self._mask_recursive(kvps_out_tmp, masker)
             kvps_out_tmp = _truncate_value(kvps_out_tmp)
             kvps_out = OrderedDict(kvps_out_tmp)
 
         kwargs_out: dict | None = None
         if kwargs:
             kwargs_out = copy.deepcopy(kwargs)
-            kwargs_out = self._mask_recursive(kwargs_out)
+            kwargs_out = self._mask_recursive(kwargs_out, masker)
 
         with self._lock:
             item = self.logs[no]
@@ -338,7 +348,7 @@ class Log:
                     item.kvps = OrderedDict()
                 item.kvps.update(kwargs_out)
 
-            self.updates.append(item.no)
+            self.touch(item.no)
 
             if item.heading and item.update_progress != "none":
                 if item.no >= self.progress_no:
@@ -392,32 +402,55 @@ class Log:
     def set_initial_progress(self):
         self.set_progress("Waiting for input", 0, False)
 
+    def touch(self, no: int):
+        """Record an update of the item, it is output to clients behind the new version."""
+        with self._lock:
+            self.version += 1
+            self._changed[no] = self.version
+            self._changed.move_to_end(no)
+
+    def changed_since(self, start: int) -> list[int]:
+        """Numbers of items updated after version start, newest update first."""
+        with self._lock:
+            changed = []
+            for no in reversed(self._changed):
+                if self._changed[no] <= start:
+                    break
+                changed.append(no)
+            return changed
+
     def output(self, start=None, end=None):
+        """Items updated after version start (up to version end), in log order."""
         with self._lock:
             if start is None:
                 start = 0
             if end is None:
-                end = len(self.updates)
-            updates = self.updates[start:end]
-            logs = list(self.logs)
-
-        out = []
-        seen = set()
-        for update in updates:
-            if update not in seen and update < len(logs):
-                out.append(logs[update].output())
-                seen.add(update)
+                end = self.version
+            changed = []
+            for no in reversed(self._changed):
+                version = self._changed[no]
+                if version <= start:
+                    break
+                if version <= end and no < len(self.logs):
+                    changed.append(self.logs[no])
+            changed.sort(key=lambda item: item.no)
+            out = [item.output() for item in changed]
         return LogOutput(items=out, start=start, end=end)
 
+    def output_items(self, start: int = 0) -> list[dict[str, Any]]:
+        """Items from position start to the end of the log."""
+        with self._lock:
+            return [item.output() for item in self.logs[start:]]
+
     def reset(self):
         with self._lock:
             self.guid = str(uuid.uuid4())
-            self.updates = []
+            self.version = 0
+            self._changed = OrderedDict()
             self.logs = []
         self.set_initial_progress()
 
-    def _mask_recursive(self, obj: T) -> T:
-        """Recursively mask secrets in nested objects."""
+    def _get_masker(self) -> SecretsMasker | None:
         try:
             from agent import AgentContext
             secrets_mgr = get_secrets_manager(self.context or AgentContext.current())
@@ -429,14 +462,23 @@ class Log:
             # if self_id != current_id:
             #     print(f"Context ID mismatch: {self_id} != {current_id}")
 
-            if isinstance(obj, str):
-                return cast(Any, secrets_mgr.mask_values(obj))
-            elif isinstance(obj, dict):
-                return {k: self._mask_recursive(v) for k, v in obj.items()}  # type: ignore
-            elif isinstance(obj, list):
-                return [self._mask_recursive(item) for item in obj]  # type: ignore
-            else:
-                return obj
+            return secrets_mgr.get_masker()
         except Exception:
-            # If masking fails, return original object
+            return None
+
+    def _mask_recursive(self, obj: T, masker: SecretsMasker | None = None) -> T:
+        """Recursively mask secrets in nested objects."""
+        if masker is None:
+            masker = self._get_masker()
+            if masker is None:
+                # If masking fails, return original object
+                return obj
+
+        if isinstance(obj, str):
+            return cast(Any, masker.mask(obj))
+        elif isinstance(obj, dict):
+            return {k: self._mask_recursive(v, masker) for k, v in obj.items()}  # type: ignore
+        elif isinstance(obj, list):
+            return [self._mask_recursive(item, masker) for item in obj]  # type: ignore
+        else:
             return obj
@@ -0,0 +1,181 @@
+import ast
+import operator
+from typing import Any, Callable, Iterable
+
+import numpy as np
+
+# faiss needs to be patched for python 3.12 on arm #TODO remove once not needed
+from helpers import faiss_monkey_patch
+import faiss
+
+# metadata fields with an inverted index, filters on other fields fall back to evaluation per document
+INDEXED_FIELDS = ("area", "knowledge_source", "source_file", "timestamp", "document_uri")
+
+def _contains(value: Any, options: Any) -> bool:
+    return value in options
+
+
+_OPERATORS: dict[type, Callable[[Any, Any], bool]] = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: _contains,
+    ast.NotIn: lambda value, options: value not in options,
+}
+
+# (candidate document ids, whether the candidates match the filter exactly)
+type Candidates = tuple[set[str], bool]
+
+
+class MetadataIndex:
+    """Inverted index of selected metadata fields, value -> docstore ids."""
+
+    def __init__(self, fields: Iterable[str] = INDEXED_FIELDS):
+        self.fields = tuple(fields)
+        self._values: dict[str, dict[Any, set[str]]] = {f: {} for f in self.fields}
+        # documents whose value can not be hashed, they are candidates for any filter on the field
+        self._unhashable: dict[str, set[str]] = {f: set() for f in self.fields}
+        self._docs: dict[str, dict[str, Any]] = {}
+
+    def add(self, doc_id: str, metadata: dict[str, Any]):
+        if doc_id in self._docs:
+            self.remove(doc_id)
+        values = {f: metadata[f] for f in self.fields if f in metadata}
+        for field, value in values.items():
+            try:
+                self._values[field].setdefault(value, set()).add(doc_id)
+            except TypeError:
+                self._unhashable[field].add(doc_id)
+        self._docs[doc_id] = values
+
+    def remove(self, doc_id: str):
+        values = self._docs.pop(doc_id, None)
+        if not values:
+            return
+        for field, value in values.items():
+            self._unhashable[field].discard(doc_id)
+            try:
+                ids = self._values[field].get(value)
+            except TypeError:
+                continue
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._values[field][value]
+
+    def rebuild(self, docs: dict[str, Any]):
+        self._values = {f: {} for f in self.fields}
+        self._unhashable = {f: set() for f in self.fields}
+        self._docs = {}
+        for doc_id, doc in docs.items():
+            self.add(doc_id, doc.metadata)
+
+    def lookup(self, field: str, value: Any) -> set[str]:
+        return set(self._values[field].get(value, ()))
+
+    def match(self, field: str, op: Callable[[Any, Any], bool], operand: Any) -> Candidates | None:
+        values = self._values.get(field)
+        if values is None:
+            return None
+        ids: set[str] = set()
+        try:
+            if op is operator.eq:
+                ids.update(values.get(operand, ()))
+            elif op is _contains and isinstance(operand, (list, tuple, set, frozenset)):
+                # sets of values, e.g. document uris, are looked up value by value
+                for option in operand:
+                    ids.update(values.get(option, ()))
+            else:
+                # distinct values are few compared to documents, except for timestamps
+                for value, value_ids in values.items():
+                    if op(value, operand):
+                        ids.update(value_ids)
+        except TypeError:
+            return None  # incomparable types, let the evaluator decide
+        unhashable = self._unhashable[field]
+        return ids | unhashable, not unhashable
+
+
+class MetadataFilter:
+    """Filter condition string usable as a langchain filter callable that can be planned against a MetadataIndex."""
+
+    def __init__(self, condition: str, comparator: Callable[[dict[str, Any]], bool]):
+        self.condition = condition
+        self.comparator = comparator
+        try:
+            self._tree: ast.expr | None = ast.parse(condition.strip(), mode="eval").body
+        except SyntaxError:
+            self._tree = None
+
+    def __call__(self, metadata: dict[str, Any]) -> bool:
+        return self.comparator(metadata)
+
+    def candidates(self, index: MetadataIndex) -> Candidates | None:
+        """Ids of documents that can match the filter, None when the index can not narrow it down."""
+        if self._tree is None:
+            return None
+        return _plan(self._tree, index)
+
+
+def _plan(node: ast.expr, index: MetadataIndex) -> Candidates | None:
+    if isinstance(node, ast.BoolOp):
+        parts = [_plan(value, index) for value in node.values]
+        if isinstance(node.op, ast.Or):
+            if any(part is None for part in parts):
+                return None
+            ids: set[str] = set()
+            for part_ids, _ in parts:  # type: ignore
+                ids |= part_ids
+            return ids, all(exact for _, exact in parts)  # type: ignore
+        known = [part for part in parts if part is not None]
+        if not known:
+            return None
+        ids = set.intersection(*(part_ids for part_ids, _ in known))
+        return ids, len(known) == len(parts) and all(exact for _, exact in known)
+
+    if isinstance(node, ast.Compare) and len(node.ops) == 1:
+        op = _OPERATORS.get(type(node.ops[0]))
+        left, right = node.left, node.comparators[0]
+        if op is None:
+            return None
+        if isinstance(left, ast.Name) and _is_literal(right):
+            return index.match(left.id, op, ast.literal_eval(right))
+        if isinstance(right, ast.Name) and _is_literal(left) and op in (operator.eq, operator.ne):
+            return index.match(right.id, op, ast.literal_eval(left))
+
+    return None
+
+
+def _is_literal(node: ast.expr) -> bool:
+    try:
+        ast.literal_eval(node)
+        return True
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return False
+
+
+def search_params(index: Any, labels: Iterable[int]):
+    """Faiss search parameters restricting the search to the given labels.
+
+    The returned selector must stay referenced for as long as the parameters are used."""
+    selector = faiss.IDSelectorBatch(np.fromiter(labels, dtype=np.int64))
+    return _selector_params(index, selector), selector
+
+
+def exclude_params(index: Any, labels: Iterable[int]):
+    """Faiss search parameters skipping the given labels, same lifetime rule as search_params."""
+    excluded = faiss.IDSelectorBatch(np.fromiter(labels, dtype=np.int64))
+    selector = faiss.IDSelectorNot(excluded)
+    return _selector_params(index, selector), (selector, excluded)
+
+
+def _selector_params(index: Any, selector: Any):
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
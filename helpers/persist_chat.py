@@ -1,8 +1,13 @@
 from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Any
+import asyncio
+import os
+import tempfile
+import threading
 import uuid
-from agent import Agent, AgentConfig, AgentContext, AgentContextType
+from agent import Agent, AgentConfig, AgentContext, AgentContextType, ContextWindow
 from helpers import files, history
 import json
 from initialize import initialize_agent
@@ -11,7 +16,73 @@ from helpers.log import Log, LogItem
 
 CHATS_FOLDER = "usr/chats"
 LOG_SIZE = 1000
-CHAT_FILE_NAME = "chat.json"
+CHAT_FILE_NAME = "chat.json"  # single file format, still loaded and exported
+MANIFEST_FILE_NAME = "manifest.json"
+SEGMENTS_FOLDER = "segments"
+LOG_ITEMS_PER_SEGMENT = 50
+MESSAGES_PER_SEGMENT = 8
+
+
+@dataclass
+class _ChatSave:
+    """Serialized segments and manifest of one save, waiting to be written."""
+
+    segments: dict[str, str]  # name -> json
+    manifest: str
+    referenced: set[str]  # segments the manifest points to
+
+
+@dataclass
+class _SavedChat:
+    """
+    Segments currently on disk for one chat, saves only write segments whose content changed.
+
+    History topics are split into segments of messages, bulks are one segment each and the log
+    is split into segments of items. A segment is reused while its record is the same object
+    with the same version and, for messages and log items, the same count or no newer updates.
+    Every written segment gets a new name, the manifest is replaced last so it always points
+    to complete segments.
+
+    A save is serialized under lock where the chat is mutated and queued, the queue is written
+    in order under write_lock, possibly by a worker thread.
+    """
+
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    write_lock: threading.Lock = field(default_factory=threading.Lock)
+    serial: int = 0
+    # (id of topic, segment index) -> (topic, version, message count, name)
+    messages: dict[tuple[int, int], tuple[history.Topic, int, int, str]] = field(default_factory=dict)
+    # id of bulk -> (bulk, version, name)
+    bulks: dict[int, tuple[history.Bulk, int, str]] = field(default_factory=dict)
+    log_guid: str = ""
+    log_version: int = 0
+    log_segments: dict[int, str] = field(default_factory=dict)  # segment index -> name
+    files: set[str] | None = None  # segment files on disk, None when not listed yet
+    queue: list[_ChatSave] = field(default_factory=list)  # serialized saves not written yet
+    removed: bool = False  # chat was deleted, queued saves must not re-create it
+
+    def new_name(self, kind: str) -> str:
+        self.serial += 1
+        return f"{kind}-{self.serial}.json"
+
+    def forget_segments(self):
+        # segments may not have been written, the next save writes all of them
+        self.messages.clear()
+        self.bulks.clear()
+        self.log_guid = ""
+        self.log_segments = {}
+
+
+_saved_chats: dict[str, _SavedChat] = {}
+_saved_chats_lock = threading.Lock()
+
+
+def _get_saved_chat(ctxid: str) -> _SavedChat:
+    with _saved_chats_lock:
+        saved = _saved_chats.get(ctxid)
+        if saved is None:
+            saved = _saved_chats[ctxid] = _SavedChat()
+        return saved
 
 
 def get_chat_folder_path(ctxid: str):
@@ -30,16 +101,87 @@ def get_chat_msg_files_folder(ctxid: str):
     return files.get_abs_path(get_chat_folder_path(ctxid), "messages")
 
 def save_tmp_chat(context: AgentContext):
-    """Save context to the chats folder"""
+    """Save context to the chats folder, only segments changed since the last save are written"""
+    saved = _prepare_chat_save(context)
+    if saved:
+        _write_chat_saves(saved, context.id)
+
+
+async def save_tmp_chat_async(context: AgentContext):
+    """Like save_tmp_chat, the files are written in a worker thread.
+
+    The chat is serialized before returning to the event loop, the loop keeps mutating it meanwhile."""
+    saved = _prepare_chat_save(context)
+    if saved:
+        await asyncio.to_thread(_write_chat_saves, saved, context.id)
+
+
+def _prepare_chat_save(context: AgentContext) -> _SavedChat | None:
     # Skip saving BACKGROUND contexts as they should be ephemeral
     if context.type == AgentContextType.BACKGROUND:
-        return
+        return None
+
+    saved = _get_saved_chat(context.id)
+    with saved.lock:
+        # a save may be requested after the chat was removed
+        if saved.removed or AgentContext.get(context.id) is None:
+            return None
+        if saved.files is None:
+            segments_folder = files.get_abs_path(get_chat_folder_path(context.id), SEGMENTS_FOLDER)
+            saved.files = set(files.list_files(segments_folder, "*.json"))
+            # never reuse the name of a segment left on disk
+            for name in saved.files:
+                serial = name.rsplit(".", 1)[0].rsplit("-", 1)[-1]
+                if serial.isdigit():
+                    saved.serial = max(saved.serial, int(serial))
 
-    path = _get_chat_file_path(context.id)
-    files.make_dirs(path)
-    data = _serialize_context(context)
-    js = _safe_json_serialize(data, ensure_ascii=False)
-    files.write_file(path, js)
+        try:
+            writes: dict[str, Any] = {}
+            manifest = _serialize_context_manifest(context, saved, writes)
+            save = _ChatSave(
+                segments={
+                    name: _safe_json_serialize(content, ensure_ascii=False)
+                    for name, content in writes.items()
+                },
+                manifest=_safe_json_serialize(manifest, ensure_ascii=False),
+                referenced=_get_manifest_segments(manifest),
+            )
+        except Exception:
+            saved.forget_segments()
+            raise
+        saved.messages = {k: v for k, v in saved.messages.items() if v[3] in save.referenced}
+        saved.bulks = {k: v for k, v in saved.bulks.items() if v[2] in save.referenced}
+        saved.queue.append(save)
+    return saved
+
+
+def _write_chat_saves(saved: _SavedChat, ctxid: str):
+    folder = get_chat_folder_path(ctxid)
+    segments_folder = files.get_abs_path(folder, SEGMENTS_FOLDER)
+    # saves are written in the order they were serialized, a later one reuses earlier segments
+    with saved.write_lock:
+        while True:
+            with saved.lock:
+                if saved.removed or not saved.queue:
+                    return
+                save = saved.queue.pop(0)
+            chat_files = saved.files if saved.files is not None else set()
+            try:
+                for name, content in save.segments.items():
+                    _write_file_atomic(os.path.join(segments_folder, name), content)
+                    chat_files.add(name)
+                _write_file_atomic(files.get_abs_path(folder, MANIFEST_FILE_NAME), save.manifest)
+            except Exception:
+                with saved.lock:
+                    saved.queue.clear()
+                    saved.forget_segments()
+                raise
+
+            # segments replaced by this save and the single file format are not referenced anymore
+            for name in chat_files - save.referenced:
+                files.delete_file(os.path.join(segments_folder, name))
+            chat_files &= save.referenced
+            files.delete_file(_get_chat_file_path(ctxid))
 
 
 def save_tmp_chats():
@@ -55,16 +197,18 @@ def load_tmp_chats():
     """Load all contexts from the chats folder"""
     _convert_v080_chats()
     folders = files.list_files(CHATS_FOLDER, "*")
-    json_files = []
-    for folder_name in folders:
-        json_files.append(_get_chat_file_path(folder_name))
 
     ctxids = []
-    for file in json_files:
+    for folder_name in folders:
+        manifest_file = files.get_abs_path(CHATS_FOLDER, folder_name, MANIFEST_FILE_NAME)
+        file = manifest_file if files.exists(manifest_file) else _get_chat_file_path(folder_name)
         try:
             js = files.read_file(file)
             data = json.loads(js)
-            ctx = _deserialize_context(data)
+            if file == manifest_file:
+                ctx = _deserialize_context_manifest(data, folder_name)
+            else:
+                ctx = _deserialize_context(data)
             ctxids.append(ctx.id)
         except Exception as e:
             print(f"Error loading chat {file}: {e}")
@@ -105,8 +249,15 @@ def export_json_chat(context: AgentContext):
 
 def remove_chat(ctxid):
     """Remove a chat or task context"""
-    path = get_chat_folder_path(ctxid)
-    files.delete_dir(path)
+    saved = _get_saved_chat(ctxid)
+    with saved.lock:
+        saved.removed = True
+    # wait for a save being written, queued ones are dropped
+    with saved.write_lock:
+        path = get_chat_folder_path(ctxid)
+        files.delete_dir(path)
+        with _saved_chats_lock:
+            _saved_chats.pop(ctxid, None)
 
 
 def remove_msg_files(ctxid):
@@ -115,12 +266,12 @@ def remove_msg_files(ctxid):
     files.delete_dir(path)
 
 
-def _serialize_context(context: AgentContext):
+def _serialize_context(context: AgentContext, agents: bool = True, log: bool = True):
     # serialize agents
-    agents = []
+    agent_list = []
     agent = context.agent0
-    while agent:
-        agents.append(_serialize_agent(agent))
+    while agent and agents:
+        agent_list.append(_serialize_agent(agent))
         agent = agent.data.get(Agent.DATA_NAME_SUBORDINATE, None)
 
 
@@ -141,18 +292,18 @@ def _serialize_context(context: AgentContext):
             if context.last_message
             else datetime.fromtimestamp(0).isoformat()
         ),
-        "agents": agents,
+        "agents": agent_list,
         "streaming_agent": (
             context.streaming_agent.number if context.streaming_agent else 0
         ),
-        "log": _serialize_log(context.log),
+        "log": _serialize_log(context.log) if log else {},
         "data": data,
         "output_data": output_data,
     }
 
 
 def _serialize_agent(agent: Agent):
-    data = {k: v for k, v in agent.data.items() if not k.startswith("_")}
+    data = _serialize_agent_data(agent)
 
     history = agent.history.serialize()
 
@@ -163,6 +314,19 @@ def _serialize_agent(agent: Agent):
     }
 
 
+def _serialize_agent_data(agent: Agent) -> dict[str, Any]:
+    data = {k: v for k, v in agent.data.items() if not k.startswith("_")}
+    # the context window is kept as the prompt, saves do not render it
+    window = data.get(Agent.DATA_NAME_CTX_WINDOW)
+    if isinstance(window, ContextWindow):
+        saved = window.to_saved()
+        if saved is None:
+            del data[Agent.DATA_NAME_CTX_WINDOW]
+        else:
+            data[Agent.DATA_NAME_CTX_WINDOW] = saved
+    return data
+
+
 def _serialize_log(log: Log):
     # Guard against concurrent log mutations while serializing.
     with log._lock:
@@ -178,6 +342,184 @@ def _serialize_log(log: Log):
     }
 
 
+def _serialize_context_manifest(
+    context: AgentContext, saved: _SavedChat, writes: dict[str, Any]
+) -> dict[str, Any]:
+    """Same fields as _serialize_context, histories and log refer to segments collected in writes."""
+    data = _serialize_context(context, agents=False, log=False)
+
+    agents = []
+    agent = context.agent0
+    while agent:
+        agents.append(
+            {
+                "number": agent.number,
+                "data": _serialize_agent_data(agent),
+                "history": _serialize_history_segments(agent.history, saved, writes),
+            }
+        )
+        agent = agent.data.get(Agent.DATA_NAME_SUBORDINATE, None)
+    data["agents"] = agents
+    data["log"] = _serialize_log_segments(context.log, saved, writes)
+    data["serial"] = saved.serial
+    return data
+
+
+def _serialize_history_segments(
+    hist: history.History, saved: _SavedChat, writes: dict[str, Any]
+) -> dict[str, Any]:
+    bulks = []
+    for bulk in hist.bulks:
+        entry = saved.bulks.get(id(bulk))
+        if entry is None or entry[0] is not bulk or entry[1] != bulk.version:
+            entry = (bulk, bulk.version, saved.new_name("bulk"))
+            saved.bulks[id(bulk)] = entry
+            writes[entry[2]] = bulk.to_dict()
+        bulks.append(entry[2])
+
+    topics = [
+        {
+            "summary": topic.summary,
+            "messages": _serialize_message_segments(topic, saved, writes),
+        }
+        for topic in hist.topics + [hist.current]
+    ]
+    return {
+        "counter": hist.counter,
+        "bulks": bulks,
+        "topics": topics[:-1],
+        "current": topics[-1],
+    }
+
+
+def _serialize_message_segments(
+    topic: history.Topic, saved: _SavedChat, writes: dict[str, Any]
+) -> list[str]:
+    names = []
+    for index, start in enumerate(range(0, len(topic.messages), MESSAGES_PER_SEGMENT)):
+        messages = topic.messages[start : start + MESSAGES_PER_SEGMENT]
+        key = (id(topic), index)
+        entry = saved.messages.get(key)
+        if (
+            entry is None
+            or entry[0] is not topic
+            or entry[1] != topic.version
+            or entry[2] != len(messages)
+        ):
+            entry = (topic, topic.version, len(messages), saved.new_name("messages"))
+            saved.messages[key] = entry
+            writes[entry[3]] = [m.to_dict() for m in messages]
+        names.append(entry[3])
+    return names
+
+
+def _serialize_log_segments(
+    log: Log, saved: _SavedChat, writes: dict[str, Any]
+) -> dict[str, Any]:
+    # Guard against concurrent log mutations while serializing.
+    with log._lock:
+        if saved.log_guid != log.guid or saved.log_version > log.version:
+            saved.log_guid = log.guid
+            saved.log_segments = {}
+        changed = {no // LOG_ITEMS_PER_SEGMENT for no in log.changed_since(saved.log_version)}
+        saved.log_version = log.version
+
+        first = max(0, len(log.logs) - LOG_SIZE) // LOG_ITEMS_PER_SEGMENT
+        last = (len(log.logs) - 1) // LOG_ITEMS_PER_SEGMENT
+        segments = {}
+        for index in range(first, last + 1):
+            name = saved.log_segments.get(index)
+            if name is None or index in changed:
+                name = saved.new_name("log")
+                start = index * LOG_ITEMS_PER_SEGMENT
+                writes[name] = [
+                    item.output()
+                    for item in log.logs[start : start + LOG_ITEMS_PER_SEGMENT]
+                ]
+            segments[index] = name
+        saved.log_segments = segments
+
+        return {
+            "guid": log.guid,
+            "segments": list(segments.values()),
+            "progress": log.progress,
+            "progress_no": log.progress_no,
+        }
+
+
+def _get_manifest_segments(manifest: dict[str, Any]) -> set[str]:
+    names = set(manifest["log"]["segments"])
+    for agent in manifest["agents"]:
+        hist = agent["history"]
+        names.update(hist["bulks"])
+        for topic in hist["topics"] + [hist["current"]]:
+            names.update(topic["messages"])
+    return names
+
+
+def _deserialize_context_manifest(data: dict[str, Any], ctxid: str) -> AgentContext:
+    """Load a chat saved as manifest and segments, the segments are reused by the next save."""
+    segments_folder = files.get_abs_path(get_chat_folder_path(ctxid), SEGMENTS_FOLDER)
+    saved = _SavedChat(serial=data.get("serial", 0))
+
+    def read_segments(names: list[str], size: int) -> tuple[list[Any], bool]:
+        # segments can be reused when they are split the same way a save would split them
+        items, aligned = [], True
+        for i, name in enumerate(names):
+            segment = json.loads(files.read_file(os.path.join(segments_folder, name)))
+            aligned = aligned and (len(segment) == size or i == len(names) - 1)
+            items += segment
+        return items, aligned
+
+    log_data = data.get("log", {})
+    log_items, log_aligned = read_segments(log_data.get("segments", []), LOG_ITEMS_PER_SEGMENT)
+    agents, topic_segments = [], []
+    for ag in data.get("agents", []):
+        hist = ag["history"]
+        topics = []
+        for topic in hist["topics"] + [hist["current"]]:
+            messages, aligned = read_segments(topic["messages"], MESSAGES_PER_SEGMENT)
+            topics.append({"_cls": "Topic", "summary": topic.get("summary", ""), "messages": messages})
+            topic_segments.append(topic["messages"] if aligned else [])
+        hist_data = {
+            "_cls": "History",
+            "counter": hist.get("counter", 0),
+            "bulks": [
+                json.loads(files.read_file(os.path.join(segments_folder, name)))
+                for name in hist["bulks"]
+            ],
+            "topics": topics[:-1],
+            "current": topics[-1],
+        }
+        agents.append({**ag, "history": hist_data})
+
+    context = _deserialize_context(
+        {**data, "agents": agents, "log": {**log_data, "logs": log_items}}
+    )
+
+    # the loaded records are what the segments on disk hold
+    loaded_topics: list[history.Topic] = []
+    agent = context.agent0
+    for ag in data.get("agents", []):
+        if not agent:
+            break
+        for bulk, name in zip(agent.history.bulks, ag["history"]["bulks"]):
+            saved.bulks[id(bulk)] = (bulk, bulk.version, name)
+        loaded_topics += agent.history.topics + [agent.history.current]
+        agent = agent.data.get(Agent.DATA_NAME_SUBORDINATE, None)
+    for topic, names in zip(loaded_topics, topic_segments):
+        for index, name in enumerate(names):
+            count = len(topic.messages[index * MESSAGES_PER_SEGMENT :][:MESSAGES_PER_SEGMENT])
+            saved.messages[(id(topic), index)] = (topic, topic.version, count, name)
+    if log_aligned:
+        saved.log_guid = context.log.guid
+        saved.log_version = context.log.version
+        saved.log_segments = dict(enumerate(log_data.get("segments", [])))
+    with _saved_chats_lock:
+        _saved_chats[context.id] = saved
+    return context
+
+
 def _deserialize_context(data):
     config = initialize_agent()
     log = _deserialize_log(data.get("log", None))
@@ -231,9 +573,14 @@ def _deserialize_agents(
             context=context,
         )
         current.data = ag.get("data", {})
-        current.history = history.deserialize_history(
-            ag.get("history", ""), agent=current
-        )
+        hist = ag.get("history", "")
+        if isinstance(hist, dict):
+            # already parsed, e.g. assembled from segments
+            current.history = history.History.from_dict(
+                hist, history=history.History(agent=current)
+            )
+        else:
+            current.history = history.deserialize_history(hist, agent=current)
         if not zero:
             zero = current
 
@@ -282,12 +629,26 @@ def _deserialize_log(data: dict[str, Any]) -> "Log":
                 id=item_data.get("id"),
             )
         )
-        log.updates.append(i)
+        log.touch(i)
         i += 1
 
     return log
 
 
+def _write_file_atomic(path: str, content: str):
+    """Write through a temporary file in the same folder and rename it over the target."""
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content.encode("utf-8", "replace"))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
 def _safe_json_serialize(obj, **kwargs):
     def serializer(o):
         if isinstance(o, dict):
@@ -0,0 +1,378 @@
+import ast
+import os
+import re
+from dataclasses import dataclass
+from typing import Any
+
+from simpleeval import SimpleEval
+
+from helpers import cache, files, modules
+from helpers.print_style import PrintStyle
+
+# (file name, directories) -> absolute path of the first match, None for missing variables plugins
+PROMPT_FILES_CACHE_AREA = "prompt_files(prompts)"
+# (absolute path, encoding) -> PromptTemplate, validated against the file mtime on every use
+PROMPT_TEMPLATES_CACHE_AREA = "prompt_templates(prompts)"
+# absolute path -> (mtime, VariablesPlugin classes)
+PROMPT_VARIABLES_CACHE_AREA = "prompt_variables(prompts)"
+
+# same syntax as files.evaluate_text_conditions and files.process_includes
+_IF = re.compile(r"{{\s*if\s+(.*?)}}", flags=re.DOTALL)
+_IF_TOKEN = re.compile(r"{{\s*(if\b.*?|endif)\s*}}", flags=re.DOTALL)
+_TOKEN = re.compile(
+    r"(?P<original>{{\s*include\s+original\s*}})"
+    r"|{{\s*include\s*['\"](?P<include>.*?)['\"]\s*}}"
+    r"|{{(?P<name>[^{}]*)}}"
+)
+
+_MISSING = object()
+
+
+@dataclass(slots=True)
+class _Placeholder:
+    name: str
+    raw: str
+
+
+@dataclass(slots=True)
+class _Include:
+    path: str
+    raw: str
+
+
+@dataclass(slots=True)
+class _IncludeOriginal:
+    raw: str
+
+
+@dataclass(slots=True)
+class _Condition:
+    condition: str
+    tree: ast.AST | None  # None when the condition does not parse
+    body: list
+    fallback: list  # text from this block to the end, kept unprocessed when the condition fails
+
+
+class _Fallback(Exception):
+    """Inserted text contains template syntax, only the string based pipeline renders it faithfully."""
+
+
+class PromptTemplate:
+    """Prompt file parsed once into literal text, placeholders, conditions and includes."""
+
+    def __init__(self, path: str, source: str, mtime_ns: int = 0, size: int = 0):
+        self.path = path
+        self.source = source
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.names: set[str] = set()
+        self.parts = self._compile_conditions(source)
+        self._json: tuple[bool, str] | None = None
+
+    @property
+    def is_json(self) -> bool:
+        return self._json_source()[0]
+
+    @property
+    def unfenced(self) -> str:
+        return self._json_source()[1]
+
+    def _json_source(self) -> tuple[bool, str]:
+        # used by files.parse_file, which substitutes JSON templates without conditions
+        if self._json is None:
+            self._json = (
+                files.is_full_json_template(self.source),
+                files.remove_code_fences(self.source),
+            )
+        return self._json
+
+    def render(
+        self,
+        variables: dict[str, Any],
+        directories: list[str],
+        source_file: str = "",
+        **kwargs,
+    ) -> str:
+        """Render with the variables, includes are rendered with kwargs only, like files.process_includes."""
+        values: dict[str, str] = {}
+        for name in self.names:
+            value = variables.get(name, _MISSING)
+            if value is _MISSING:
+                continue
+            values[name] = text = str(value)
+            if "{{" in text:
+                return self._render_text(variables, directories, source_file, kwargs)
+
+        output: list[str] = []
+        try:
+            self._render(self.parts, output, variables, values, directories, source_file, kwargs, [None])
+        except _Fallback:
+            return self._render_text(variables, directories, source_file, kwargs)
+        return "".join(output)
+
+    def _render(self, parts, output, variables, values, directories, source_file, kwargs, evaluator):
+        for part in parts:
+            if isinstance(part, str):
+                output.append(part)
+            elif isinstance(part, _Placeholder):
+                output.append(values.get(part.name, part.raw))
+            elif isinstance(part, _Include):
+                output.append(self._render_include(part, variables, directories, kwargs))
+            elif isinstance(part, _IncludeOriginal):
+                output.append(self._render_original(part, directories, source_file, kwargs))
+            else:
+                if evaluator[0] is None:
+                    evaluator[0] = SimpleEval(names=variables)
+                try:
+                    if part.tree is None:
+                        raise SyntaxError(part.condition)
+                    result = evaluator[0].eval(part.condition, previously_parsed=part.tree)
+                except Exception:
+                    # On evaluation error, the rest of the text stays as it is
+                    self._render(part.fallback, output, variables, values, directories, source_file, kwargs, evaluator)
+                    return
+                if result:
+                    self._render(part.body, output, variables, values, directories, source_file, kwargs, evaluator)
+
+    def _render_include(self, part: _Include, variables: dict[str, Any], directories: list[str], kwargs: dict):
+        path, raw = part.path, part.raw
+        if "{{" in path:
+            path = files.replace_placeholders_text(path, **variables)
+            raw = files.replace_placeholders_text(raw, **variables)
+        if os.path.isabs(path):
+            return raw
+        try:
+            return render_prompt_file(path, directories, **kwargs)
+        except FileNotFoundError:
+            return raw
+
+    def _render_original(self, part: _IncludeOriginal, directories: list[str], source_file: str, kwargs: dict):
+        if not source_file:
+            return part.raw
+        remaining_dirs = files._get_dirs_after(directories, os.path.dirname(self.path))
+        if not remaining_dirs:
+            return ""
+        try:
+            text = render_prompt_file(source_file, remaining_dirs, **kwargs)
+        except FileNotFoundError:
+            return ""
+        if "{{" in text:
+            # named includes in the included text are expanded by the string pipeline
+            raise _Fallback()
+        return text
+
+    def _render_text(self, variables: dict[str, Any], directories: list[str], source_file: str, kwargs: dict) -> str:
+        content = files.evaluate_text_conditions(self.source, **variables)
+        content = files.replace_placeholders_text(content, **variables)
+        return files.process_includes(
+            content,
+            directories,
+            _source_file=source_file,
+            _source_dir=os.path.dirname(self.path) if source_file else "",
+            **kwargs,
+        )
+
+    def _compile_conditions(self, text: str) -> list:
+        # mirrors files.evaluate_text_conditions
+        parts: list = []
+        while True:
+            m_if = _IF.search(text)
+            if not m_if:
+                break
+
+            depth = 1
+            pos = m_if.end()
+            while True:
+                m = _IF_TOKEN.search(text, pos)
+                if not m:
+                    break
+                depth += 1 if m.group(1).startswith("if ") else -1
+                if depth == 0:
+                    break
+                pos = m.end()
+            if not m:
+                # Unterminated if-block, do not modify text
+                break
+
+            condition = m_if.group(1).strip()
+            try:
+                tree = SimpleEval.parse(condition)
+            except Exception:
+                tree = None
+            parts.extend(self._compile_text(text[: m_if.start()]))
+            parts.append(
+                _Condition(
+                    condition=condition,
+                    tree=tree,
+                    body=self._compile_conditions(text[m_if.end() : m.start()]),
+                    fallback=self._compile_text(text[m_if.start() :]),
+                )
+            )
+            text = text[m.end() :]
+
+        parts.extend(self._compile_text(text))
+        return parts
+
+    def _compile_text(self, text: str) -> list:
+        parts: list = []
+        pos = 0
+        for match in _TOKEN.finditer(text):
+            if match.start() > pos:
+                parts.append(text[pos : match.start()])
+            if match.group("original") is not None:
+                parts.append(_IncludeOriginal(raw=match.group(0)))
+            elif match.group("include") is not None:
+                include = _Include(path=match.group("include"), raw=match.group(0))
+                self.names.update(name for name in re.findall(r"{{([^{}]*)}}", include.raw))
+                parts.append(include)
+            else:
+                self.names.add(match.group("name"))
+                parts.append(_Placeholder(name=match.group("name"), raw=match.group(0)))
+            pos = match.end()
+        if pos < len(text):
+            parts.append(text[pos:])
+        return parts
+
+
+def render_prompt_file(
+    _file: str, _directories: list[str] | None = None, _encoding="utf-8", **kwargs
+) -> str:
+    if _directories is None:
+        _directories = []
+
+    # If filename contains folder path, extract it and add to directories
+    if os.path.dirname(_file):
+        folder_path = os.path.dirname(_file)
+        _file = os.path.basename(_file)
+        _directories = [folder_path] + _directories
+
+    template = get_template(_file, _directories, _encoding)
+
+    variables = load_variables(_file, _directories, **kwargs) or {}
+    variables.update(kwargs)
+
+    return template.render(variables, _directories, _file, **kwargs)
+
+
+def get_template(_file: str, _directories: list[str], _encoding="utf-8") -> PromptTemplate:
+    """Compiled template of the first file found in the directories."""
+    key = (_file, tuple(_directories))
+    path = cache.get(PROMPT_FILES_CACHE_AREA, key)
+    if path is not None:
+        try:
+            return _load_template(path, _encoding)
+        except FileNotFoundError:
+            cache.remove(PROMPT_FILES_CACHE_AREA, key)
+
+    path = files.find_file_in_dirs(_file, _directories)
+    template = _load_template(path, _encoding)
+    cache.add(PROMPT_FILES_CACHE_AREA, key, path)
+    return template
+
+
+def _load_template(path: str, encoding: str) -> PromptTemplate:
+    stat = os.stat(path)
+    key = (path, encoding)
+    template: PromptTemplate | None = cache.get(PROMPT_TEMPLATES_CACHE_AREA, key)
+    if template is None or template.mtime_ns != stat.st_mtime_ns or template.size != stat.st_size:
+        with open(path, "r", encoding=encoding) as f:
+            template = PromptTemplate(path, f.read(), stat.st_mtime_ns, stat.st_size)
+        cache.add(PROMPT_TEMPLATES_CACHE_AREA, key, template)
+    return template
+
+
+def load_variables(file: str, backup_dirs: list[str] | None = None, **kwargs) -> dict[str, Any]:
+    """Variables of the VariablesPlugin next to a .md prompt file, plugin modules are imported once per version."""
+    if not file.endswith(".md"):
+        return {}
+
+    if backup_dirs is None:
+        backup_dirs = []
+
+    plugin_filename = files.basename(file, ".md") + ".py"
+    directories = [files.dirname(file)] + backup_dirs
+    key = (plugin_filename, tuple(directories))
+    plugin_file = cache.get(PROMPT_FILES_CACHE_AREA, key, _MISSING)
+    if plugin_file is _MISSING:
+        try:
+            plugin_file = files.find_file_in_dirs(plugin_filename, directories)
+        except FileNotFoundError:
+            plugin_file = None
+        cache.add(PROMPT_FILES_CACHE_AREA, key, plugin_file)
+    if not plugin_file:
+        return {}
+
+    try:
+        mtime = os.stat(plugin_file).st_mtime_ns
+    except FileNotFoundError:
+        cache.remove(PROMPT_FILES_CACHE_AREA, key)
+        return {}
+    cached = cache.get(PROMPT_VARIABLES_CACHE_AREA, plugin_file)
+    if cached is not None and cached[0] == mtime:
+        classes = cached[1]
+    else:
+        classes = modules.load_classes_from_file(plugin_file, files.VariablesPlugin, one_per_file=False)
+        cache.add(PROMPT_VARIABLES_CACHE_AREA, plugin_file, (mtime, classes))
+
+    for cls in classes:
+        return cls().get_variables(file, backup_dirs, **kwargs)  # type: ignore < abstract class here is ok, it is always a subclass
+    return {}
+
+
+def clear_cache():
+    cache.clear(PROMPT_FILES_CACHE_AREA)
+    cache.clear(PROMPT_TEMPLATES_CACHE_AREA)
+    cache.clear(PROMPT_VARIABLES_CACHE_AREA)
+
+
+def register_watchdogs():
+    from helpers import watchdog, projects, subagents
+
+    def prompts_changed(items: list[watchdog.WatchItem]):
+        clear_cache()
+        PrintStyle.debug("Prompts watchdog triggered:", items)
+
+    # prompts and usr/prompts
+    watchdog.add_watchdog(
+        id="prompts_base",
+        roots=[
+            files.get_abs_path("prompts"),
+            files.get_abs_path(files.USER_DIR, "prompts"),
+        ],
+        handler=prompts_changed,
+    )
+
+    # agents/*/prompts and usr/agents/*/prompts, including plugin agents
+    watchdog.add_watchdog(
+        id="prompts_agents",
+        roots=[
+            files.get_abs_path(subagents.DEFAULT_AGENTS_DIR),
+            files.get_abs_path(subagents.USER_AGENTS_DIR),
+        ],
+        patterns=["*/prompts/*", "*/prompts"],
+        handler=prompts_changed,
+    )
+
+    # plugins/*/prompts and plugins/*/agents/*/prompts
+    watchdog.add_watchdog(
+        id="prompts_plugins",
+        roots=[
+            files.get_abs_path(files.PLUGINS_DIR),
+            files.get_abs_path(files.USER_DIR, files.PLUGINS_DIR),
+        ],
+        patterns=["*/prompts/*", "*/prompts", "*/agents/*/prompts/*", "*/agents/*/prompts"],
+        handler=prompts_changed,
+    )
+
+    # usr/projects/*/.a0proj/prompts and usr/projects/*/.a0proj/agents/*/prompts
+    watchdog.add_watchdog(
+        id="prompts_projects",
+        roots=[files.get_abs_path(projects.PROJECTS_PARENT_DIR)],
+        patterns=[
+            f"*/{projects.PROJECT_META_DIR}/prompts/*",
+            f"*/{projects.PROJECT_META_DIR}/prompts",
+            f"*/{projects.PROJECT_META_DIR}/agents/*/prompts/*",
+            f"*/{projects.PROJECT_META_DIR}/agents/*/prompts",
+        ],
+        handler=prompts_changed,
+    )
@@ -1,57 +1,189 @@
 import asyncio
+import bisect
+import threading
 import time
+from collections import deque
 from typing import Callable, Awaitable
 
+# usage is aggregated into buckets of timeframe / WINDOW_BUCKETS seconds
+WINDOW_BUCKETS = 600
+# upper bounds in seconds of the wait time histogram buckets, last bucket is open ended
+WAIT_HISTOGRAM_BOUNDS = (0.0, 0.1, 0.5, 1, 5, 15, 30, 60)
+
+
+class _SlidingWindow:
+    """Sliding window counter, values are summed into fixed size buckets and the total is kept running."""
+
+    def __init__(self, timeframe: float, resolution: float):
+        self.timeframe = timeframe
+        self.resolution = resolution
+        self.buckets: deque[list[float]] = deque()  # [bucket_end, value]
+        self.total: float = 0
+
+    def add(self, now: float, value: float):
+        end = (now // self.resolution + 1) * self.resolution
+        if self.buckets and self.buckets[-1][0] == end:
+            self.buckets[-1][1] += value
+        else:
+            self.buckets.append([end, value])
+        self.total += value
+
+    def expire(self, now: float):
+        cutoff = now - self.timeframe
+        while self.buckets and self.buckets[0][0] <= cutoff:
+            self.total -= self.buckets.popleft()[1]
+        if not self.buckets:
+            self.total = 0
+
+    def time_until_within(self, limit: float, now: float) -> float:
+        # seconds until enough of the oldest usage expires for the total to fit the limit
+        excess = self.total - limit
+        if excess <= 0:
+            return 0
+        for end, value in self.buckets:
+            excess -= value
+            if excess <= 0:
+                return max(0.0, end + self.timeframe - now)
+        return self.timeframe
+
+
+class _Waiter:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.turn: asyncio.Future = loop.create_future()
+
+    def wake(self):
+        def _set():
+            if not self.turn.done():
+                self.turn.set_result(None)
+
+        try:
+            self.loop.call_soon_threadsafe(_set)
+        except RuntimeError:
+            pass  # loop already closed, waiter is gone
+
 
 class RateLimiter:
     def __init__(self, seconds: int = 60, **limits: int):
         self.timeframe = seconds
         self.limits = {key: value if isinstance(value, (int, float)) else 0 for key, value in (limits or {}).items()}
-        self.values = {key: [] for key in self.limits.keys()}
-        self._lock = asyncio.Lock()
+        self.values: dict[str, _SlidingWindow] = {key: self._new_window() for key in self.limits.keys()}
+        # state is shared by agents running on different event loops, so a thread lock guards it
+        self._lock = threading.Lock()
+        self._waiters: deque[_Waiter] = deque()
+        self._wait_histogram = [0] * (len(WAIT_HISTOGRAM_BOUNDS) + 1)
+        self._wait_count = 0
+        self._wait_total = 0.0
+
+    def _new_window(self) -> _SlidingWindow:
+        return _SlidingWindow(self.timeframe, self.timeframe / WINDOW_BUCKETS)
 
     def add(self, **kwargs: int):
         now = time.time()
-        for key, value in kwargs.items():
-            if not key in self.values:
-                self.values[key] = []
-            self.values[key].append((now, value))
+        with self._lock:
+            for key, value in kwargs.items():
+                if not key in self.values:
+                    self.values[key] = self._new_window()
+                self.values[key].add(now, value)
 
     async def cleanup(self):
-        async with self._lock:
-            now = time.time()
-            cutoff = now - self.timeframe
-            for key in self.values:
-                self.values[key] = [(t, v) for t, v in self.values[key] if t > cutoff]
+        with self._lock:
+            self._expire(time.time())
 
     async def get_total(self, key: str) -> int:
-        async with self._lock:
+        with self._lock:
             if not key in self.values:
                 return 0
-            return sum(value for _, value in self.values[key])
+            window = self.values[key]
+            window.expire(time.time())
+            return int(window.total)
+
+    def _expire(self, now: float):
+        for window in self.values.values():
+            window.expire(now)
+
+    def _check(self) -> tuple[str, int, int, float] | None:
+        # first exceeded limit as (key, total, limit, seconds until it fits), None when within limits
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            for key, limit in self.limits.items():
+                if limit <= 0:  # Skip if no limit set
+                    continue
+                window = self.values.get(key)
+                if window and window.total > limit:
+                    return key, int(window.total), limit, window.time_until_within(limit, now)
+        return None
 
     async def wait(
         self,
         callback: Callable[[str, str, int, int], Awaitable[bool]] | None = None,
     ):
-        while True:
-            await self.cleanup()
-            should_wait = False
+        # fast path, nobody queued and no limit exceeded
+        with self._lock:
+            idle = not self._waiters
+        if idle and self._check() is None:
+            self._record_wait(0)
+            return
 
-            for key, limit in self.limits.items():
-                if limit <= 0:  # Skip if no limit set
-                    continue
+        waiter = _Waiter(asyncio.get_running_loop())
+        started = time.monotonic()
+        with self._lock:
+            self._waiters.append(waiter)
+            if self._waiters[0] is waiter:
+                waiter.turn.set_result(None)
 
-                total = await self.get_total(key)
-                if total > limit:
-                    if callback:
-                        msg = f"Rate limit exceeded for {key} ({total}/{limit}), waiting..."
-                        should_wait = not await callback(msg, key, total, limit)
-                    else:
-                        should_wait = True
+        try:
+            # waiters are served first in first out, only the head checks the limits
+            await waiter.turn
+            while True:
+                exceeded = self._check()
+                if exceeded is None:
                     break
+                key, total, limit, delay = exceeded
+                if callback:
+                    msg = f"Rate limit exceeded for {key} ({total}/{limit}), waiting..."
+                    if await callback(msg, key, total, limit):
+                        break
+                # sleep exactly until enough usage leaves the window
+                await asyncio.sleep(min(max(delay, 0.01), self.timeframe))
+        finally:
+            self._leave(waiter)
+            self._record_wait(time.monotonic() - started)
+
+    def _leave(self, waiter: _Waiter):
+        with self._lock:
+            was_head = bool(self._waiters) and self._waiters[0] is waiter
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return
+            if was_head and self._waiters:
+                self._waiters[0].wake()
 
-            if not should_wait:
-                break
+    def _record_wait(self, seconds: float):
+        with self._lock:
+            self._wait_histogram[bisect.bisect_left(WAIT_HISTOGRAM_BOUNDS, seconds)] += 1
+            self._wait_count += 1
+            self._wait_total += seconds
 
-            await asyncio.sleep(1)
+    def get_metrics(self) -> dict:
+        with self._lock:
+            self._expire(time.time())
+            return {
+                "usage": {
+                    key: {"total": int(window.total), "limit": self.limits.get(key, 0)}
+                    for key, window in self.values.items()
+                },
+                "queue_depth": len(self._waiters),
+                "waits": {
+                    "count": self._wait_count,
+                    "total_seconds": self._wait_total,
+                    "histogram": {
+                        (f"le_{bound}" if i < len(WAIT_HISTOGRAM_BOUNDS) else "inf"): count
+                        for i, (bound, count) in enumerate(
+                            zip(WAIT_HISTOGRAM_BOUNDS + (None,), self._wait_histogram)
+                        )
+                    },
+                },
+            }
@@ -36,6 +36,37 @@ class EnvLine:
     )
 
 
+class SecretsMasker:
+    """Replaces secret values with placeholders, prepared once per set of secrets.
+
+    Values are ordered longest first so that a secret containing another one is masked
+    as a whole, placeholders are formatted upfront and only values present in the text
+    are replaced.
+    """
+
+    def __init__(
+        self,
+        key_to_value: Dict[str, str],
+        min_length: int = 4,
+        placeholder: str = "§§secret({key})",
+    ):
+        self.replacements: List[Tuple[str, str]] = [
+            (value, alias_for_key(key, placeholder))
+            for key, value in sorted(
+                key_to_value.items(), key=lambda x: len(x[1] or ""), reverse=True
+            )
+            if value and len(value.strip()) >= min_length
+        ]
+
+    def mask(self, text: str) -> str:
+        if not text:
+            return text
+        for value, alias in self.replacements:
+            if value in text:
+                text = text.replace(value, alias)
+        return text
+
+
 class StreamingSecretsFilter:
     """Stateful streaming filter that masks secrets on the fly.
 
@@ -45,7 +76,12 @@ class StreamingSecretsFilter:
     - On finalize(), any unresolved partial is masked with '***'.
     """
 
-    def __init__(self, key_to_value: Dict[str, str], min_trigger: int = 3):
+    def __init__(
+        self,
+        key_to_value: Dict[str, str],
+        min_trigger: int = 3,
+        masker: Optional[SecretsMasker] = None,
+    ):
         self.min_trigger = max(1, int(min_trigger))
         # Map value -> key for placeholder construction
         self.value_to_key: Dict[str, str] = {
@@ -59,20 +95,15 @@ class StreamingSecretsFilter:
             for i in range(self.min_trigger, len(v) + 1):
                 self.prefixes.add(v[:i])
         self.max_len: int = max((len(v) for v in self.secret_values), default=0)
+        # Full values of any length are masked, a shared masker is prepared once per secrets version
+        self.masker = masker or SecretsMasker(key_to_value, min_length=0)
 
         # Internal buffer of pending text that is not safe to flush yet
         self.pending: str = ""
 
     def _replace_full_values(self, text: str) -> str:
         """Replace all full secret values with placeholders in the given text."""
-        # Sort by length desc to avoid partial overlaps
-        for val in sorted(self.secret_values, key=len, reverse=True):
-            if not val:
-                continue
-            key = self.value_to_key.get(val, "")
-            if key:
-                text = text.replace(val, alias_for_key(key))
-        return text
+        return self.masker.mask(text)
 
     def _longest_suffix_prefix(self, text: str) -> int:
         """Return length of longest suffix of text that is a known secret prefix.
@@ -129,6 +160,7 @@ class SecretsManager:
 
     _instances: Dict[Tuple[str, ...], "SecretsManager"] = {}
     _secrets_cache: Optional[Dict[str, str]] = None
+    _maskers: Dict[Tuple[int, str], SecretsMasker] = {}
     _last_raw_text: Optional[str] = None
 
     @classmethod
@@ -146,6 +178,7 @@ class SecretsManager:
         self._files: Tuple[str, ...] = tuple(files) if files else (DEFAULT_SECRETS_FILE,)
         self._raw_snapshots: Dict[str, str] = {}
         self._secrets_cache = None
+        self._maskers = {}
         self._last_raw_text = None
 
     def read_secrets_raw(self) -> str:
@@ -257,7 +290,23 @@ class SecretsManager:
 
     def create_streaming_filter(self) -> "StreamingSecretsFilter":
         """Create a streaming-aware secrets filter snapshotting current secret values."""
-        return StreamingSecretsFilter(self.load_secrets())
+        return StreamingSecretsFilter(
+            self.load_secrets(), masker=self.get_masker(min_length=0)
+        )
+
+    def get_masker(
+        self, min_length: int = 4, placeholder: str = "§§secret({key})"
+    ) -> SecretsMasker:
+        """Masker prepared for the current secrets, rebuilt only after the cache is cleared."""
+        key = (min_length, placeholder)
+        masker = self._maskers.get(key)
+        if masker is None:
+            with self._lock:
+                masker = self._maskers.get(key)
+                if masker is None:
+                    masker = SecretsMasker(self.load_secrets(), min_length, placeholder)
+                    self._maskers[key] = masker
+        return masker
 
     def replace_placeholders(self, text: str) -> str:
         """Replace secret placeholders with actual values"""
@@ -302,18 +351,7 @@ class SecretsManager:
         """Replace actual secret values with placeholders in text"""
         if not text:
             return text
-
-        secrets = self.load_secrets()
-        result = text
-
-        # Sort by length (longest first) to avoid partial replacements
-        for key, value in sorted(
-            secrets.items(), key=lambda x: len(x[1]), reverse=True
-        ):
-            if value and len(value.strip()) >= min_length:
-                result = result.replace(value, alias_for_key(key, placeholder))
-
-        return result
+        return self.get_masker(min_length, placeholder).mask(text)
 
     def get_masked_secrets(self) -> str:
         """Get content with values masked for frontend display (preserves comments and unrecognized lines)"""
@@ -350,6 +388,7 @@ class SecretsManager:
         """Clear the secrets cache"""
         with self._lock:
             self._secrets_cache = None
+            self._maskers = {}
             self._raw_snapshots = {}
             self._last_raw_text = None
 
@@ -13,6 +13,8 @@ from helpers.state_snapshot import (
     StateRequestV1,
     advance_state_request_after_snapshot,
     build_snapshot_from_request,
+    encode_snapshot_delta,
+    get_snapshot_sections,
 )
 from helpers.ws import ConnectionIdentity, ConnectionNotFoundError, _ws_debug_enabled, ws_debug
 from helpers.ws_manager import STATE_PUSH_EVENT
@@ -32,6 +34,9 @@ class ConnectionProjection:
     # pushes indefinitely during continuous activity (throttled coalescing).
     dirty_version: int = 0
     pushed_version: int = 0
+    # Context and task entries the sid received, later pushes only carry changed ones.
+    # None until the first push after a state_request, which sends the full lists.
+    sent_entities: dict[tuple[str, str], dict[str, Any]] | None = None
     # Development-only diagnostics - last known cause of the most recent dirty wave.
     dirty_reason: str | None = None
     dirty_wave_id: str | None = None
@@ -85,6 +90,7 @@ class StateMonitor:
         ws_debug(f"[StateMonitor] unregister_sid namespace={namespace} sid={sid}")
 
     def mark_dirty_all(self, *, reason: str | None = None) -> None:
+        get_snapshot_sections().invalidate()
         wave_id = None
         if _ws_debug_enabled():
             with self._lock:
@@ -99,6 +105,7 @@ class StateMonitor:
         if not isinstance(context_id, str) or not context_id.strip():
             return
         target = context_id.strip()
+        get_snapshot_sections().invalidate()
         wave_id = None
         if _ws_debug_enabled():
             with self._lock:
@@ -129,6 +136,7 @@ class StateMonitor:
             projection.request = request
             projection.seq_base = seq_base
             projection.seq = seq_base
+            projection.sent_entities = None
         ws_debug(
             f"[StateMonitor] update_projection namespace={namespace} sid={sid} context={request.context!r} "
             f"log_from={request.log_from} notifications_from={request.notifications_from} "
@@ -144,6 +152,7 @@ class StateMonitor:
         wave_id: str | None = None,
     ) -> None:
         identity: ConnectionIdentity = (namespace, sid)
+        get_snapshot_sections().invalidate()
         loop = self._dispatcher_loop
         if loop is None or loop.is_closed():
             try:
@@ -269,6 +278,11 @@ class StateMonitor:
                 # Advance cursors after successful snapshot emission (incremental mode).
                 projection.request = advance_state_request_after_snapshot(request, snapshot)
 
+                # Send only the contexts and tasks that changed since the previous push.
+                snapshot, delta, projection.sent_entities = encode_snapshot_delta(
+                    snapshot, projection.sent_entities
+                )
+
                 # Mark all dirties up to `base_version` as pushed. If new dirties
                 # arrived while building/emitting, a follow-up push will be scheduled.
                 projection.pushed_version = max(projection.pushed_version, base_version)
@@ -278,6 +292,8 @@ class StateMonitor:
                 "seq": seq,
                 "snapshot": snapshot,
             }
+            if delta is not None:
+                payload["delta"] = delta
 
             try:
                 logs_len = (
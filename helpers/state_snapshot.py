@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import threading
+import time
 import types
-from typing import Any, Mapping, TypedDict, Union, get_args, get_origin, get_type_hints
+from typing import Any, Callable, Mapping, TypedDict, Union, get_args, get_origin, get_type_hints
 
 from dataclasses import dataclass
 
@@ -11,7 +13,11 @@ from agent import AgentContext, AgentContextType
 
 from helpers.dotenv import get_dotenv_value
 from helpers.localization import Localization
-from helpers.task_scheduler import TaskScheduler
+from helpers.task_scheduler import TaskScheduler, serialize_task
+
+# Sections computed for one request are reused by requests of the same dirty wave,
+# state changes are signalled by invalidate(), the age limit covers unsignalled ones.
+SECTIONS_MAX_AGE = 1.0
 
 
 class SnapshotV1(TypedDict):
@@ -211,10 +217,140 @@ def advance_state_request_after_snapshot(
     )
 
 
+class SnapshotSections:
+    """Snapshot sections shared by all requests until the next dirty signal.
+
+    Context and task lists are computed once per timezone, logs and notifications once per
+    cursor. Entries equal to the ones of the previous computation keep their identity,
+    so pushes can tell cheaply which entries changed since they were last sent."""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._cache: dict[tuple, tuple[int, float, Any]] = {}
+        # last entry per (kind, id), per timezone
+        self._entries: dict[str, dict[tuple[str, str], dict[str, Any]]] = {}
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def get_lists(self, timezone: str) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        return self._get(("lists", timezone), lambda: self._build_lists(timezone))
+
+    def get_logs(self, context: AgentContext, start: int, timezone: str):
+        return self._get(
+            ("logs", context.id, start, timezone), lambda: context.log.output(start=start)
+        )
+
+    def get_notifications(self, start: int, timezone: str) -> tuple[list[dict[str, Any]], int]:
+        def build():
+            manager = AgentContext.get_notification_manager()
+            return manager.output(start=start), len(manager.updates)
+
+        return self._get(("notifications", start, timezone), build)
+
+    def _get(self, key: tuple, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            generation = self._generation
+            cached = self._cache.get(key)
+            if (
+                cached is not None
+                and cached[0] == generation
+                and time.monotonic() - cached[1] < SECTIONS_MAX_AGE
+            ):
+                return cached[2]
+        value = build()
+        with self._lock:
+            # state changed while building, the next request builds again
+            if self._generation == generation:
+                self._cache[key] = (generation, time.monotonic(), value)
+        return value
+
+    def _build_lists(self, timezone: str) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        scheduler = TaskScheduler.get()
+        tasks_by_uuid = {task.uuid: task for task in scheduler.get_tasks()}
+        with self._lock:
+            previous = self._entries.get(timezone, {})
+        entries: dict[tuple[str, str], dict[str, Any]] = {}
+
+        ctxs: list[dict[str, Any]] = []
+        tasks: list[dict[str, Any]] = []
+        processed_contexts: set[str] = set()
+
+        for ctx in AgentContext.all():
+            if ctx.id in processed_contexts:
+                continue
+            processed_contexts.add(ctx.id)
+
+            if ctx.type == AgentContextType.BACKGROUND:
+                continue
+
+            context_data = ctx.output()
+
+            context_task = tasks_by_uuid.get(ctx.id)
+            is_task_context = context_task is not None and context_task.context_id == ctx.id
+
+            if not is_task_context:
+                key = ("contexts", ctx.id)
+                target = ctxs
+            else:
+                task_details = serialize_task(context_task)  # type: ignore[arg-type]
+                if task_details:
+                    context_data.update(
+                        {
+                            "task_name": task_details.get("name"),
+                            "uuid": task_details.get("uuid"),
+                            "state": task_details.get("state"),
+                            "type": task_details.get("type"),
+                            "system_prompt": task_details.get("system_prompt"),
+                            "prompt": task_details.get("prompt"),
+                            "last_run": task_details.get("last_run"),
+                            "last_result": task_details.get("last_result"),
+                            "attachments": task_details.get("attachments", []),
+                            "context_id": task_details.get("context_id"),
+                        }
+                    )
+
+                    if task_details.get("type") == "scheduled":
+                        context_data["schedule"] = task_details.get("schedule")
+                    elif task_details.get("type") == "planned":
+                        context_data["plan"] = task_details.get("plan")
+                    else:
+                        context_data["token"] = task_details.get("token")
+
+                key = ("tasks", ctx.id)
+                target = tasks
+
+            # reuse the previous entry if nothing changed
+            last = previous.get(key)
+            if last is not None and last == context_data:
+                context_data = last
+            entries[key] = context_data
+            target.append(context_data)
+
+        with self._lock:
+            self._entries[timezone] = entries
+
+        ctxs.sort(key=lambda x: x["created_at"], reverse=True)
+        tasks.sort(key=lambda x: x["created_at"], reverse=True)
+        return ctxs, tasks
+
+
+_sections = SnapshotSections()
+
+
+def get_snapshot_sections() -> SnapshotSections:
+    return _sections
+
+
 async def build_snapshot_from_request(*, request: StateRequestV1) -> SnapshotV1:
     """Build a poll-shaped snapshot for both /poll and state_push."""
 
     Localization.get().set_timezone(request.timezone)
+    timezone = Localization.get().get_timezone()
+    sections = get_snapshot_sections()
 
     ctxid = request.context if isinstance(request.context, str) else ""
     ctxid = ctxid.strip()
@@ -225,7 +361,7 @@ async def build_snapshot_from_request(*, request: StateRequestV1) -> SnapshotV1:
     active_context = AgentContext.get(ctxid) if ctxid else None
 
     if active_context:
-        log_output = active_context.log.output(start=from_no)
+        log_output = sections.get_logs(active_context, from_no, timezone)
         logs = log_output.items
         log_end = log_output.end
     else:
@@ -233,82 +369,67 @@ async def build_snapshot_from_request(*, request: StateRequestV1) -> SnapshotV1:
         log_end = 0
 
     notification_manager = AgentContext.get_notification_manager()
-    notifications = notification_manager.output(start=notifications_from_no)
-
-    scheduler = TaskScheduler.get()
-
-    ctxs: list[dict[str, Any]] = []
-    tasks: list[dict[str, Any]] = []
-    processed_contexts: set[str] = set()
-
-    all_ctxs = AgentContext.all()
-    for ctx in all_ctxs:
-        if ctx.id in processed_contexts:
-            continue
+    notifications, notifications_version = sections.get_notifications(
+        notifications_from_no, timezone
+    )
 
-        if ctx.type == AgentContextType.BACKGROUND:
-            processed_contexts.add(ctx.id)
-            continue
-
-        context_data = ctx.output()
-
-        context_task = scheduler.get_task_by_uuid(ctx.id)
-        is_task_context = context_task is not None and context_task.context_id == ctx.id
-
-        if not is_task_context:
-            ctxs.append(context_data)
-        else:
-            task_details = scheduler.serialize_task(ctx.id)
-            if task_details:
-                context_data.update(
-                    {
-                        "task_name": task_details.get("name"),
-                        "uuid": task_details.get("uuid"),
-                        "state": task_details.get("state"),
-                        "type": task_details.get("type"),
-                        "system_prompt": task_details.get("system_prompt"),
-                        "prompt": task_details.get("prompt"),
-                        "last_run": task_details.get("last_run"),
-                        "last_result": task_details.get("last_result"),
-                        "attachments": task_details.get("attachments", []),
-                        "context_id": task_details.get("context_id"),
-                    }
-                )
-
-                if task_details.get("type") == "scheduled":
-                    context_data["schedule"] = task_details.get("schedule")
-                elif task_details.get("type") == "planned":
-                    context_data["plan"] = task_details.get("plan")
-                else:
-                    context_data["token"] = task_details.get("token")
-
-            tasks.append(context_data)
-
-        processed_contexts.add(ctx.id)
-
-    ctxs.sort(key=lambda x: x["created_at"], reverse=True)
-    tasks.sort(key=lambda x: x["created_at"], reverse=True)
+    ctxs, tasks = sections.get_lists(timezone)
 
     snapshot: SnapshotV1 = {
         "deselect_chat": bool(ctxid) and active_context is None,
         "context": active_context.id if active_context else "",
-        "contexts": ctxs,
-        "tasks": tasks,
-        "logs": logs,
+        # lists are shared with other requests, copies keep them safe from callers
+        "contexts": list(ctxs),
+        "tasks": list(tasks),
+        "logs": list(logs),
         "log_guid": active_context.log.guid if active_context else "",
         "log_version": log_end,
         "log_progress": active_context.log.progress if active_context else 0,
         "log_progress_active": bool(active_context.log.progress_active) if active_context else False,
         "paused": active_context.paused if active_context else False,
-        "notifications": notifications,
+        "notifications": list(notifications),
         "notifications_guid": notification_manager.guid,
-        "notifications_version": len(notification_manager.updates),
+        "notifications_version": notifications_version,
     }
 
     validate_snapshot_schema_v1(snapshot)
     return snapshot
 
 
+def encode_snapshot_delta(
+    snapshot: SnapshotV1,
+    sent: dict[tuple[str, str], dict[str, Any]] | None,
+) -> tuple[SnapshotV1, dict[str, Any] | None, dict[tuple[str, str], dict[str, Any]]]:
+    """
+    Reduce the context and task lists of a snapshot to the entries changed since sent.
+
+    Returns the snapshot to send, the delta describing removed entries (None for a full
+    snapshot when nothing was sent before) and the entries now known to the receiver.
+    """
+    current: dict[tuple[str, str], dict[str, Any]] = {}
+    for kind in ("contexts", "tasks"):
+        for entry in snapshot[kind]:  # type: ignore[literal-required]
+            current[(kind, entry.get("id", ""))] = entry
+    if sent is None:
+        return snapshot, None, current
+
+    changed = {
+        key
+        for key, entry in current.items()
+        if (last := sent.get(key)) is None or (last is not entry and last != entry)
+    }
+    delta: dict[str, Any] = {
+        f"{kind}_removed": [id for (k, id) in sent if k == kind and (k, id) not in current]
+        for kind in ("contexts", "tasks")
+    }
+    encoded: SnapshotV1 = {
+        **snapshot,
+        "contexts": [e for e in snapshot["contexts"] if ("contexts", e.get("id", "")) in changed],
+        "tasks": [e for e in snapshot["tasks"] if ("tasks", e.get("id", "")) in changed],
+    }
+    return encoded, delta, current
+
+
 async def build_snapshot(
     *,
     context: str | None,
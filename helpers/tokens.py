@@ -1,27 +1,139 @@
-from typing import Literal
+from collections import OrderedDict
+import hashlib
+import threading
+from typing import Literal, Sequence
 import tiktoken
 
 APPROX_BUFFER = 1.1
 TRIM_BUFFER = 0.8
+DEFAULT_ENCODING = "cl100k_base"
 
+# cheap estimator for hot paths like streaming deltas, roughly matches cl100k on english/code
+ESTIMATE_CHARS_PER_TOKEN = 4.0
 
-def count_tokens(text: str, encoding_name="cl100k_base") -> int:
+# texts shorter than this are encoded directly, hashing them would cost more than it saves
+CACHE_MIN_CHARS = 256
+CACHE_MAX_ENTRIES = 4096
+BATCH_NUM_THREADS = 8
+
+
+class Tokenizer:
+    """Holds one tiktoken encoder and an LRU of token counts keyed by content hash."""
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, max_entries: int = CACHE_MAX_ENTRIES):
+        self.encoding_name = encoding_name
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.max_entries = max_entries
+        self._counts: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, text: str) -> list[int]:
+        return self.encoding.encode(text, disallowed_special=())
+
+    def encode_batch(self, texts: Sequence[str]) -> list[list[int]]:
+        return self.encoding.encode_batch(
+            list(texts), num_threads=BATCH_NUM_THREADS, disallowed_special=()
+        )
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if len(text) < CACHE_MIN_CHARS:
+            return len(self.encode(text))
+
+        key = _content_key(text)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+        count = len(self.encode(text))
+        self._set_cached(key, count)
+        return count
+
+    def count_many(self, texts: Sequence[str]) -> list[int]:
+        results: list[int] = [0] * len(texts)
+        missing_idx: list[int] = []
+        missing_keys: list[bytes | None] = []
+
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            key = _content_key(text) if len(text) >= CACHE_MIN_CHARS else None
+            cached = self._get_cached(key) if key else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing_idx.append(i)
+                missing_keys.append(key)
+
+        if missing_idx:
+            encoded = self.encode_batch([texts[i] for i in missing_idx])
+            for i, key, toks in zip(missing_idx, missing_keys, encoded):
+                results[i] = len(toks)
+                if key:
+                    self._set_cached(key, results[i])
+
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+    def _get_cached(self, key: bytes) -> int | None:
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+            return count
+
+    def _set_cached(self, key: bytes, count: int):
+        with self._lock:
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+
+
+_tokenizers: dict[str, Tokenizer] = {}
+_tokenizers_lock = threading.Lock()
+
+
+def get_tokenizer(encoding_name: str = DEFAULT_ENCODING) -> Tokenizer:
+    tokenizer = _tokenizers.get(encoding_name)
+    if tokenizer is None:
+        with _tokenizers_lock:
+            tokenizer = _tokenizers.get(encoding_name)
+            if tokenizer is None:
+                tokenizer = _tokenizers[encoding_name] = Tokenizer(encoding_name)
+    return tokenizer
+
+
+def count_tokens(text: str, encoding_name=DEFAULT_ENCODING) -> int:
     if not text:
         return 0
+    return get_tokenizer(encoding_name).count(text)
+
 
-    # Get the encoding
-    encoding = tiktoken.get_encoding(encoding_name)
+def count_many(texts: Sequence[str], encoding_name=DEFAULT_ENCODING) -> list[int]:
+    return get_tokenizer(encoding_name).count_many(texts)
 
-    # Encode the text and count the tokens
-    tokens = encoding.encode(text, disallowed_special=())
-    token_count = len(tokens)
 
-    return token_count
+def encode_batch(texts: Sequence[str], encoding_name=DEFAULT_ENCODING) -> list[list[int]]:
+    return get_tokenizer(encoding_name).encode_batch(texts)
+
+
+def estimate_tokens(text: str) -> int:
+    # no encoding at all, only for places where an exact number is not needed
+    if not text:
+        return 0
+    return int(len(text) / ESTIMATE_CHARS_PER_TOKEN * APPROX_BUFFER) or 1
 
 
 def approximate_tokens(
     text: str,
+    mode: Literal["count", "estimate"] = "count",
 ) -> int:
+    if mode == "estimate":
+        return estimate_tokens(text)
     return int(count_tokens(text) * APPROX_BUFFER)
 
 
@@ -42,3 +154,7 @@ def trim_to_tokens(
     if direction == "start":
         return text[:approx_chars] + ellipsis
     return ellipsis + text[chars - approx_chars : chars]
+
+
+def _content_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
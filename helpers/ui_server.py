@@ -33,7 +33,7 @@ from helpers.print_style import PrintStyle
 from helpers.server_startup import StartupMonitor
 from helpers import settings as settings_helper
 from helpers.ws import register_ws_namespace, validate_ws_origin
-from helpers.ws_manager import WsManager, set_shared_ws_manager
+from helpers.ws_manager import WsJson, WsManager, set_shared_ws_manager
 
 
 UPLOAD_LIMIT_BYTES = 5 * 1024 * 1024 * 1024
@@ -88,6 +88,7 @@ class UiServerRuntime:
             ping_interval=25,
             ping_timeout=20,
             max_http_buffer_size=50 * 1024 * 1024,
+            json=WsJson,
         )
 
         ws_manager = WsManager(socketio_server, lock)
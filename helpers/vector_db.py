@@ -1,3 +1,5 @@
+import asyncio
+import operator
 from typing import Any, List, Sequence
 from langchain_community.vectorstores import FAISS
 
@@ -7,19 +9,229 @@ import faiss
 
 
 from langchain_core.documents import Document
-from langchain.storage import InMemoryByteStore
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores.utils import (
     DistanceStrategy,
 )
-from langchain.embeddings import CacheBackedEmbeddings
 from simpleeval import simple_eval
+import numpy as np
 
 from agent import Agent
-from helpers import guids
+from helpers import guids, embedding_cache, metadata_index
+from helpers.embedding_cache import CachedEmbeddings
+from helpers.metadata_index import MetadataFilter, MetadataIndex
 
 
 class MyFaiss(FAISS):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # labels of deleted vectors still stored in an index that can not remove them
+        self._tombstones: set[int] = set()
+        self.metadata_index = MetadataIndex()
+        self.metadata_index.rebuild(self.get_all_docs())
+
+    # labels are resolved from docstore ids lazily, any change of the mapping drops the reverse lookup
+    @property
+    def index_to_docstore_id(self) -> dict[int, str]:
+        return self._index_to_docstore_id
+
+    @index_to_docstore_id.setter
+    def index_to_docstore_id(self, value: dict[int, str]):
+        self._index_to_docstore_id = value
+        self._labels: dict[str, int] | None = None
+
+    # override FAISS.__add to keep the metadata index in sync
+    def _FAISS__add(self, texts, embeddings, metadatas=None, ids=None):
+        ids = super()._FAISS__add(texts, embeddings, metadatas=metadatas, ids=ids)  # type: ignore
+        self._on_added(ids)
+        return ids
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        result = super().delete(ids, **kwargs)
+        self._on_deleted(ids or [])
+        return result
+
+    def _on_added(self, ids: list[str]):
+        self._labels = None
+        docs = self.get_all_docs()
+        for id in ids:
+            self.metadata_index.add(id, docs[id].metadata)
+
+    def _on_deleted(self, ids: list[str]):
+        self._labels = None
+        for id in ids:
+            self.metadata_index.remove(id)
+
+    def _get_labels(self, ids: Sequence[str]) -> list[int]:
+        if self._labels is None:
+            self._labels = {id: label for label, id in self.index_to_docstore_id.items()}
+        return [self._labels[id] for id in ids if id in self._labels]
+
+    # override search, filters planned by the metadata index only search matching vectors
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Any = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ):
+        return self.similarity_search_with_score_by_vectors(
+            [embedding], k=k, filter=filter, fetch_k=fetch_k, **kwargs
+        )[0]
+
+    def similarity_search_with_score_by_vectors(
+        self,
+        embeddings: Sequence[List[float]],
+        k: int = 4,
+        filter: Any = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> list[list[tuple[Document, float]]]:
+        """Search several query vectors at once, a planned filter restricts them all to the same subset."""
+        planned = filter.candidates(self.metadata_index) if isinstance(filter, MetadataFilter) else None
+        if planned is None and not self._tombstones:
+            results = []
+            for embedding in embeddings:
+                results.append(
+                    super().similarity_search_with_score_by_vector(
+                        embedding, k=k, filter=filter, fetch_k=fetch_k, **kwargs
+                    )
+                )
+            return results
+
+        if planned is None:
+            # unplanned filters are evaluated per result, deleted vectors are skipped by the index
+            exact = filter is None
+            params, _selector = metadata_index.exclude_params(self.index, self._tombstones)
+            total = len(self.index_to_docstore_id)
+        else:
+            ids, exact = planned
+            labels = self._get_labels(list(ids))
+            params, _selector = metadata_index.search_params(self.index, labels)
+            total = len(labels)
+        if not total:
+            return [[] for _ in embeddings]
+        filter_func = None if exact else self._create_filter_func(filter)
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        # inexact plans still evaluate the condition, fetch extra results for that
+        count = min(total, k if exact else max(k, fetch_k))
+        scores, indices = self.index.search(vectors, count, params=params)
+
+        score_threshold = kwargs.get("score_threshold")
+        cmp = (
+            operator.ge
+            if self.distance_strategy
+            in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+            else operator.le
+        )
+        all_docs = self.get_all_docs()
+        results = []
+        for row_scores, row_labels in zip(scores, indices):
+            docs = []
+            for score, label in zip(row_scores, row_labels):
+                if label == -1:
+                    continue
+                doc = all_docs.get(self.index_to_docstore_id[label])
+                if doc is None or (filter_func and not filter_func(doc.metadata)):
+                    continue
+                if score_threshold is not None and not cmp(score, score_threshold):
+                    continue
+                docs.append((doc, score))
+            results.append(docs[:k])
+        return results
+
+    def similarity_search_with_relevance_by_quotas(
+        self,
+        embedding: List[float],
+        quotas: Sequence[tuple[Any, int]],
+        score_threshold: float,
+    ) -> list[list[tuple[Document, float]]]:
+        """
+        Top results of one query vector for several (filter, k) quotas, with relevance scores.
+
+        When all filters are planned by the metadata index, their candidates are searched together
+        and the results are split per filter, the search only grows while a quota is unfilled
+        and the results still pass the threshold.
+        """
+        relevance_score_fn = self._select_relevance_score_fn()
+        plans = [
+            filter.candidates(self.metadata_index) if isinstance(filter, MetadataFilter) else None
+            for filter, _k in quotas
+        ]
+        if any(plan is None for plan in plans):
+            results = []
+            for filter, k in quotas:
+                docs = self.similarity_search_with_score_by_vector(embedding, k=k, filter=filter)
+                results.append(
+                    [(doc, relevance_score_fn(score)) for doc, score in docs
+                     if relevance_score_fn(score) >= score_threshold]
+                )
+            return results
+
+        label_quotas: dict[int, list[int]] = {}
+        for i, (ids, _exact) in enumerate(plans):  # type: ignore
+            for label in self._get_labels(list(ids)):
+                label_quotas.setdefault(label, []).append(i)
+        results: list[list[tuple[Document, float]]] = [[] for _ in quotas]
+        if not label_quotas:
+            return results
+
+        params, _selector = metadata_index.search_params(self.index, label_quotas)
+        vector = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+        all_docs = self.get_all_docs()
+        total = len(label_quotas)
+        count = min(total, sum(k for _filter, k in quotas))
+        while True:
+            scores, indices = self.index.search(vector, count, params=params)
+            results = [[] for _ in quotas]
+            below_threshold = False
+            for score, label in zip(scores[0], indices[0]):
+                if label == -1:
+                    continue
+                relevance = relevance_score_fn(score)
+                if relevance < score_threshold:
+                    # results are ordered by relevance, the rest scores lower
+                    below_threshold = True
+                    break
+                doc = all_docs.get(self.index_to_docstore_id[label])
+                if doc is None:
+                    continue
+                for i in label_quotas[label]:
+                    filter, k = quotas[i]
+                    if len(results[i]) < k and (plans[i][1] or filter(doc.metadata)):  # type: ignore
+                        results[i].append((doc, relevance))
+            filled = all(len(docs) >= k for docs, (_filter, k) in zip(results, quotas))
+            if filled or below_threshold or count >= total:
+                return results
+            count = min(total, count * 4)
+
+    def search_by_metadata(self, filter: Any, limit: int = 0) -> list[Document]:
+        all_docs = self.get_all_docs()
+        planned = filter.candidates(self.metadata_index) if isinstance(filter, MetadataFilter) else None
+        if planned is None:
+            candidates, exact = list(all_docs.values()), False
+        else:
+            ids, exact = planned
+            # same order as a full scan of the docstore
+            candidates = [
+                all_docs[self.index_to_docstore_id[label]]
+                for label in sorted(self._get_labels(list(ids)))
+            ]
+
+        result = []
+        for doc in candidates:
+            if exact or filter(doc.metadata):
+                result.append(doc)
+                # stop if limit reached and limit > 0
+                if limit > 0 and len(result) >= limit:
+                    break
+        return result
+
     # override aget_by_ids
     def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
         # return all self.docstore._dict[id] in ids
@@ -34,34 +246,26 @@ class MyFaiss(FAISS):
 
 class VectorDB:
 
-    _cached_embeddings: dict[str, CacheBackedEmbeddings] = {}
-
     @staticmethod
     def _get_embeddings(agent: Agent, cache: bool = True):
         model = agent.get_embedding_model()
-        if not cache:
-            return model  # return raw embeddings if cache is False
-        namespace = getattr(
-            model,
-            "model_name",
-            "default",
+        # without cache the vectors only live in memory of this instance
+        return embedding_cache.get_cached_embeddings(
+            model, embedding_cache.get_model_id(model), persistent=cache
         )
-        if namespace not in VectorDB._cached_embeddings:
-            store = InMemoryByteStore()
-            VectorDB._cached_embeddings[namespace] = (
-                CacheBackedEmbeddings.from_bytes_store(
-                    model,
-                    store,
-                    namespace=namespace,
-                )
-            )
-        return VectorDB._cached_embeddings[namespace]
 
-    def __init__(self, agent: Agent, cache: bool = True):
+    @staticmethod
+    async def create(agent: Agent, cache: bool = True) -> "VectorDB":
+        # the dimension is cached per model, probing only happens for a model never seen before
+        embeddings = VectorDB._get_embeddings(agent, cache=cache)
+        dimensions = await embeddings.aget_dimensions()
+        return VectorDB(agent, cache=cache, dimensions=dimensions)
+
+    def __init__(self, agent: Agent, cache: bool = True, dimensions: int = 0):
         self.agent = agent
         self.cache = cache  # store cache preference
-        self.embeddings = self._get_embeddings(agent, cache=cache)
-        self.index = faiss.IndexFlatIP(len(self.embeddings.embed_query("example")))
+        self.embeddings: CachedEmbeddings = self._get_embeddings(agent, cache=cache)
+        self.index = faiss.IndexFlatIP(dimensions or self.embeddings.get_dimensions())
 
         self.db = MyFaiss(
             embedding_function=self.embeddings,
@@ -86,17 +290,28 @@ class VectorDB:
             filter=comparator,
         )
 
+    async def search_many_by_similarity_threshold(
+        self, queries: Sequence[str], limit: int, threshold: float, filter: str = ""
+    ) -> list[list[Document]]:
+        """Results of several queries, embedded in one batch and searched in one pass."""
+        if not queries:
+            return []
+        comparator = get_comparator(filter) if filter else None
+        vectors = await self.embeddings.aembed_documents(list(queries))
+        relevance_score_fn = self.db._select_relevance_score_fn()
+        results = await asyncio.to_thread(
+            self.db.similarity_search_with_score_by_vectors,
+            vectors,
+            k=limit,
+            filter=comparator,
+        )
+        return [
+            [doc for doc, score in docs if relevance_score_fn(score) >= threshold]
+            for docs in results
+        ]
+
     async def search_by_metadata(self, filter: str, limit: int = 0) -> list[Document]:
-        comparator = get_comparator(filter)
-        all_docs = self.db.get_all_docs()
-        result = []
-        for doc in all_docs.values():
-            if comparator(doc.metadata):
-                result.append(doc)
-                # stop if limit reached and limit > 0
-                if limit > 0 and len(result) >= limit:
-                    break
-        return result
+        return self.db.search_by_metadata(get_comparator(filter), limit=limit)
 
     async def insert_documents(self, docs: list[Document]):
         ids = [guids.generate_id() for _ in range(len(docs))]
@@ -105,7 +320,7 @@ class VectorDB:
             for doc, id in zip(docs, ids):
                 doc.metadata["id"] = id  # add ids to documents metadata
 
-            self.db.add_documents(documents=docs, ids=ids)
+            await self.db.aadd_documents(documents=docs, ids=ids)
         return ids
 
     async def delete_documents_by_ids(self, ids: list[str]):
@@ -138,7 +353,7 @@ def cosine_normalizer(val: float) -> float:
     return res
 
 
-def get_comparator(condition: str):
+def get_comparator(condition: str) -> MetadataFilter:
     def comparator(data: dict[str, Any]):
         try:
             result = simple_eval(condition, names=data)
@@ -147,4 +362,4 @@ def get_comparator(condition: str):
             # PrintStyle.error(f"Error evaluating condition: {e}")
             return False
 
-    return comparator
+    return MetadataFilter(condition, comparator)
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import asyncio, os
+import concurrent.futures
+import json
 import re
 import time
 import threading
@@ -17,6 +19,11 @@ from helpers.print_style import PrintStyle
 from helpers import runtime
 from helpers.ws import ConnectionIdentity, ConnectionNotFoundError, WsHandler, _ws_debug_enabled, ws_debug
 
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional faster encoder
+    orjson = None
+
 
 # Event validation
 
@@ -170,9 +177,34 @@ def validate_event_type(event_type: str) -> str:
 
 BUFFER_MAX_SIZE = 100
 BUFFER_TTL = timedelta(hours=1)
+# socket.io room joined by every managed connection of a namespace, broadcasts emit to it once
+BROADCAST_ROOM = "ws_manager.broadcast"
 _shared_ws_manager: WsManager | None = None
 
 
+class WsJson:
+    """JSON module for socket.io packets, uses orjson when it is installed.
+
+    Passed as ``json=`` to ``socketio.AsyncServer``; payloads orjson cannot encode
+    fall back to the standard library.
+    """
+
+    @staticmethod
+    def dumps(obj: Any, **kwargs: Any) -> str:
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+            except TypeError:  # orjson.JSONEncodeError
+                pass
+        return json.dumps(obj, **kwargs)
+
+    @staticmethod
+    def loads(s: str | bytes, **kwargs: Any) -> Any:
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+
 async def send_data(
     event_type: str,
     data: dict[str, Any],
@@ -194,6 +226,17 @@ def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def _copy_task_result(task: asyncio.Future, future: concurrent.futures.Future) -> None:
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())  # type: ignore[arg-type]
+    else:
+        future.set_result(task.result())
+
+
 def set_shared_ws_manager(manager: "WsManager") -> None:
     global _shared_ws_manager
     _shared_ws_manager = manager
@@ -267,6 +310,10 @@ class WsManager:
         self._dispatcher_loop: asyncio.AbstractEventLoop | None = None
         self._handler_worker: DeferredTask | None = None
         self._lifecycle_tasks: Set[asyncio.Task] = set()
+        # emits from other threads, sent together on the next dispatcher loop tick
+        self._emit_queue: list[tuple[str, dict[str, Any], dict[str, Any], concurrent.futures.Future]] = []
+        self._emit_queue_lock = threading.Lock()
+        self._emit_tasks: Set[asyncio.Task] = set()
 
     # Internal: development-only debug logging to avoid noise in production
     def _debug(self, message: str) -> None:
@@ -307,6 +354,59 @@ class WsManager:
         future = asyncio.run_coroutine_threadsafe(coro, dispatcher_loop)
         return await asyncio.wrap_future(future)
 
+    async def _emit(
+        self,
+        event_type: str,
+        envelope: dict[str, Any],
+        *,
+        to: str,
+        namespace: str,
+        skip_sid: list[str] | None = None,
+    ) -> None:
+        """Emit on the dispatcher loop, emits queued from other threads are flushed once per loop tick."""
+        kwargs: dict[str, Any] = {"to": to, "namespace": namespace}
+        if skip_sid:
+            kwargs["skip_sid"] = skip_sid
+        self._ensure_dispatcher_loop()
+        dispatcher_loop = self._dispatcher_loop
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if dispatcher_loop is None or running_loop is dispatcher_loop:
+            await self.socketio.emit(event_type, envelope, **kwargs)
+            return
+        if dispatcher_loop.is_closed():
+            raise RuntimeError("Dispatcher event loop is closed")
+
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._emit_queue_lock:
+            self._emit_queue.append((event_type, envelope, kwargs, future))
+            schedule = len(self._emit_queue) == 1
+        if schedule:
+            try:
+                dispatcher_loop.call_soon_threadsafe(self._flush_emit_queue)
+            except RuntimeError as exc:
+                self._fail_emit_queue(exc)
+        await asyncio.wrap_future(future)
+
+    def _flush_emit_queue(self) -> None:
+        with self._emit_queue_lock:
+            batch, self._emit_queue = self._emit_queue, []
+        for event_type, envelope, kwargs, future in batch:
+            task = asyncio.ensure_future(self.socketio.emit(event_type, envelope, **kwargs))
+            # the loop keeps only weak references to tasks
+            self._emit_tasks.add(task)
+            task.add_done_callback(self._emit_tasks.discard)
+            task.add_done_callback(lambda t, f=future: _copy_task_result(t, f))
+
+    def _fail_emit_queue(self, exc: BaseException) -> None:
+        with self._emit_queue_lock:
+            batch, self._emit_queue = self._emit_queue, []
+        for *_queued, future in batch:
+            if not future.done():
+                future.set_exception(exc)
+
     def _diagnostics_active(self) -> bool:
         if not self._diagnostics_enabled:
             return False
@@ -723,6 +823,9 @@ class WsManager:
             connection_count = sum(
                 1 for conn_identity in self.connections if conn_identity[0] == namespace
             )
+        await self._run_on_dispatcher_loop(
+            self.socketio.enter_room(sid, BROADCAST_ROOM, namespace=namespace)
+        )
         if _ws_debug_enabled():
             PrintStyle.info(f"WebSocket connected: namespace={namespace} sid={sid}")
         await self._run_lifecycle(namespace, lambda h: h.on_connect(sid))
@@ -1242,9 +1345,7 @@ class WsManager:
                     envelope.get("handlerId"),
                 )
             )
-            await self._run_on_dispatcher_loop(
-                self.socketio.emit(event_type, envelope, to=sid, namespace=namespace)
-            )
+            await self._emit(event_type, envelope, to=sid, namespace=namespace)
             delivered = True
         else:
             if not known:
@@ -1259,7 +1360,7 @@ class WsManager:
                 )
             buffered = True
 
-        if not diagnostic:
+        if not diagnostic and self._diagnostics_active():
             await self._publish_diagnostic_event(
                 lambda: {
                     "kind": "outbound",
@@ -1302,6 +1403,7 @@ class WsManager:
         excluded = self._normalize_sid_filter(exclude_sids)
 
         targets: list[str] = []
+        skipped: list[str] = []
         with self.lock:
             current_identities = list(self.connections.keys())
         for conn_identity in current_identities:
@@ -1309,6 +1411,7 @@ class WsManager:
                 continue
             sid = conn_identity[1]
             if sid in excluded:
+                skipped.append(sid)
                 continue
             targets.append(sid)
 
@@ -1318,15 +1421,16 @@ class WsManager:
                 data,
                 correlation_id=correlation_id,
             )
-            coros = [
-                self._run_on_dispatcher_loop(
-                    self.socketio.emit(event_type, envelope, to=sid, namespace=namespace)
-                )
-                for sid in targets
-            ]
-            await asyncio.gather(*coros)
+            # one emit to the namespace room, socket.io encodes the packet once for all targets
+            await self._emit(
+                event_type,
+                envelope,
+                to=BROADCAST_ROOM,
+                namespace=namespace,
+                skip_sid=skipped,
+            )
 
-        if not diagnostic:
+        if not diagnostic and self._diagnostics_active():
             await self._publish_diagnostic_event(
                 lambda: {
                     "kind": "outbound",
@@ -1412,11 +1516,7 @@ class WsManager:
                     envelope.get("handlerId"),
                 )
             )
-            await self._run_on_dispatcher_loop(
-                self.socketio.emit(
-                    event.event_type, envelope, to=sid, namespace=namespace
-                )
-            )
+            await self._emit(event.event_type, envelope, to=sid, namespace=namespace)
             delivered += 1
         if identity in self.buffers:
             self.buffers.pop(identity, None)
@@ -1,7 +1,10 @@
 from dataclasses import dataclass, field
 from enum import Enum
+import inspect
 import logging
 import os
+import time
+import weakref
 from typing import (
     Any,
     Awaitable,
@@ -14,7 +17,7 @@ from typing import (
     TypedDict,
 )
 
-from litellm import completion, acompletion, embedding
+from litellm import completion, acompletion, embedding, aembedding
 import litellm
 import openai
 from litellm.types.utils import ModelResponse
@@ -92,6 +95,62 @@ class ChatChunk(TypedDict):
     response_delta: str
     reasoning_delta: str
 
+STREAM_COALESCE_MS = 40  # deltas arriving within this window reach the callbacks as one batch, 0 disables
+STREAM_COALESCE_CHARS = 512  # a batch this large is delivered without waiting for the window
+
+
+class StreamCoalescer:
+    """Collects streamed deltas and releases them in batches, at most one per window unless a batch grows large.
+
+    The first delta is released right away, so time to first output is unchanged."""
+
+    def __init__(self, window: float, max_chars: int):
+        self.window = window
+        self.max_chars = max_chars
+        self.reasoning: list[str] = []
+        self.response: list[str] = []
+        self._chars = 0
+        self._last_delivery = float("-inf")
+
+    @property
+    def pending(self) -> bool:
+        return self._chars > 0
+
+    def add(self, chunk: "ChatChunk"):
+        if chunk["reasoning_delta"]:
+            self.reasoning.append(chunk["reasoning_delta"])
+            self._chars += len(chunk["reasoning_delta"])
+        if chunk["response_delta"]:
+            self.response.append(chunk["response_delta"])
+            self._chars += len(chunk["response_delta"])
+
+    def due_in(self, now: float) -> float:
+        """Seconds until pending deltas have to be delivered."""
+        if self._chars >= self.max_chars:
+            return 0
+        return max(0.0, self._last_delivery + self.window - now)
+
+    def take(self, now: float) -> tuple[list[str], list[str]]:
+        batch = self.reasoning, self.response
+        self.reasoning, self.response, self._chars = [], [], 0
+        self._last_delivery = now
+        return batch
+
+
+async def _call_stream_callback(callback: Callable[..., Awaitable[Any]], delta: str, full: str, parts: list[str]):
+    # callbacks that accept `parts` also get the individual deltas the batch was coalesced from
+    if _accepts_parts(callback):
+        return await callback(delta, full, parts=parts)
+    return await callback(delta, full)
+
+
+def _accepts_parts(callback: Callable[..., Any]) -> bool:
+    try:
+        return "parts" in inspect.signature(callback).parameters
+    except (TypeError, ValueError):
+        return False
+
+
 class ChatGenerationResult:
     """Chat generation result object"""
     def __init__(self, chunk: ChatChunk|None = None):
@@ -220,13 +279,20 @@ def get_rate_limiter(
     provider: str, name: str, requests: int, input: int, output: int
 ) -> RateLimiter:
     key = f"{provider}\\{name}"
-    rate_limiters[key] = limiter = rate_limiters.get(key, RateLimiter(seconds=60))
+    limiter = rate_limiters.get(key)
+    if limiter is None:
+        rate_limiters[key] = limiter = RateLimiter(seconds=60)
     limiter.limits["requests"] = requests or 0
     limiter.limits["input"] = input or 0
     limiter.limits["output"] = output or 0
     return limiter
 
 
+def get_rate_limiter_metrics() -> dict[str, dict]:
+    # usage, queue depth and wait time histogram of each limiter, keyed like get_rate_limiter
+    return {key: limiter.get_metrics() for key, limiter in list(rate_limiters.items())}
+
+
 def _is_transient_litellm_error(exc: Exception) -> bool:
     """Uses status_code when available, else falls back to exception types"""
     # Prefer explicit status codes if present
@@ -507,11 +573,15 @@ class LiteLLMChatWrapper(SimpleChatModel):
         call_kwargs: dict[str, Any] = {**self.kwargs, **kwargs}
         max_retries: int = int(call_kwargs.pop("a0_retry_attempts", 2))
         retry_delay_s: float = float(call_kwargs.pop("a0_retry_delay_seconds", 1.5))
+        coalesce_window: float = float(call_kwargs.pop("a0_stream_coalesce_ms", STREAM_COALESCE_MS)) / 1000
+        coalesce_chars: int = int(call_kwargs.pop("a0_stream_coalesce_chars", STREAM_COALESCE_CHARS))
         stream = reasoning_callback is not None or response_callback is not None or tokens_callback is not None
 
         # results
         result = ChatGenerationResult()
 
+        import asyncio
+
         attempt = 0
         while True:
             got_any_chunk = False
@@ -525,45 +595,77 @@ class LiteLLMChatWrapper(SimpleChatModel):
                 )
 
                 if stream:
-                    # iterate over chunks
+                    # iterate over chunks, callbacks receive the deltas in coalesced batches
                     stop_response: str | None = None
+                    coalescer = StreamCoalescer(coalesce_window, coalesce_chars)
+                    chunks = _completion.__aiter__()  # type: ignore
+                    next_chunk: asyncio.Future | None = None
+
+                    async def deliver() -> str | None:
+                        reasoning_parts, response_parts = coalescer.take(time.monotonic())
+                        stop: str | None = None
+                        # batch token counts use the cheap estimator, encoding every delta is too costly
+                        if reasoning_parts:
+                            delta = "".join(reasoning_parts)
+                            delta_tokens = approximate_tokens(delta, mode="estimate")
+                            if reasoning_callback:
+                                await _call_stream_callback(reasoning_callback, delta, result.reasoning, reasoning_parts)
+                            if tokens_callback:
+                                await tokens_callback(delta, delta_tokens)
+                            # Add output tokens to rate limiter if configured
+                            if limiter:
+                                limiter.add(output=delta_tokens)
+                        if response_parts:
+                            delta = "".join(response_parts)
+                            delta_tokens = approximate_tokens(delta, mode="estimate")
+                            if response_callback:
+                                stop = await _call_stream_callback(response_callback, delta, result.response, response_parts)
+                            if tokens_callback:
+                                await tokens_callback(delta, delta_tokens)
+                            # Add output tokens to rate limiter if configured
+                            if limiter:
+                                limiter.add(output=delta_tokens)
+                        return stop
+
                     try:
-                        async for chunk in _completion:  # type: ignore
+                        while True:
+                            if next_chunk is None and coalescer.pending:
+                                # wait for the next chunk only until the pending batch is due
+                                delay = coalescer.due_in(time.monotonic())
+                                if delay > 0:
+                                    next_chunk = asyncio.ensure_future(chunks.__anext__())
+                                    await asyncio.wait({next_chunk}, timeout=delay)
+                                if next_chunk is None or not next_chunk.done():
+                                    stop_response = await deliver()
+                                    if stop_response is not None:
+                                        break
+                                    continue
+                            try:
+                                if next_chunk is not None:
+                                    chunk = await next_chunk
+                                else:
+                                    chunk = await chunks.__anext__()
+                            except StopAsyncIteration:
+                                break
+                            finally:
+                                next_chunk = None
                             got_any_chunk = True
                             # parse chunk
                             parsed = _parse_chunk(chunk)
-                            output = result.add_chunk(parsed)
-
-                            # collect reasoning delta and call callbacks
-                            if output["reasoning_delta"]:
-                                if reasoning_callback:
-                                    await reasoning_callback(output["reasoning_delta"], result.reasoning)
-                                if tokens_callback:
-                                    await tokens_callback(
-                                        output["reasoning_delta"],
-                                        approximate_tokens(output["reasoning_delta"]),
-                                    )
-                                # Add output tokens to rate limiter if configured
-                                if limiter:
-                                    limiter.add(output=approximate_tokens(output["reasoning_delta"]))
-                            # collect response delta and call callbacks
-                            if output["response_delta"]:
-                                if response_callback:
-                                    stop_response = await response_callback(
-                                        output["response_delta"], result.response
-                                    )
-                                if tokens_callback:
-                                    await tokens_callback(
-                                        output["response_delta"],
-                                        approximate_tokens(output["response_delta"]),
-                                    )
-                                # Add output tokens to rate limiter if configured
-                                if limiter:
-                                    limiter.add(output=approximate_tokens(output["response_delta"]))
-                            if stop_response is not None:
-                                result.response = stop_response
-                                break
+                            coalescer.add(result.add_chunk(parsed))
+                            if coalescer.pending and coalescer.due_in(time.monotonic()) == 0:
+                                stop_response = await deliver()
+                                if stop_response is not None:
+                                    break
+                        if stop_response is None and coalescer.pending:
+                            stop_response = await deliver()
+                        if stop_response is not None:
+                            result.response = stop_response
                     finally:
+                        if next_chunk is not None:
+                            # the stream can only be closed once the pending read has finished
+                            next_chunk.cancel()
+                            await asyncio.gather(next_chunk, return_exceptions=True)
                         if stop_response is not None and hasattr(_completion, "aclose"):
                             await _completion.aclose()  # type: ignore[attr-defined]
 
@@ -581,8 +683,6 @@ class LiteLLMChatWrapper(SimpleChatModel):
                 return result.response, result.reasoning
 
             except Exception as e:
-                import asyncio
-
                 # Retry only if no chunks received and error is transient
                 if got_any_chunk or not _is_transient_litellm_error(e) or attempt >= max_retries:
                     raise
@@ -590,6 +690,135 @@ class LiteLLMChatWrapper(SimpleChatModel):
                 await asyncio.sleep(retry_delay_s)
 
 
+EMBEDDING_BATCH_WINDOW = 0.01  # seconds to gather concurrent embedding requests
+EMBEDDING_BATCH_MAX_SIZE = 256  # max texts sent to the provider in one request
+
+
+type EmbedFunc = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent embedding requests for one model into shared provider batches.
+
+    Every request brings its own embed function, a batch is sent with the function of its
+    latest request, so the batcher never keeps a model wrapper alive between batches."""
+
+    def __init__(
+        self,
+        window: float = EMBEDDING_BATCH_WINDOW,
+        max_size: int = EMBEDDING_BATCH_MAX_SIZE,
+    ):
+        self.window = window
+        self.max_size = max_size
+        self._pending: list[tuple[List[str], "asyncio.Future[List[List[float]]]", EmbedFunc]] = []
+        self._pending_count = 0
+        self._timer: "asyncio.TimerHandle | None" = None
+        self._tasks: set["asyncio.Future[None]"] = set()  # running batches, referenced until done
+
+    async def embed(self, texts: List[str], embed: EmbedFunc) -> List[List[float]]:
+        import asyncio
+
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[List[List[float]]] = loop.create_future()
+        self._pending.append((texts, future, embed))
+        self._pending_count += len(texts)
+
+        if self._pending_count >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        import asyncio
+
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending, self._pending_count = self._pending, [], 0
+        if pending:
+            task = asyncio.ensure_future(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending: list[tuple[List[str], "asyncio.Future[List[List[float]]]", EmbedFunc]]):
+        import asyncio
+
+        try:
+            await self._run_batch(pending)
+        except BaseException as e:
+            # cancelled or interrupted, callers must not wait forever
+            for _, future, _embed in pending:
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            raise
+
+    async def _run_batch(self, pending: list[tuple[List[str], "asyncio.Future[List[List[float]]]", EmbedFunc]]):
+        texts = [text for batch, _, _embed in pending for text in batch]
+        try:
+            results = await self._embed_all(pending[-1][2], texts)
+        except Exception as e:
+            if len(pending) == 1:
+                _, future, _embed = pending[0]
+                if not future.done():
+                    future.set_exception(e)
+                return
+            # one caller's input can fail the whole batch, retry each caller on its own
+            for batch, future, embed in pending:
+                if future.done():
+                    continue
+                try:
+                    result = await self._embed_all(embed, batch)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+            return
+
+        offset = 0
+        for batch, future, _embed in pending:
+            if not future.done():  # caller may have been cancelled meanwhile
+                future.set_result(results[offset : offset + len(batch)])
+            offset += len(batch)
+
+    async def _embed_all(self, embed: EmbedFunc, texts: List[str]) -> List[List[float]]:
+        results: List[List[float]] = []
+        for i in range(0, len(texts), self.max_size):
+            results += await embed(texts[i : i + self.max_size])
+        return results
+
+
+# batchers are bound to an event loop, agents on other loops get their own
+_embedding_batchers: "weakref.WeakKeyDictionary[Any, dict[str, EmbeddingBatcher]]" = weakref.WeakKeyDictionary()
+
+
+def get_embedding_batcher(
+    kind: str, model_name: str, kwargs: dict, model_config: Optional[ModelConfig] = None
+) -> EmbeddingBatcher:
+    """Batcher shared by wrappers of the same model, call args and rate limits on the running loop."""
+    import asyncio
+
+    limits = (
+        (model_config.provider, model_config.name, model_config.limit_requests,
+         model_config.limit_input, model_config.limit_output)
+        if model_config else None
+    )
+    key = f"{kind}:{model_name}:{hash(repr((sorted(kwargs.items()), limits)))}"
+    batchers = _embedding_batchers.setdefault(asyncio.get_running_loop(), {})
+    batcher = batchers.get(key)
+    if batcher is None:
+        batchers[key] = batcher = EmbeddingBatcher()
+    return batcher
+
+
 class LiteLLMEmbeddingWrapper(Embeddings):
     model_name: str
     kwargs: dict = {}
@@ -611,18 +840,30 @@ class LiteLLMEmbeddingWrapper(Embeddings):
         apply_rate_limiter_sync(self.a0_model_conf, " ".join(texts))
 
         resp = embedding(model=self.model_name, input=texts, **self.kwargs)
-        return [
-            item.get("embedding") if isinstance(item, dict) else item.embedding  # type: ignore
-            for item in resp.data  # type: ignore
-        ]
+        return _parse_embeddings(resp)
 
     def embed_query(self, text: str) -> List[float]:
         # Apply rate limiting if configured
         apply_rate_limiter_sync(self.a0_model_conf, text)
 
         resp = embedding(model=self.model_name, input=[text], **self.kwargs)
-        item = resp.data[0]  # type: ignore
-        return item.get("embedding") if isinstance(item, dict) else item.embedding  # type: ignore
+        return _parse_embeddings(resp)[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._get_batcher().embed(texts, self._aembed_batch)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._get_batcher().embed([text], self._aembed_batch))[0]
+
+    def _get_batcher(self) -> EmbeddingBatcher:
+        return get_embedding_batcher("litellm", self.model_name, self.kwargs, self.a0_model_conf)
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        # Apply rate limiting if configured
+        await apply_rate_limiter(self.a0_model_conf, " ".join(texts))
+
+        resp = await aembedding(model=self.model_name, input=texts, **self.kwargs)
+        return _parse_embeddings(resp)
 
 
 class LocalSentenceTransformerWrapper(Embeddings):
@@ -655,24 +896,46 @@ class LocalSentenceTransformerWrapper(Embeddings):
 
         self.model = SentenceTransformer(model, **st_kwargs)
         self.model_name = model
+        self.kwargs = st_kwargs
         self.a0_model_conf = model_config
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         # Apply rate limiting if configured
         apply_rate_limiter_sync(self.a0_model_conf, " ".join(texts))
 
-        embeddings = self.model.encode(texts, convert_to_tensor=False)  # type: ignore
-        return embeddings.tolist() if hasattr(embeddings, "tolist") else embeddings  # type: ignore
+        return self._encode(texts)
 
     def embed_query(self, text: str) -> List[float]:
         # Apply rate limiting if configured
         apply_rate_limiter_sync(self.a0_model_conf, text)
 
-        embedding = self.model.encode([text], convert_to_tensor=False)  # type: ignore
-        result = (
-            embedding[0].tolist() if hasattr(embedding[0], "tolist") else embedding[0]
+        return self._encode([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._get_batcher().embed(texts, self._aembed_batch)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._get_batcher().embed([text], self._aembed_batch))[0]
+
+    def _get_batcher(self) -> EmbeddingBatcher:
+        return get_embedding_batcher(
+            "sentence_transformers", self.model_name, self.kwargs, self.a0_model_conf
         )
-        return result  # type: ignore
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        import asyncio
+
+        # Apply rate limiting if configured
+        await apply_rate_limiter(self.a0_model_conf, " ".join(texts))
+
+        # encoding is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(self._encode, texts)
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self.model.encode(texts, convert_to_tensor=False)  # type: ignore
+        return embeddings.tolist() if hasattr(embeddings, "tolist") else [  # type: ignore
+            e.tolist() if hasattr(e, "tolist") else e for e in embeddings  # type: ignore
+        ]
 
 
 def _get_litellm_chat(
@@ -733,6 +996,13 @@ def _get_litellm_embedding(
     )
 
 
+def _parse_embeddings(resp: Any) -> List[List[float]]:
+    return [
+        item.get("embedding") if isinstance(item, dict) else item.embedding  # type: ignore
+        for item in resp.data  # type: ignore
+    ]
+
+
 def _parse_chunk(chunk: Any) -> ChatChunk:
     delta = chunk["choices"][0].get("delta", {})
     message = chunk["choices"][0].get("message", {}) or chunk["choices"][0].get(
@@ -7,7 +7,7 @@ import plugins._a0_connector.api.v1.base as connector_base
 
 class TokenStatus(connector_base.ProtectedConnectorApiHandler):
     async def process(self, input: dict, request: Request) -> dict | Response:
-        from agent import Agent, AgentContext
+        from agent import AgentContext
 
         context_id = str(
             input.get("context", input.get("context_id", input.get("ctxid", "")))
@@ -28,7 +28,7 @@ class TokenStatus(connector_base.ProtectedConnectorApiHandler):
             )
 
         agent = context.streaming_agent or context.agent0
-        window = agent.get_data(Agent.DATA_NAME_CTX_WINDOW) if agent is not None else None
+        window = agent.get_context_window() if agent is not None else None
         token_count: int | None = None
         if isinstance(window, dict):
             raw_tokens = window.get("tokens")
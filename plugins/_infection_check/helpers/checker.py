@@ -342,7 +342,7 @@ class InfectionChecker:
         try:
             msgs = agent.history.current.messages
             if msgs and msgs[-1].ai:
-                msgs.pop()
+                agent.history.current.pop_message()
             agent.history.add_message(
                 ai=True, content="[BLOCKED] Response terminated by security policy.",
                 id=msg_id,
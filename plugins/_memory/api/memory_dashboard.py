@@ -154,23 +154,23 @@ class MemoryDashboard(ApiHandler):
             memory = await Memory.get_by_subdir(memory_subdir, preload_knowledge=False)
 
             memories = []
+            # repr quotes the user value as a literal, it can not extend the filter expression
+            area_condition = f"area == {str(area_filter)!r}" if area_filter else ""
 
             if search_query:
                 docs = await memory.search_similarity_threshold(
                     query=search_query,
                     limit=limit,
                     threshold=threshold,
-                    filter=f"area == '{area_filter}'" if area_filter else "",
+                    filter=area_condition,
                 )
                 memories = docs
             else:
                 # If no search query, get all memories from specified area(s)
-                all_docs = memory.db.get_all_docs()
-                for doc_id, doc in all_docs.items():
-                    # Apply area filter if specified
-                    if area_filter and doc.metadata.get("area", "") != area_filter:
-                        continue
-                    memories.append(doc)
+                if area_filter:
+                    memories = await memory.search_by_metadata(area_condition)
+                else:
+                    memories = list(memory.db.get_all_docs().values())
 
                 # sort by timestamp
                 def get_sort_key(m):
@@ -0,0 +1,11 @@
+from helpers.extension import Extension
+from plugins._memory.extensions.python.message_loop_prompts_after._50_recall_memories import start_speculative_recall
+
+
+class SpeculativeRecallToolResult(Extension):
+    def execute(self, data: dict = {}, **kwargs):
+        if not self.agent or data.get("exception"):
+            return
+
+        loop_data = getattr(self.agent, "loop_data", None)
+        start_speculative_recall(self.agent, loop_data.iteration + 1 if loop_data else 0)
@@ -0,0 +1,17 @@
+from helpers.extension import Extension
+from plugins._memory.extensions.python.message_loop_prompts_after._50_recall_memories import start_speculative_recall
+
+
+class SpeculativeRecallUserMessage(Extension):
+    def execute(self, data: dict = {}, **kwargs):
+        if not self.agent or data.get("exception"):
+            return
+
+        args = data.get("args", ())
+        intervention = data.get("kwargs", {}).get(
+            "intervention", args[2] if len(args) > 2 else False
+        )
+        # a new message starts a new monologue, an intervention continues the current one
+        loop_data = getattr(self.agent, "loop_data", None)
+        next_iteration = loop_data.iteration + 1 if intervention and loop_data else 0
+        start_speculative_recall(self.agent, next_iteration)
@@ -1,6 +1,9 @@
 import asyncio
+from dataclasses import dataclass, field
+from langchain_core.documents import Document
 from helpers.extension import Extension
-from agent import LoopData
+from helpers.history import Message
+from agent import Agent, LoopData
 from helpers import dirty_json, errors, log, plugins
 
 # Direct import - this extension lives inside the memory plugin
@@ -10,6 +13,7 @@ from plugins._memory.tools.memory_load import DEFAULT_THRESHOLD as DEFAULT_MEMOR
 
 DATA_NAME_TASK = "_recall_memories_task"
 DATA_NAME_ITER = "_recall_memories_iter"
+DATA_NAME_SPECULATIVE = "_recall_memories_speculative"
 SEARCH_TIMEOUT = 30
 
 
@@ -72,79 +76,36 @@ class RecallMemories(Extension):
         set = plugins.get_plugin_config("_memory", self.agent)
         if not set:
             return None
-        # try:
 
-        # get system message and chat history for util llm
-        system = self.agent.read_prompt("memory.memories_query.sys.md")
-
-        # # log query streamed by LLM
-        # async def log_callback(content):
-        #     log_item.stream(query=content)
+        # reuse recall started speculatively when the history has not changed since
+        task = take_speculative_recall(self.agent)
+        if task:
+            result = await task
+        else:
+            result = await recall(self.agent, set, loop_data.user_message)
 
-        # call util llm to summarize conversation
-        user_instruction = (
-            loop_data.user_message.output_text() if loop_data.user_message else "None"
-        )
-        history = self.agent.history.output_text()[-set["memory_recall_history_len"]:]
-        message = self.agent.read_prompt(
-            "memory.memories_query.msg.md", history=history, message=user_instruction
-        )
+        query = result.query
+        history = result.history
+        user_instruction = result.user_instruction
+        memories = result.memories
+        solutions = result.solutions
 
-        # if query preparation by AI is enabled
+        # no query, no search
+        if not query:
+            log_item.update(
+                heading="Failed to generate memory query",
+            )
+            return
         if set["memory_recall_query_prep"]:
-            try:
-                # call util llm to generate search query from the conversation
-                query = await self.agent.call_utility_model(
-                    system=system,
-                    message=message,
-                    # callback=log_callback,
-                )
-                query = query.strip()
-                log_item.update(query=query) # no need for streaming here
-            except Exception as e:
-                err = errors.format_error(e)
-                self.agent.context.log.log(
-                    type="warning", heading="Recall memories extension error:", content=err
-                )
-                query = ""
-
-            # no query, no search
-            if not query:
-                log_item.update(
-                    heading="Failed to generate memory query",
-                )
-                return
-        
-        # otherwise use the message and history as query
-        else:
-            query = user_instruction + "\n\n" + history
+            log_item.update(query=query) # no need for streaming here
 
         # if there is no query (or just dash by the LLM), do not continue
-        if not query or len(query) <= 3:
+        if len(query) <= 3:
             log_item.update(
                 query="No relevant memory query generated, skipping search",
             )
             return
 
-        # get memory database
-        db = await Memory.get(self.agent)
-
-        # search for general memories and fragments
-        memories = await db.search_similarity_threshold(
-            query=query,
-            limit=set["memory_recall_memories_max_search"],
-            threshold=set["memory_recall_similarity_threshold"],
-            filter=f"area == '{Memory.Area.MAIN.value}' or area == '{Memory.Area.FRAGMENTS.value}'",  # exclude solutions
-        )
-
-        # search for solutions
-        solutions = await db.search_similarity_threshold(
-            query=query,
-            limit=set["memory_recall_solutions_max_search"],
-            threshold=set["memory_recall_similarity_threshold"],
-            filter=f"area == '{Memory.Area.SOLUTIONS.value}'",  # exclude solutions
-        )
-
         if not memories and not solutions:
             log_item.update(
                 heading="No memories or solutions found",
@@ -227,3 +188,113 @@ class RecallMemories(Extension):
             extras["solutions"] = self.agent.parse_prompt(
                 "agent.system.solutions.md", solutions=solutions_txt
             )
+
+
+@dataclass
+class RecallResult:
+    user_instruction: str
+    history: str
+    query: str = ""
+    memories: list[Document] = field(default_factory=list)
+    solutions: list[Document] = field(default_factory=list)
+
+
+async def recall(agent: Agent, set: dict, user_message: Message | None) -> RecallResult:
+    """Generate the search query from the conversation and search memories and solutions."""
+
+    # get system message and chat history for util llm
+    system = agent.read_prompt("memory.memories_query.sys.md")
+
+    # call util llm to summarize conversation
+    user_instruction = user_message.output_text() if user_message else "None"
+    history = agent.history.output_text_tail(set["memory_recall_history_len"])
+    message = agent.read_prompt(
+        "memory.memories_query.msg.md", history=history, message=user_instruction
+    )
+    result = RecallResult(user_instruction=user_instruction, history=history)
+
+    # if query preparation by AI is enabled
+    if set["memory_recall_query_prep"]:
+        try:
+            # call util llm to generate search query from the conversation
+            query = await agent.call_utility_model(
+                system=system,
+                message=message,
+            )
+            query = query.strip()
+        except Exception as e:
+            err = errors.format_error(e)
+            agent.context.log.log(
+                type="warning", heading="Recall memories extension error:", content=err
+            )
+            query = ""
+
+    # otherwise use the message and history as query
+    else:
+        query = user_instruction + "\n\n" + history
+
+    result.query = query
+    # if there is no query (or just dash by the LLM), do not continue
+    if not query or len(query) <= 3:
+        return result
+
+    # get memory database
+    db = await Memory.get(agent)
+
+    # search for general memories and fragments and for solutions with one query embedding
+    result.memories, result.solutions = await db.search_areas_similarity_threshold(
+        query=query,
+        quotas=[
+            (
+                [Memory.Area.MAIN.value, Memory.Area.FRAGMENTS.value],
+                set["memory_recall_memories_max_search"],
+            ),
+            ([Memory.Area.SOLUTIONS.value], set["memory_recall_solutions_max_search"]),
+        ],
+        threshold=set["memory_recall_similarity_threshold"],
+    )
+    return result
+
+
+def start_speculative_recall(agent: Agent, next_iteration: int):
+    """Start the recall of the next iteration as soon as the history changed, it then runs
+    while the prompt is being prepared instead of after it."""
+    cancel_speculative_recall(agent)
+
+    set = plugins.get_plugin_config("_memory", agent)
+    if not set or not set["memory_recall_enabled"]:
+        return
+    if not set.get("memory_recall_speculative", False):
+        return
+    if next_iteration % set["memory_recall_interval"] != 0:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    task = loop.create_task(recall(agent, set, agent.last_user_message))
+    # retrieve errors of recalls that end up not being used
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    # keyed by the history version, any later message makes the result stale
+    agent.set_data(DATA_NAME_SPECULATIVE, (agent.history, agent.history.counter, task))
+
+
+def take_speculative_recall(agent: Agent) -> asyncio.Task | None:
+    """The speculative recall task if it was started for the current history, stale ones are cancelled."""
+    entry = agent.get_data(DATA_NAME_SPECULATIVE)
+    if not entry:
+        return None
+    agent.set_data(DATA_NAME_SPECULATIVE, None)
+    history, version, task = entry
+    if history is agent.history and version == history.counter and not task.cancelled():
+        return task
+    task.cancel()
+    return None
+
+
+def cancel_speculative_recall(agent: Agent):
+    entry = agent.get_data(DATA_NAME_SPECULATIVE)
+    if entry:
+        agent.set_data(DATA_NAME_SPECULATIVE, None)
+        entry[2].cancel()
@@ -1,3 +1,4 @@
+import asyncio
 from helpers.extension import Extension
 from agent import LoopData
 from plugins._memory.extensions.python.message_loop_prompts_after._50_recall_memories import DATA_NAME_TASK as DATA_NAME_TASK_MEMORIES, DATA_NAME_ITER as DATA_NAME_ITER_MEMORIES
@@ -18,9 +19,13 @@ class RecallWait(Extension):
 
         if task and not task.done():
 
-            # if memory recall is set to delayed mode, do not await on the iteration it was called
-            if set["memory_recall_delayed"]:
-                if iter == loop_data.iteration:
+            # if memory recall is set to delayed mode, do not await on the iteration it was called,
+            # with a wait budget only wait that long, late results are delivered in the next iteration
+            budget = 0 if set["memory_recall_delayed"] else set.get("memory_recall_wait_budget", 0)
+            if iter == loop_data.iteration and (set["memory_recall_delayed"] or budget > 0):
+                if budget > 0:
+                    await asyncio.wait([task], timeout=budget)
+                if not task.done():
                     # insert info about delayed memory to extras
                     delay_text = self.agent.read_prompt("memory.recall_delay_msg.md")
                     loop_data.extras_temporary["memory_recall_delayed"] = delay_text
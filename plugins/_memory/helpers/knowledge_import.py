@@ -1,18 +1,42 @@
+import asyncio
 import glob
+import json
 import os
 import hashlib
-from typing import Any, Dict, Literal, TypedDict
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Literal, NotRequired, TypedDict
 from langchain_community.document_loaders import (
     CSVLoader,
     PyPDFLoader,
     TextLoader,
     UnstructuredHTMLLoader,
 )
+from helpers import document_ingest
 from helpers.log import LogItem
 from helpers.print_style import PrintStyle
 
 text_loader_kwargs = {"autodetect_encoding": True}
 
+# Mapping file extensions to corresponding loader classes
+# Note: Using TextLoader for JSON and MD to avoid parsing issues with consolidation
+file_types_loaders = {
+    "txt": TextLoader,
+    "pdf": PyPDFLoader,
+    "csv": CSVLoader,
+    "html": UnstructuredHTMLLoader,
+    "json": TextLoader,  # Use TextLoader for better consolidation compatibility
+    "md": TextLoader,    # Use TextLoader for better consolidation compatibility
+}
+
+# CPU heavy formats are parsed in the document ingest worker processes, the rest in threads
+process_file_types = {"pdf", "html"}
+
+# metadata that changes on every import, not part of a chunk's identity
+volatile_metadata = {"id", "timestamp", "import_timestamp"}
+
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
 
 class KnowledgeImport(TypedDict):
     file: str
@@ -20,42 +44,102 @@ class KnowledgeImport(TypedDict):
     ids: list[str]
     state: Literal["changed", "original", "removed"]
     documents: list[Any]
+    mtime_ns: NotRequired[int]
+    size: NotRequired[int]
+    chunks: NotRequired[list[str]]  # chunk hashes, parallel to ids
+
+
+@dataclass
+class PreloadStats:
+    """Counters and seconds per phase of a knowledge preload."""
+
+    files: int = 0
+    hashed: int = 0
+    parsed: int = 0
+    documents: int = 0
+    seconds: dict[str, float] = field(default_factory=dict)
+
+    def add_time(self, phase: str, started: float):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + time.perf_counter() - started
+
+    def format(self) -> str:
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.seconds.items())
+        return (
+            f"{self.files} files, {self.hashed} hashed, {self.parsed} parsed into "
+            f"{self.documents} documents ({phases})"
+        )
 
 
 def calculate_checksum(file_path: str) -> str:
     hasher = hashlib.md5()
     with open(file_path, "rb") as f:
-        buf = f.read()
-        hasher.update(buf)
+        while buf := f.read(CHECKSUM_BLOCK_SIZE):
+            hasher.update(buf)
     return hasher.hexdigest()
 
 
-def load_knowledge(
+def calculate_chunk_hash(content: str, metadata: dict[str, Any]) -> str:
+    stable = {k: v for k, v in metadata.items() if k not in volatile_metadata}
+    hasher = hashlib.md5(content.encode("utf-8", "surrogatepass"))
+    hasher.update(b"\0")
+    hasher.update(json.dumps(stable, sort_keys=True, default=str).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def load_file(file_path: str, ext: str) -> list[Any]:
+    """Load and split one knowledge file, runs in a worker thread or process."""
+    loader_cls = file_types_loaders[ext]
+    loader = loader_cls(
+        file_path,
+        **(
+            text_loader_kwargs
+            if ext in ["txt", "csv", "html", "md"]
+            else {}
+        ),
+    )
+    return loader.load_and_split()
+
+
+async def _load_file_async(file_path: str, ext: str) -> list[Any]:
+    if ext in process_file_types:
+        return await document_ingest.run(load_file, file_path, ext)
+    return await asyncio.to_thread(load_file, file_path, ext)
+
+
+def _keep_previous(index: Dict[str, "KnowledgeImport"], file_path: str):
+    # the previously imported version stays in memory, the file is retried next time
+    if file_path in index:
+        index[file_path]["state"] = "original"
+
+
+def _check_file(file_path: str, file_data: "KnowledgeImport") -> tuple[str, int, int, bool]:
+    # (checksum, mtime_ns, size, hashed), unchanged mtime and size skip reading the file
+    stat = os.stat(file_path)
+    if (
+        file_data.get("checksum")
+        and file_data.get("mtime_ns") == stat.st_mtime_ns
+        and file_data.get("size") == stat.st_size
+    ):
+        return file_data["checksum"], stat.st_mtime_ns, stat.st_size, False
+    return calculate_checksum(file_path), stat.st_mtime_ns, stat.st_size, True
+
+
+async def load_knowledge(
     log_item: LogItem | None,
     knowledge_dir: str,
     index: Dict[str, KnowledgeImport],
     metadata: dict[str, Any] = {},
     filename_pattern: str = "**/*",
     recursive: bool = True,
+    stats: PreloadStats | None = None,
 ) -> Dict[str, KnowledgeImport]:
     """
     Load knowledge files from a directory with change detection and metadata enhancement.
 
-    This function now includes enhanced error handling and compatibility with the
-    intelligent memory consolidation system.
+    Files with unchanged mtime and size are not read, changed files are parsed in parallel.
+    Timings of the phases are added to stats when given.
     """
 
-    # Mapping file extensions to corresponding loader classes
-    # Note: Using TextLoader for JSON and MD to avoid parsing issues with consolidation
-    file_types_loaders = {
-        "txt": TextLoader,
-        "pdf": PyPDFLoader,
-        "csv": CSVLoader,
-        "html": UnstructuredHTMLLoader,
-        "json": TextLoader,  # Use TextLoader for better consolidation compatibility
-        "md": TextLoader,    # Use TextLoader for better consolidation compatibility
-    }
-
     cnt_files = 0
     cnt_docs = 0
 
@@ -95,7 +179,10 @@ def load_knowledge(
         PrintStyle(font_color="red").print(error_msg)
         return index
 
+    stats = stats or PreloadStats()
+
     # Fetch all files in the directory with specified extensions
+    started = time.perf_counter()
     try:
         kn_files = glob.glob(os.path.join(knowledge_dir, filename_pattern), recursive=recursive)
         kn_files = [f for f in kn_files if os.path.isfile(f) and not os.path.basename(f).startswith('.')]
@@ -104,6 +191,8 @@ def load_knowledge(
         if log_item:
             log_item.stream(progress=f"\nError scanning directory: {e}")
         return index
+    finally:
+        stats.add_time("scan", started)
 
     if kn_files:
         PrintStyle.standard(
@@ -114,84 +203,95 @@ def load_knowledge(
                 progress=f"\nFound {len(kn_files)} knowledge files in {knowledge_dir}, processing...",
             )
 
+    # Check files for changes, only files with a new mtime or size are hashed
+    started = time.perf_counter()
+    candidates: list[tuple[str, str, KnowledgeImport]] = []
     for file_path in kn_files:
-        try:
-            # Get file extension safely
-            file_parts = os.path.basename(file_path).split('.')
-            if len(file_parts) < 2:
-                continue  # Skip files without extensions
-
-            ext = file_parts[-1].lower()
-            if ext not in file_types_loaders:
-                continue  # Skip unsupported file types
-
-            checksum = calculate_checksum(file_path)
-            if not checksum:
-                continue  # Skip files with checksum errors
-
-            file_key = file_path
-
-            # Load existing data from the index or create a new entry
-            file_data: KnowledgeImport = index.get(file_key, {
-                "file": file_key,
-                "checksum": "",
-                "ids": [],
-                "state": "changed",
-                "documents": []
-            })
-
-            # Check if file has changed
-            if file_data.get("checksum") == checksum:
-                file_data["state"] = "original"
-            else:
-                file_data["state"] = "changed"
-
-            # Process changed files
-            if file_data["state"] == "changed":
-                file_data["checksum"] = checksum
-                loader_cls = file_types_loaders[ext]
-
-                try:
-                    loader = loader_cls(
-                        file_path,
-                        **(
-                            text_loader_kwargs
-                            if ext in ["txt", "csv", "html", "md"]
-                            else {}
-                        ),
-                    )
-                    documents = loader.load_and_split()
-
-                    # Enhanced metadata for better consolidation compatibility
-                    enhanced_metadata = {
-                        **metadata,
-                        "source_file": os.path.basename(file_path),
-                        "source_path": file_path,
-                        "file_type": ext,
-                        "knowledge_source": True,  # Flag to distinguish from conversation memories
-                        "import_timestamp": None,  # Will be set when inserted into memory
-                    }
-
-                    # Apply metadata to all documents
-                    for doc in documents:
-                        doc.metadata = {**doc.metadata, **enhanced_metadata}
-
-                    file_data["documents"] = documents
-                    cnt_files += 1
-                    cnt_docs += len(documents)
-
-                except Exception as e:
-                    PrintStyle(font_color="red").print(f"Error loading {file_path}: {e}")
-                    if log_item:
-                        log_item.stream(progress=f"\nError loading {os.path.basename(file_path)}: {e}")
-                    continue
-
-            # Update the index
-            index[file_key] = file_data
-
-        except Exception as e:
-            PrintStyle(font_color="red").print(f"Error processing {file_path}: {e}")
+        # Get file extension safely
+        file_parts = os.path.basename(file_path).split('.')
+        if len(file_parts) < 2:
+            continue  # Skip files without extensions
+
+        ext = file_parts[-1].lower()
+        if ext not in file_types_loaders:
+            continue  # Skip unsupported file types
+
+        file_key = file_path
+
+        # Load existing data from the index or create a new entry, the index entry is only
+        # replaced once the file has been processed
+        file_data: KnowledgeImport = {**index[file_key]} if file_key in index else {
+            "file": file_key,
+            "checksum": "",
+            "ids": [],
+            "state": "changed",
+            "documents": []
+        }
+        candidates.append((file_path, ext, file_data))
+
+    checks = await asyncio.gather(
+        *[asyncio.to_thread(_check_file, file_path, file_data) for file_path, _, file_data in candidates],
+        return_exceptions=True,
+    )
+    changed: list[tuple[str, str, KnowledgeImport]] = []
+    for (file_path, ext, file_data), check in zip(candidates, checks):
+        if isinstance(check, BaseException):
+            PrintStyle(font_color="red").print(f"Error processing {file_path}: {check}")
+            _keep_previous(index, file_path)
             continue
+        checksum, mtime_ns, size, hashed = check
+        stats.files += 1
+        stats.hashed += int(hashed)
+        file_data["mtime_ns"] = mtime_ns
+        file_data["size"] = size
+
+        # Check if file has changed
+        if file_data.get("checksum") == checksum:
+            file_data["state"] = "original"
+            index[file_path] = file_data
+        else:
+            file_data["state"] = "changed"
+            file_data["checksum"] = checksum
+            changed.append((file_path, ext, file_data))
+    stats.add_time("check", started)
+
+    # Process changed files
+    started = time.perf_counter()
+    loaded = await asyncio.gather(
+        *[_load_file_async(file_path, ext) for file_path, ext, _ in changed],
+        return_exceptions=True,
+    )
+    for (file_path, ext, file_data), documents in zip(changed, loaded):
+        if isinstance(documents, BaseException):
+            PrintStyle(font_color="red").print(f"Error loading {file_path}: {documents}")
+            if log_item:
+                log_item.stream(progress=f"\nError loading {os.path.basename(file_path)}: {documents}")
+            _keep_previous(index, file_path)
+            continue
+
+        # Enhanced metadata for better consolidation compatibility
+        enhanced_metadata = {
+            **metadata,
+            "source_file": os.path.basename(file_path),
+            "source_path": file_path,
+            "file_type": ext,
+            "knowledge_source": True,  # Flag to distinguish from conversation memories
+            "import_timestamp": None,  # Will be set when inserted into memory
+        }
+
+        # Apply metadata to all documents
+        for doc in documents:
+            doc.metadata = {**doc.metadata, **enhanced_metadata}
+
+        file_data["documents"] = documents
+        cnt_files += 1
+        cnt_docs += len(documents)
+
+        # Update the index
+        index[file_path] = file_data
+    stats.parsed += cnt_files
+    stats.documents += cnt_docs
+    stats.add_time("parse", started)
 
     # Mark removed files
     current_files = set(kn_files)
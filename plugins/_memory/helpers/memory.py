@@ -1,11 +1,11 @@
+from dataclasses import replace
 from datetime import datetime
-from typing import Any, List, Sequence
-from langchain.storage import InMemoryByteStore, LocalFileStore
-from langchain.embeddings import CacheBackedEmbeddings
-from helpers import guids
+from typing import Any
+from helpers import guids, embedding_cache
+from helpers.metadata_index import MetadataFilter
+from helpers.vector_db import MyFaiss as VectorDBFaiss
 
 # from langchain_chroma import Chroma
-from langchain_community.vectorstores import FAISS
 
 # faiss needs to be patched for python 3.12 on arm #TODO remove once not needed
 from helpers import faiss_monkey_patch
@@ -18,14 +18,15 @@ from langchain_community.vectorstores.utils import (
 )
 from langchain_core.embeddings import Embeddings
 
-import os, json, hashlib, re
+import os, json, hashlib, re, asyncio, time, uuid
 
 import numpy as np
 
 from helpers.print_style import PrintStyle
 from helpers import files, plugins, projects
 from langchain_core.documents import Document
-from . import knowledge_import
+from . import knowledge_import, memory_index, memory_persistence
+from .memory_index import IndexConfig
 from helpers.log import Log, LogItem
 from enum import Enum
 from agent import Agent, AgentContext
@@ -38,17 +39,56 @@ from simpleeval import simple_eval
 logging.getLogger("langchain_core.vectorstores.base").setLevel(logging.ERROR)
 
 
-class MyFaiss(FAISS):
-    # override aget_by_ids
-    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
-        # return all self.docstore._dict[id] in ids
-        return [self.docstore._dict[id] for id in (ids if isinstance(ids, list) else [ids]) if id in self.docstore._dict]  # type: ignore
-
-    async def aget_by_ids(self, ids: Sequence[str], /) -> List[Document]:
-        return self.get_by_ids(ids)
+class MyFaiss(VectorDBFaiss):
+    index_config: IndexConfig = IndexConfig()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # snapshots of an HNSW index keep the vectors deleted before they were written
+        self._tombstones = memory_index.get_tombstones(self.index, self.index_to_docstore_id)
+
+    # override FAISS.__add, it assumes positional labels that approximate indexes do not use
+    def _FAISS__add(self, texts, embeddings, metadatas=None, ids=None):
+        if not memory_index.is_id_mapped(self.index):
+            return super()._FAISS__add(texts, embeddings, metadatas=metadatas, ids=ids)  # type: ignore
+
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        _metadatas = metadatas or [{} for _ in texts]
+        documents = [
+            Document(id=id_, page_content=t, metadata=m)
+            for id_, t, m in zip(ids, texts, _metadatas)
+        ]
+        start = max(max(self.index_to_docstore_id, default=-1), max(self._tombstones, default=-1)) + 1
+        labels = list(range(start, start + len(ids)))
+        memory_index.add_vectors(self.index, np.array(embeddings, dtype=np.float32), labels)
+        self.docstore.add({id_: doc for id_, doc in zip(ids, documents)})  # type: ignore
+        self.index_to_docstore_id.update(zip(labels, ids))
+        self._on_added(ids)
+        return ids
 
-    def get_all_docs(self):
-        return self.docstore._dict  # type: ignore
+    # override delete, labels of approximate indexes are kept instead of renumbered
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        if not memory_index.is_id_mapped(self.index):
+            return super().delete(ids, **kwargs)
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+
+        reversed_index = {id_: label for label, id_ in self.index_to_docstore_id.items()}
+        missing_ids = set(ids).difference(reversed_index)
+        if missing_ids:
+            raise ValueError(
+                f"Some specified ids do not exist in the current store. Ids not found: {missing_ids}"
+            )
+        labels = [reversed_index[id_] for id_ in ids]
+        if not memory_index.remove_labels(self.index, labels):
+            # rebuilt later off the event loop, see Memory._rebuild_index_if_needed
+            self._tombstones.update(labels)
+        self.docstore.delete(ids)  # type: ignore
+        for label in labels:
+            del self.index_to_docstore_id[label]
+        self._on_deleted(ids)
+        return True
 
 
 class Memory:
@@ -60,6 +100,11 @@ class Memory:
 
     index: dict[str, "MyFaiss"] = {}
 
+    @staticmethod
+    def _get_index_config(agent=None) -> IndexConfig:
+        config = plugins.get_plugin_config("_memory", agent) or {}
+        return IndexConfig.from_dict(config.get("index_config"))
+
     @staticmethod
     def _get_embedding_config(agent=None):
         from plugins._model_config.helpers.model_config import get_embedding_model_config_object
@@ -73,11 +118,12 @@ class Memory:
                 type="util",
                 heading=f"Initializing VectorDB in '/{memory_subdir}'",
             )
-            db, created = Memory.initialize(
+            db, created = await Memory.initialize(
                 log_item,
                 Memory._get_embedding_config(agent),
                 memory_subdir,
                 False,
+                index_config=Memory._get_index_config(agent),
             )
             Memory.index[memory_subdir] = db
             wrap = Memory(db, memory_subdir=memory_subdir)
@@ -104,11 +150,12 @@ class Memory:
 
             agent_config = initialize.initialize_agent()
             model_config = Memory._get_embedding_config()
-            db, _created = Memory.initialize(
+            db, _created = await Memory.initialize(
                 log_item=log_item,
                 model_config=model_config,
                 memory_subdir=memory_subdir,
                 in_memory=False,
+                index_config=Memory._get_index_config(),
             )
             wrap = Memory(db, memory_subdir=memory_subdir)
             if preload_knowledge:
@@ -130,11 +177,12 @@ class Memory:
         return await Memory.get(agent)
 
     @staticmethod
-    def initialize(
+    async def initialize(
         log_item: LogItem | None,
         model_config: models.ModelConfig,
         memory_subdir: str,
         in_memory=False,
+        index_config: IndexConfig | None = None,
     ) -> tuple[MyFaiss, bool]:
 
         PrintStyle.standard("Initializing VectorDB...")
@@ -142,32 +190,25 @@ class Memory:
         if log_item:
             log_item.stream(progress="\nInitializing VectorDB")
 
-        em_dir = files.get_abs_path(
-            "tmp/memory/embeddings"
-        )  # just caching, no need to parameterize
         db_dir = abs_db_dir(memory_subdir)
 
-        # make sure embeddings and database directories exist
+        # make sure database directory exists
         os.makedirs(db_dir, exist_ok=True)
 
-        if in_memory:
-            store = InMemoryByteStore()
-        else:
-            os.makedirs(em_dir, exist_ok=True)
-            store = LocalFileStore(em_dir)
+        # pending writes of a previous instance are part of the journal replayed below
+        persister = memory_persistence.get_persister(db_dir)
+        persister.cancel()
 
         embeddings_model = models.get_embedding_model(
             model_config.provider,
             model_config.name,
+            model_config=model_config,
             **model_config.build_kwargs(),
         )
-        embeddings_model_id = files.safe_file_name(
-            model_config.provider + "_" + model_config.name
-        )
 
-        # here we setup the embeddings model with the chosen cache storage
-        embedder = CacheBackedEmbeddings.from_bytes_store(
-            embeddings_model, store, namespace=embeddings_model_id
+        # here we setup the embeddings model with the shared embedding cache, same model id as VectorDB
+        embedder = embedding_cache.get_cached_embeddings(
+            embeddings_model, embedding_cache.get_model_id(embeddings_model), persistent=not in_memory
         )
 
         # initial DB and docs variables
@@ -191,6 +232,9 @@ class Memory:
                     # normalize_L2=True,
                     relevance_score_fn=Memory._cosine_normalizer,
                 )  # type: ignore
+                # apply mutations not yet compacted into the snapshot
+                if persister.replay(db):
+                    Memory._save_db_file(db, memory_subdir)
 
             # if there is a mismatch in embeddings used, re-index the whole DB
             emb_ok = False
@@ -209,9 +253,11 @@ class Memory:
                 docs = db.get_all_docs()
                 db = None
 
+        index_config = index_config or IndexConfig()
+
         # DB not loaded, create one
         if not db:
-            index = faiss.IndexFlatIP(len(embedder.embed_query("example")))
+            index = faiss.IndexFlatIP(await embedder.aget_dimensions())
 
             db = MyFaiss(
                 embedding_function=embedder,
@@ -228,7 +274,9 @@ class Memory:
                 PrintStyle.standard("Indexing memories...")
                 if log_item:
                     log_item.stream(progress="\nIndexing memories")
-                db.add_documents(documents=list(docs.values()), ids=list(docs.keys()))
+                await db.aadd_documents(
+                    documents=list(docs.values()), ids=list(docs.keys())
+                )
 
             # save DB
             Memory._save_db_file(db, memory_subdir)
@@ -246,8 +294,40 @@ class Memory:
 
             created = True
 
+        db.index_config = index_config
+        memory_index.apply_search_params(db.index, index_config)
+        if await Memory._rebuild_index_if_needed(db, memory_subdir):
+            Memory._save_db_file(db, memory_subdir)
+
+        persister.attach(db)
         return db, created
 
+    @staticmethod
+    async def _rebuild_index_if_needed(db: MyFaiss, memory_subdir: str) -> bool:
+        config = db.index_config
+        if not memory_index.needs_rebuild(db.index, config):
+            if not memory_index.needs_compaction(db.index, len(db._tombstones)):
+                return False
+            # drop deleted vectors, the index keeps its current type
+            config = replace(config, type=memory_index.get_index_type(db.index))
+
+        PrintStyle.standard(f"Building '{config.type}' memory index...")
+        mapping = dict(db.index_to_docstore_id)
+        labels = sorted(mapping)
+        # vectors are copied here, training and filling runs in a worker thread
+        vectors = memory_index.get_vectors(db.index, labels)
+        index = await asyncio.to_thread(memory_index.build_index, db.index.d, config, vectors)
+
+        persister = memory_persistence.get_persister(abs_db_dir(memory_subdir))
+        with persister.lock:
+            # the db changed while building, try again on the next insert or delete
+            if db.index_to_docstore_id != mapping:
+                return False
+            db.index = index
+            db.index_to_docstore_id = {i: mapping[label] for i, label in enumerate(labels)}
+            db._tombstones = set()
+        return True
+
     def __init__(
         self,
         db: MyFaiss,
@@ -255,6 +335,7 @@ class Memory:
     ):
         self.db = db
         self.memory_subdir = memory_subdir
+        self._persister = memory_persistence.get_persister(abs_db_dir(memory_subdir))
 
     async def preload_knowledge(
         self, log_item: LogItem | None, kn_dirs: list[str], memory_subdir: str
@@ -278,19 +359,39 @@ class Memory:
                 index = json.load(f)
 
         # preload knowledge folders
-        index = self._preload_knowledge_folders(log_item, kn_dirs, index)
+        stats = knowledge_import.PreloadStats()
+        index = await self._preload_knowledge_folders(log_item, kn_dirs, index, stats)
 
+        started = time.perf_counter()
+        kept = inserted = deleted = 0
         for file in index:
-            if index[file]["state"] in ["changed", "removed"] and index[file].get(
-                "ids", []
-            ):  # for knowledge files that have been changed or removed and have IDs
-                await self.delete_documents_by_ids(
-                    index[file]["ids"]
-                )  # remove original version
-            if index[file]["state"] == "changed":
-                index[file]["ids"] = await self.insert_documents(
-                    index[file]["documents"]
-                )  # insert new version
+            state = index[file]["state"]
+            if state == "removed" and index[file].get("ids", []):
+                deleted += len(await self.delete_documents_by_ids(index[file]["ids"]))
+            elif state == "changed":
+                # chunks that did not change keep their documents, only the rest is re-embedded
+                ids, hashes, removed = self._diff_knowledge_chunks(
+                    index[file].get("ids", []),
+                    index[file].get("chunks", []),
+                    index[file]["documents"],
+                )
+                if removed:
+                    deleted += len(await self.delete_documents_by_ids(removed))
+                new_docs = [doc for doc, id in zip(index[file]["documents"], ids) if not id]
+                new_ids = iter(await self.insert_documents(new_docs))
+                kept += len(ids) - len(new_docs)
+                inserted += len(new_docs)
+                index[file]["ids"] = [id or next(new_ids) for id in ids]
+                index[file]["chunks"] = hashes
+        stats.add_time("index", started)
+
+        summary = (
+            f"Knowledge preload: {stats.format()}, "
+            f"{kept} chunks kept, {inserted} inserted, {deleted} deleted"
+        )
+        PrintStyle.standard(summary)
+        if log_item:
+            log_item.stream(progress=f"\n{summary}")
 
         # remove index where state="removed"
         index = {k: v for k, v in index.items() if v["state"] != "removed"}
@@ -304,36 +405,67 @@ class Memory:
         with open(index_path, "w") as f:
             json.dump(index, f)
 
-    def _preload_knowledge_folders(
+    async def _preload_knowledge_folders(
         self,
         log_item: LogItem | None,
         kn_dirs: list[str],
         index: dict[str, knowledge_import.KnowledgeImport],
+        stats: knowledge_import.PreloadStats | None = None,
     ):
         # load knowledge folders, subfolders by area
         for kn_dir in kn_dirs:
             # everything in the root of the knowledge goes to main
-            index = knowledge_import.load_knowledge(
+            index = await knowledge_import.load_knowledge(
                 log_item,
                 abs_knowledge_dir(kn_dir),
                 index,
                 {"area": Memory.Area.MAIN.value},
                 filename_pattern="*",
                 recursive=False,
+                stats=stats,
             )
             # subdirectories go to their folders
             for area in Memory.Area:
-                index = knowledge_import.load_knowledge(
+                index = await knowledge_import.load_knowledge(
                     log_item,
                     # files.get_abs_path("knowledge", kn_dir, area.value),
                     abs_knowledge_dir(kn_dir, area.value),
                     index,
                     {"area": area.value},
                     recursive=True,
+                    stats=stats,
                 )
 
         return index
 
+    def _diff_knowledge_chunks(
+        self, old_ids: list[str], old_hashes: list[str], documents: list[Document]
+    ) -> tuple[list[str], list[str], list[str]]:
+        """
+        Match new chunks of a knowledge file against the previously imported ones.
+
+        Returns the id of each new chunk ("" when it has to be inserted), the chunk hashes
+        and the ids of previous chunks to delete.
+        """
+        # indexes without chunk hashes predate the diffing, everything is replaced
+        available: dict[str, list[str]] = {}
+        if len(old_hashes) == len(old_ids):
+            existing = {doc.metadata["id"] for doc in self.db.get_by_ids(old_ids)}
+            for chunk_hash, id in zip(old_hashes, old_ids):
+                if id in existing:
+                    available.setdefault(chunk_hash, []).append(id)
+
+        ids: list[str] = []
+        hashes: list[str] = []
+        for doc in documents:
+            chunk_hash = knowledge_import.calculate_chunk_hash(doc.page_content, doc.metadata)
+            matches = available.get(chunk_hash)
+            ids.append(matches.pop(0) if matches else "")
+            hashes.append(chunk_hash)
+        kept = set(ids)
+        removed = [id for id in old_ids if id not in kept]
+        return ids, hashes, removed
+
     def get_document_by_id(self, id: str) -> Document | None:
         return self.db.get_by_ids(id)[0]
 
@@ -362,6 +494,27 @@ class Memory:
             filter=comparator,
         )
 
+    async def search_areas_similarity_threshold(
+        self, query: str, quotas: list[tuple[list[str], int]], threshold: float
+    ) -> list[list[Document]]:
+        """Search several groups of areas with their own limits, the query is embedded once
+        and the candidates of all groups are searched together."""
+        embedding = await self.db.embedding_function.aembed_query(query)  # type: ignore
+        filters = [
+            (Memory._get_comparator(f"area in {[str(area) for area in areas]!r}"), limit)
+            for areas, limit in quotas
+        ]
+        results = await asyncio.to_thread(
+            self.db.similarity_search_with_relevance_by_quotas,
+            embedding,
+            filters,
+            threshold,
+        )
+        return [[doc for doc, _score in docs] for docs in results]
+
+    async def search_by_metadata(self, filter: str, limit: int = 0) -> list[Document]:
+        return self.db.search_by_metadata(Memory._get_comparator(filter), limit=limit)
+
     async def delete_documents_by_query(
         self, query: str, threshold: float, filter: str = ""
     ):
@@ -385,15 +538,14 @@ class Memory:
                 # fnd = self.db.get(where={"id": {"$in": document_ids}})
                 # if fnd["ids"]: self.db.delete(ids=fnd["ids"])
                 # tot += len(fnd["ids"])
-                await self.db.adelete(ids=document_ids)
+                self._persister.delete(self.db, document_ids)
                 tot += len(document_ids)
 
             # If fewer than K document IDs, break the loop
             if len(document_ids) < k:
                 break
 
-        if tot:
-            self._save_db()  # persist
+        await Memory._rebuild_index_if_needed(self.db, self.memory_subdir)
         return removed
 
     async def delete_documents_by_ids(self, ids: list[str]):
@@ -403,10 +555,8 @@ class Memory:
         )  # existing docs to remove (prevents error)
         if rem_docs:
             rem_ids = [doc.metadata["id"] for doc in rem_docs]  # ids to remove
-            await self.db.adelete(ids=rem_ids)
-
-        if rem_docs:
-            self._save_db()  # persist
+            self._persister.delete(self.db, rem_ids)  # journaled, saved in background
+            await Memory._rebuild_index_if_needed(self.db, self.memory_subdir)
         return rem_docs
 
     async def insert_text(self, text, metadata: dict = {}):
@@ -425,19 +575,20 @@ class Memory:
                 if not doc.metadata.get("area", ""):
                     doc.metadata["area"] = Memory.Area.MAIN.value
 
-            await self.db.aadd_documents(documents=docs, ids=ids)
-            self._save_db()  # persist
+            await self._add_documents(docs, ids)
+            await Memory._rebuild_index_if_needed(self.db, self.memory_subdir)
         return ids
 
     async def update_documents(self, docs: list[Document]):
         ids = [doc.metadata["id"] for doc in docs]
-        await self.db.adelete(ids=ids)  # delete originals
-        ins = await self.db.aadd_documents(documents=docs, ids=ids)  # add updated
-        self._save_db()  # persist
-        return ins
+        await self._add_documents(docs, ids)  # replaces originals
+        return ids
 
-    def _save_db(self):
-        Memory._save_db_file(self.db, self.memory_subdir)
+    async def _add_documents(self, docs: list[Document], ids: list[str]):
+        # embed first, the db is only locked for the insert itself
+        texts = [doc.page_content for doc in docs]
+        vectors = await self.db.embedding_function.aembed_documents(texts)  # type: ignore
+        self._persister.add(self.db, ids, texts, [doc.metadata for doc in docs], vectors)
 
     def _generate_doc_id(self):
         while True:
@@ -448,22 +599,9 @@ class Memory:
     @staticmethod
     def _save_db_file(db: MyFaiss, memory_subdir: str):
         abs_dir = abs_db_dir(memory_subdir)
-        db.save_local(folder_path=abs_dir)
-        Memory._write_index_hash(abs_dir)
-
-    @staticmethod
-    def _write_index_hash(abs_dir: str) -> None:
-        faiss_path = os.path.join(abs_dir, "index.faiss")
-        hash_path = os.path.join(abs_dir, "index.faiss.sha256")
-        try:
-            h = hashlib.sha256()
-            with open(faiss_path, "rb") as f:
-                for chunk in iter(lambda: f.read(65536), b""):
-                    h.update(chunk)
-            with open(hash_path, "w") as f:
-                f.write(h.hexdigest())
-        except Exception as e:
-            PrintStyle(font_color="yellow").print(f"Warning: could not write FAISS hash: {e}")
+        memory_persistence.save_db(db, abs_dir)
+        # the snapshot contains everything journaled so far
+        memory_persistence.get_persister(abs_dir).clear_journal()
 
     @staticmethod
     def _verify_index_hash(abs_dir: str) -> bool:
@@ -502,7 +640,7 @@ class Memory:
                 PrintStyle.error(f"Error evaluating condition: {e}")
                 return False
 
-        return comparator
+        return MetadataFilter(condition, comparator)
 
     @staticmethod
     def _score_normalizer(val: float) -> float:
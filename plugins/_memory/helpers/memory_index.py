@@ -0,0 +1,172 @@
+import math
+from dataclasses import dataclass, fields
+from typing import Any
+
+import numpy as np
+
+# faiss needs to be patched for python 3.12 on arm #TODO remove once not needed
+from helpers import faiss_monkey_patch
+import faiss
+
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+MAX_TOMBSTONE_FRACTION = 0.2  # share of deleted vectors an index that can not remove them keeps before a rebuild
+
+
+@dataclass
+class IndexConfig:
+    """Configuration of the FAISS index used by a memory database."""
+    type: str = "flat"
+    train_threshold: int = 50000  # vectors required before switching from flat to the configured index
+    nlist: int = 0  # IVF cells, 0 picks 4 * sqrt(n)
+    nprobe: int = 16  # IVF cells visited per search
+    pq_m: int = 16  # PQ sub-quantizers, reduced to a divisor of the dimension
+    pq_bits: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 80
+    ef_search: int = 64
+
+    @staticmethod
+    def from_dict(data: dict[str, Any] | None) -> "IndexConfig":
+        data = data or {}
+        known = {f.name for f in fields(IndexConfig)}
+        config = IndexConfig(**{k: v for k, v in data.items() if k in known})
+        if config.type not in INDEX_TYPES:
+            config.type = "flat"
+        return config
+
+
+def is_id_mapped(index: Any) -> bool:
+    # flat indexes use positional labels that shift on delete (what langchain FAISS expects),
+    # approximate indexes keep explicit labels: IVF natively, HNSW through IndexIDMap2
+    return isinstance(index, (faiss.IndexIVF, faiss.IndexIDMap2))
+
+
+def get_index_type(index: Any) -> str:
+    if isinstance(index, faiss.IndexIDMap2):
+        if isinstance(faiss.downcast_index(index.index), faiss.IndexHNSWFlat):
+            return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    return "flat"
+
+
+def needs_rebuild(index: Any, config: IndexConfig) -> bool:
+    if get_index_type(index) == config.type:
+        return False
+    # approximate indexes are only worth training once there is enough data
+    if config.type != "flat" and index.ntotal < config.train_threshold:
+        return False
+    return True
+
+
+def create_index(dimensions: int, config: IndexConfig, vectors: np.ndarray | None = None):
+    """Create an empty index of the configured type, IVF indexes are trained on the given vectors."""
+    n = 0 if vectors is None else len(vectors)
+
+    if config.type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dimensions, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = config.ef_construction
+        index = faiss.IndexIDMap2(inner)
+
+    elif config.type in ("ivf_flat", "ivf_pq") and n:
+        nlist = config.nlist or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n // 39 or 1))  # faiss wants ~39 training points per cell
+        quantizer = faiss.IndexFlatIP(dimensions)
+        if config.type == "ivf_pq":
+            m = _largest_divisor(dimensions, config.pq_m)
+            index = faiss.IndexIVFPQ(
+                quantizer, dimensions, nlist, m, config.pq_bits, faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimensions, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+
+    else:
+        return faiss.IndexFlatIP(dimensions)
+
+    apply_search_params(index, config)
+    return index
+
+
+def apply_search_params(index: Any, config: IndexConfig):
+    if isinstance(index, faiss.IndexIDMap2):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSWFlat):
+            inner.hnsw.efSearch = config.ef_search
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = config.nprobe
+        # vectors are reconstructed by label when the index is rebuilt
+        if index.direct_map.type != faiss.DirectMap.Hashtable:
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+
+def get_vectors(index: Any, labels: list[int]) -> np.ndarray:
+    """Vectors stored in the index for the given labels, nothing is re-embedded."""
+    if not labels:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if is_id_mapped(index):
+        vectors = np.vstack([index.reconstruct(int(label)) for label in labels])
+    else:
+        vectors = index.reconstruct_n(0, index.ntotal)[labels]
+    return vectors.astype(np.float32)
+
+
+def build_index(dimensions: int, config: IndexConfig, vectors: np.ndarray):
+    """Create, train and fill an index, vectors get labels 0..n-1 in order."""
+    index = create_index(dimensions, config, vectors)
+    add_vectors(index, vectors, list(range(len(vectors))))
+    return index
+
+
+def rebuild_index(
+    index: Any, index_to_docstore_id: dict[int, str], config: IndexConfig
+) -> tuple[Any, dict[int, str]]:
+    """Build a new index of the configured type from the vectors of the current one.
+
+    Returns the new index and the matching label to docstore id mapping."""
+    labels = sorted(index_to_docstore_id.keys())
+    vectors = get_vectors(index, labels)
+    new_index = build_index(index.d, config, vectors)
+    return new_index, {i: index_to_docstore_id[label] for i, label in enumerate(labels)}
+
+
+def add_vectors(index: Any, vectors: np.ndarray, labels: list[int]):
+    if not len(labels):
+        return
+    if is_id_mapped(index):
+        index.add_with_ids(vectors, np.array(labels, dtype=np.int64))
+    else:
+        index.add(vectors)
+
+
+def remove_labels(index: Any, labels: list[int]) -> bool:
+    """Remove vectors from an id mapped index.
+
+    Returns False when the index can not remove vectors (HNSW), the caller keeps the labels
+    as tombstones excluded from searches until the index is rebuilt."""
+    if get_index_type(index) == "hnsw":
+        return False
+    index.remove_ids(np.array(labels, dtype=np.int64))
+    return True
+
+
+def get_tombstones(index: Any, index_to_docstore_id: dict[int, str]) -> set[int]:
+    """Labels stored in the index that no longer belong to a document."""
+    if not isinstance(index, faiss.IndexIDMap2):
+        return set()
+    return set(faiss.vector_to_array(index.id_map).tolist()).difference(index_to_docstore_id)
+
+
+def needs_compaction(index: Any, tombstones: int) -> bool:
+    # searches skip tombstones through a selector, rebuild once they take a noticeable share of the graph
+    return tombstones > 0 and tombstones >= index.ntotal * MAX_TOMBSTONE_FRACTION
+
+
+def _largest_divisor(n: int, limit: int) -> int:
+    for m in range(min(limit, n), 0, -1):
+        if n % m == 0:
+            return m
+    return 1
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from typing import Any
+
+import numpy as np
+
+# faiss needs to be patched for python 3.12 on arm #TODO remove once not needed
+from helpers import faiss_monkey_patch
+import faiss
+
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from helpers.print_style import PrintStyle
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+HASH_FILE = "index.faiss.sha256"
+JOURNAL_FILE = "journal.pkl"
+
+COMPACT_DELAY = 10  # seconds without mutations before the journal is compacted into a snapshot
+COMPACT_MAX_DELAY = 120  # compact at the latest this long after the first pending mutation
+COMPACT_JOURNAL_BYTES = 32 * 1024 * 1024  # compact right away once the journal is this large
+
+
+class MemoryPersister:
+    """Write-behind persistence of a memory database.
+
+    Mutations are applied to the database and appended to a journal under one lock,
+    a timer thread later writes a full snapshot and drops the compacted journal records.
+    Journal records are upserts and deletes by document id, so replaying records that
+    are already part of the snapshot is harmless."""
+
+    def __init__(self, abs_dir: str):
+        self.abs_dir = abs_dir
+        self.lock = threading.RLock()
+        self.db: Any = None
+        self._timer: threading.Timer | None = None
+        self._first_pending: float = 0
+        self._compacting = threading.Lock()
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.abs_dir, JOURNAL_FILE)
+
+    def attach(self, db: Any):
+        with self.lock:
+            self.cancel()
+            self.db = db
+
+    def add(self, db: Any, ids: list[str], texts: list[str], metadatas: list[dict], vectors: list[list[float]]):
+        with self.lock:
+            _upsert(db, ids, texts, metadatas, vectors)
+            self._append(("add", ids, texts, metadatas, np.asarray(vectors, dtype=np.float32)))
+
+    def delete(self, db: Any, ids: list[str]):
+        if not ids:
+            return
+        with self.lock:
+            db.delete(ids)
+            self._append(("delete", ids))
+
+    def replay(self, db: Any) -> int:
+        """Apply journal records on top of a freshly loaded snapshot, returns the number of records."""
+        count = 0
+        for record in self._read_journal():
+            if record[0] == "add":
+                _, ids, texts, metadatas, vectors = record
+                _upsert(db, ids, texts, metadatas, vectors.tolist())
+            elif record[0] == "delete":
+                existing = [id for id in record[1] if id in db.docstore._dict]
+                if existing:
+                    db.delete(existing)
+            count += 1
+        return count
+
+    def save(self):
+        """Write a snapshot of the attached database now and clear the journal."""
+        with self._compacting:
+            with self.lock:
+                self.cancel()
+                if self.db is None:
+                    return
+                # copying is cheap compared to serializing, mutations only wait for the copy
+                snapshot = _snapshot(self.db)
+                journal_size = _file_size(self.journal_path)
+            write_snapshot(self.abs_dir, *_serialize(*snapshot))
+            with self.lock:
+                self._drop_journal_head(journal_size)
+
+    def clear_journal(self):
+        with self.lock:
+            self.cancel()
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+    def cancel(self):
+        with self.lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._first_pending = 0
+
+    def _append(self, record: tuple):
+        with open(self.journal_path, "ab") as f:
+            pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+        self._schedule(size)
+
+    def _schedule(self, journal_size: int):
+        now = time.monotonic()
+        if not self._first_pending:
+            self._first_pending = now
+        if journal_size >= COMPACT_JOURNAL_BYTES:
+            delay = 0.0
+        else:
+            # debounce bursts of mutations, but do not postpone the snapshot forever
+            delay = min(COMPACT_DELAY, max(0.0, self._first_pending + COMPACT_MAX_DELAY - now))
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._compact)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _compact(self):
+        try:
+            self.save()
+        except Exception as e:
+            PrintStyle.error(f"Failed to save memory database '{self.abs_dir}': {e}")
+
+    def _read_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+                except Exception:
+                    # torn write at the end of the journal, the rest is lost
+                    PrintStyle(font_color="yellow").print(
+                        f"Warning: memory journal in '{self.abs_dir}' is truncated, skipping the rest."
+                    )
+                    return
+
+    def _drop_journal_head(self, size: int):
+        # records appended while the snapshot was written are kept
+        path = self.journal_path
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            f.seek(size)
+            tail = f.read()
+        if not tail:
+            os.remove(path)
+            return
+        _write_atomic(path, tail)
+        self._schedule(len(tail))
+
+
+def write_snapshot(abs_dir: str, index_bytes: bytes, docstore_bytes: bytes):
+    # the hash is computed from the serialized buffer, the index file is never read back
+    os.makedirs(abs_dir, exist_ok=True)
+    _write_atomic(os.path.join(abs_dir, INDEX_FILE), index_bytes)
+    _write_atomic(os.path.join(abs_dir, DOCSTORE_FILE), docstore_bytes)
+    _write_atomic(
+        os.path.join(abs_dir, HASH_FILE),
+        hashlib.sha256(index_bytes).hexdigest().encode("utf-8"),
+    )
+
+
+def save_db(db: Any, abs_dir: str):
+    write_snapshot(abs_dir, *_serialize(db.index, db.docstore, dict(db.index_to_docstore_id)))
+
+
+def _snapshot(db: Any) -> tuple[Any, InMemoryDocstore, dict[int, str]]:
+    # updates replace documents instead of editing them, a shallow copy of the docstore is enough
+    return (
+        faiss.clone_index(db.index),
+        InMemoryDocstore(dict(db.docstore._dict)),
+        dict(db.index_to_docstore_id),
+    )
+
+
+def _serialize(index: Any, docstore: Any, index_to_docstore_id: dict[int, str]) -> tuple[bytes, bytes]:
+    # same files as FAISS.save_local, so snapshots stay loadable with FAISS.load_local
+    index_bytes = faiss.serialize_index(index).tobytes()
+    docstore_bytes = pickle.dumps((docstore, index_to_docstore_id))
+    return index_bytes, docstore_bytes
+
+
+def _upsert(db: Any, ids: list[str], texts: list[str], metadatas: list[dict], vectors: list[list[float]]):
+    existing = [id for id in ids if id in db.docstore._dict]
+    if existing:
+        db.delete(existing)
+    db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+_persisters: dict[str, MemoryPersister] = {}
+_persisters_lock = threading.Lock()
+
+
+def get_persister(abs_dir: str) -> MemoryPersister:
+    with _persisters_lock:
+        persister = _persisters.get(abs_dir)
+        if persister is None:
+            persister = _persisters[abs_dir] = MemoryPersister(abs_dir)
+        return persister
@@ -0,0 +1,64 @@
+"""Compare recall@k and search latency of the memory index types against the flat index.
+
+Run manually, e.g.:  python tests/memory_index_benchmark.py --size 200000 --dim 768
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from plugins._memory.helpers import memory_index
+from plugins._memory.helpers.memory_index import IndexConfig
+
+
+def make_vectors(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    # clustered unit vectors resemble real embeddings better than uniform noise
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def search(index, queries: np.ndarray, k: int) -> tuple[np.ndarray, float]:
+    started = time.perf_counter()
+    labels = np.vstack([index.search(q.reshape(1, -1), k)[1] for q in queries])
+    return labels, (time.perf_counter() - started) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default="flat,ivf_flat,ivf_pq,hnsw")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = make_vectors(args.size, args.dim, max(1, args.size // 500), rng)
+    queries = make_vectors(args.queries, args.dim, max(1, args.size // 500), rng)
+
+    truth = None
+    print(f"{args.size} vectors, dim {args.dim}, {args.queries} queries, k={args.k}")
+    print(f"{'index':<10} {'build s':>9} {'recall@k':>9} {'ms/query':>9}")
+    for index_type in args.types.split(","):
+        config = IndexConfig(type=index_type, train_threshold=0)
+        started = time.perf_counter()
+        index = memory_index.build_index(args.dim, config, vectors)
+        build_time = time.perf_counter() - started
+
+        labels, latency = search(index, queries, args.k)
+        if truth is None:
+            exact = memory_index.build_index(args.dim, IndexConfig(), vectors)
+            truth, _ = search(exact, queries, args.k)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(labels, truth)])
+        print(f"{index_type:<10} {build_time:>9.2f} {recall:>9.3f} {latency:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
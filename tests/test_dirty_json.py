@@ -54,3 +54,58 @@ def test_completed_remains_true_after_trailing_content() -> None:
     }
 
     assert parser.completed is True
+
+
+def test_feed_resumes_inside_values() -> None:
+    payload = '{"tool_name": "code", "tool_args": {"code": "print(\\"hi\\")\\n", "n": [1, 2.5, true]}}'
+    parser = DirtyJson()
+
+    for i in range(0, len(payload), 3):
+        parser.feed(payload[i : i + 3])
+
+    assert parser.completed is True
+    assert parser.result == DirtyJson.parse_string(payload)
+
+
+def test_get_partial_includes_string_being_read() -> None:
+    parser = DirtyJson()
+    parser.feed('{"tool_name": "response", "tool_args": {"text": "Hel')
+
+    assert parser.get_partial() == {"tool_name": "response", "tool_args": {"text": "Hel"}}
+    assert parser.completed is False
+
+    parser.feed('lo"}}')
+    assert parser.get_partial() == {"tool_name": "response", "tool_args": {"text": "Hello"}}
+    assert parser.completed is True
+
+
+def test_finish_closes_open_values_like_parse() -> None:
+    parser = DirtyJson()
+    parser.feed('{"a": [1, 2')
+
+    assert parser.finish() == DirtyJson.parse_string('{"a": [1, 2')
+    assert parser.completed is False
+
+
+def test_json_root_stream_matches_extract_json_root_string() -> None:
+    from helpers import extract_tools
+
+    text = 'Sure {"tool_name":"response","tool_args":{"text":"brace } inside"}} trailing'
+    stream = extract_tools.JsonRootStream()
+
+    for end in range(1, len(text) + 1):
+        stream.update(text[:end])
+        assert stream.root == extract_tools.extract_json_root_string(text[:end])
+
+    assert stream.parsed == {"tool_name": "response", "tool_args": {"text": "brace } inside"}}
+
+
+def test_json_root_stream_restarts_when_text_changes_in_place() -> None:
+    from helpers import extract_tools
+
+    stream = extract_tools.JsonRootStream()
+    stream.update('{"tool_args": {"text": "secret-value')
+    stream.update('{"tool_args": {"text": "***"}}')
+
+    assert stream.root == '{"tool_args": {"text": "***"}}'
+    assert stream.parsed == {"tool_args": {"text": "***"}}
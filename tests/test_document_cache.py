@@ -0,0 +1,44 @@
+import random
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers.document_cache import DocumentCache
+
+
+def test_text_and_chunks_persist_across_instances(tmp_path):
+    path = str(tmp_path / "documents.sqlite")
+    cache = DocumentCache(path)
+    text_key = DocumentCache.make_content_key("application/pdf", b"%PDF-1.7 ...")
+    chunks_key = DocumentCache.make_chunks_key("parsed text", 1000, 100)
+    cache.set_segments(text_key, ["parsed text é", "page 2"])
+    cache.set_chunks(chunks_key, ["parsed", "text"])
+
+    reopened = DocumentCache(path)
+    assert reopened.get_segments(text_key) == ["parsed text é", "page 2"]
+    assert reopened.get_chunks(chunks_key) == ["parsed", "text"]
+    assert reopened.get_segments(DocumentCache.make_content_key("text/plain", b"%PDF-1.7 ...")) is None
+
+
+def test_keys_depend_on_content_and_splitter_params():
+    assert DocumentCache.make_content_key("text/plain", b"a") != DocumentCache.make_content_key("text/plain", b"b")
+    assert DocumentCache.make_chunks_key("text", 1000, 100) != DocumentCache.make_chunks_key("text", 1000, 50)
+    assert DocumentCache.make_chunks_key("text", 1000, 100) != DocumentCache.make_chunks_key("text", 500, 100)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = DocumentCache(max_bytes=3000)
+    keys = [DocumentCache.make_content_key("text/plain", bytes([i])) for i in range(3)]
+    # hex of random bytes compresses to about half, every entry takes about 1100 bytes
+    texts = [random.Random(i).randbytes(1000).hex() for i in range(3)]
+    cache.set_chunks(keys[0], [texts[0]])
+    cache.set_chunks(keys[1], [texts[1]])
+    assert cache.get_chunks(keys[0]) == [texts[0]]
+    cache.set_chunks(keys[2], [texts[2]])
+
+    assert cache.get_chunks(keys[1]) is None
+    assert cache.get_chunks(keys[0]) == [texts[0]]
+    assert cache.get_chunks(keys[2]) == [texts[2]]
@@ -0,0 +1,46 @@
+import asyncio
+import operator
+import os
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers import document_ingest
+
+
+def test_imap_yields_results_in_order_with_bounded_window():
+    async def collect():
+        args = [(i, 10) for i in range(20)]
+        return [result async for result in document_ingest.imap(operator.mul, args, window=3)]
+
+    assert asyncio.run(collect()) == [i * 10 for i in range(20)]
+
+
+def test_closing_imap_cancels_queued_calls():
+    submitted = []
+
+    def args():
+        for i in range(50):
+            submitted.append(i)
+            yield (0.05,)
+
+    async def first():
+        results = document_ingest.imap(time.sleep, args(), window=2)
+        await anext(results)
+        await results.aclose()
+
+    started = time.monotonic()
+    asyncio.run(first())
+    assert len(submitted) <= 3
+    assert time.monotonic() - started < 2
+
+
+def test_temp_file_is_removed():
+    with document_ingest.temp_file(b"data", ".pdf") as path:
+        assert path.endswith(".pdf")
+        assert Path(path).read_bytes() == b"data"
+    assert not os.path.exists(path)
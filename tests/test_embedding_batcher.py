@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from models import EmbeddingBatcher, ModelConfig, ModelType, get_embedding_batcher
+
+
+class FakeEmbedder:
+    def __init__(self, bad: str = ""):
+        self.calls: list[list[str]] = []
+        self.bad = bad
+
+    async def __call__(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0)
+        if self.bad in texts:
+            raise ValueError(f"can not embed {self.bad!r}")
+        return [[float(len(t))] for t in texts]
+
+
+def test_concurrent_requests_share_one_batch() -> None:
+    async def run():
+        embed = FakeEmbedder()
+        batcher = EmbeddingBatcher()
+        results = await asyncio.gather(
+            batcher.embed(["a", "bb"], embed),
+            batcher.embed(["ccc"], embed),
+            batcher.embed(["dddd", "e"], embed),
+        )
+        assert embed.calls == [["a", "bb", "ccc", "dddd", "e"]]
+        assert results == [[[1.0], [2.0]], [[3.0]], [[4.0], [1.0]]]
+        assert not batcher._tasks
+
+    asyncio.run(run())
+
+
+def test_large_batches_are_split_by_max_size() -> None:
+    async def run():
+        embed = FakeEmbedder()
+        batcher = EmbeddingBatcher(max_size=2)
+        first, second = await asyncio.gather(
+            batcher.embed(["a", "bb", "ccc"], embed),
+            batcher.embed(["dddd"], embed),
+        )
+        # the first request fills the batch and flushes it right away
+        assert embed.calls == [["a", "bb"], ["ccc"], ["dddd"]]
+        assert first == [[1.0], [2.0], [3.0]]
+        assert second == [[4.0]]
+
+    asyncio.run(run())
+
+
+def test_failing_caller_does_not_fail_the_others() -> None:
+    async def run():
+        embed = FakeEmbedder(bad="bad")
+        batcher = EmbeddingBatcher()
+        results = await asyncio.gather(
+            batcher.embed(["a"], embed),
+            batcher.embed(["bad"], embed),
+            batcher.embed(["ccc"], embed),
+            return_exceptions=True,
+        )
+        assert results[0] == [[1.0]]
+        assert isinstance(results[1], ValueError)
+        assert results[2] == [[3.0]]
+        assert embed.calls == [["a", "bad", "ccc"], ["a"], ["bad"], ["ccc"]]
+
+    asyncio.run(run())
+
+
+def test_batch_uses_the_embedder_of_the_latest_request() -> None:
+    async def run():
+        old, new = FakeEmbedder(), FakeEmbedder()
+        batcher = EmbeddingBatcher()
+        await asyncio.gather(batcher.embed(["a"], old), batcher.embed(["b"], new))
+        assert old.calls == [] and new.calls == [["a", "b"]]
+
+    asyncio.run(run())
+
+
+def test_batchers_are_shared_by_model_args_and_limits() -> None:
+    def config(limit_requests: int) -> ModelConfig:
+        return ModelConfig(ModelType.EMBEDDING, "openai", "m", limit_requests=limit_requests)
+
+    async def run():
+        same = get_embedding_batcher("litellm", "m", {"x": 1}, config(10))
+        assert get_embedding_batcher("litellm", "m", {"x": 1}, config(10)) is same
+        assert get_embedding_batcher("litellm", "m", {"x": 2}, config(10)) is not same
+        assert get_embedding_batcher("litellm", "m", {"x": 1}, config(20)) is not same
+
+    asyncio.run(run())
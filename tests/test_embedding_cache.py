@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers.embedding_cache import CachedEmbeddings, EmbeddingCache, get_model_id
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+def test_vectors_survive_reopening_the_cache_file(tmp_path) -> None:
+    path = str(tmp_path / "embeddings.sqlite")
+    model = CountingEmbeddings()
+
+    first = CachedEmbeddings(model, "m", EmbeddingCache(path))
+    assert first.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert model.calls == [["a", "bb"]]
+
+    second = CachedEmbeddings(model, "m", EmbeddingCache(path))
+    assert asyncio.run(second.aembed_documents(["bb", "ccc"])) == [[2.0, 1.0], [3.0, 1.0]]
+    assert model.calls == [["a", "bb"], ["ccc"]]
+
+
+def test_cache_is_keyed_by_model() -> None:
+    cache = EmbeddingCache()
+    model = CountingEmbeddings()
+
+    CachedEmbeddings(model, "a", cache).embed_query("x")
+    CachedEmbeddings(model, "b", cache).embed_query("x")
+    assert len(model.calls) == 2
+
+
+def test_dimensions_are_probed_once(tmp_path) -> None:
+    path = str(tmp_path / "embeddings.sqlite")
+    model = CountingEmbeddings()
+
+    assert CachedEmbeddings(model, "m", EmbeddingCache(path)).get_dimensions() == 2
+    assert CachedEmbeddings(model, "m", EmbeddingCache(path)).get_dimensions() == 2
+    assert len(model.calls) == 1
+
+
+def test_least_recently_used_vectors_are_evicted() -> None:
+    cache = EmbeddingCache(max_bytes=3 * 8)
+    embeddings = CachedEmbeddings(CountingEmbeddings(), "m", cache)
+
+    for text in ["a", "b", "c", "d"]:
+        embeddings.embed_query(text)
+    assert cache._size <= cache.max_bytes
+    assert not cache.get_many([EmbeddingCache.make_key("m", "a")])
+    assert cache.get_many([EmbeddingCache.make_key("m", "d")])
+
+
+def test_model_id_covers_provider_and_vector_settings() -> None:
+    def model(provider="openai", name="text-embedding-3-small", **kwargs):
+        config = SimpleNamespace(provider=provider, name=name, build_kwargs=lambda: dict(kwargs))
+        return SimpleNamespace(model_name=name, a0_model_conf=config)
+
+    base = get_model_id(model())
+    assert base == "openai/text-embedding-3-small"
+    assert get_model_id(model(provider="azure")) != base
+    assert get_model_id(model(dimensions=256)) != get_model_id(model(dimensions=512))
+    assert get_model_id(model(api_base="http://a")) != get_model_id(model(api_base="http://b"))
+    assert get_model_id(model(api_key="secret", timeout=5)) == base
+    assert get_model_id(SimpleNamespace(model_name="local")) == "local"
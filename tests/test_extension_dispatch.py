@@ -0,0 +1,131 @@
+import gc
+import sys
+import weakref
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers import cache, extension
+from helpers.extension import Extension, extensible
+
+
+created: list[type] = []
+
+
+class _Stateless(Extension):
+    def __init__(self, agent, **kwargs):
+        super().__init__(agent, **kwargs)
+        created.append(type(self))
+
+    def execute(self, data=None, **kwargs):
+        data["calls"] = data.get("calls", 0) + 1
+
+
+class _Stateful(_Stateless):
+    def execute(self, data=None, **kwargs):
+        self.seen = data
+        data["stateful"] = True
+
+
+class _DoubleResult(Extension):
+    def execute(self, data=None, **kwargs):
+        if data["result"] is not extension._UNSET:
+            data["result"] *= 2
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    points: dict[str, tuple] = {}
+    resolved: list[str] = []
+
+    def resolve(extension_point, agent=None):
+        resolved.append(extension_point)
+        return points.get(extension_point, ())
+
+    monkeypatch.setattr(extension, "_resolve_extension_classes", resolve)
+    # no agent involved, keeps the agent module with its heavy imports out of the test
+    monkeypatch.setattr(extension, "_agent_class", type("NoAgent", (), {}))
+    cache.clear(extension._DISPATCH_CACHE_AREA)
+    created.clear()
+    extension.reset_stats()
+    yield points, resolved
+    cache.clear(extension._DISPATCH_CACHE_AREA)
+    extension.set_stats_enabled(False)
+    extension.reset_stats()
+
+
+def test_extension_points_are_resolved_once_and_instances_reused(registry):
+    points, resolved = registry
+    points["point"] = (_Stateless, _Stateful)
+
+    for _ in range(3):
+        data: dict = {}
+        extension.call_extensions_sync("point", None, data=data)
+        assert data == {"calls": 1, "stateful": True}
+
+    assert resolved == ["point"]
+    # the stateless extension is created once, the one keeping state on itself every time
+    assert created.count(_Stateless) == 1
+    assert created.count(_Stateful) == 3
+
+
+def test_extensible_without_extensions_calls_function_directly(registry):
+    points, resolved = registry
+
+    @extensible
+    def double(value: int):
+        return value * 2
+
+    assert double(2) == 4
+    assert double(3) == 6
+    assert len(resolved) == 2  # start and end, resolved on the first call only
+
+    cache.clear(extension._DISPATCH_CACHE_AREA)
+    end_point = next(point for point in resolved if point.endswith("end"))
+    points[end_point] = (_DoubleResult,)
+    assert double(3) == 12
+
+
+@pytest.mark.asyncio
+async def test_stats_count_calls_and_executions(registry):
+    points, _ = registry
+    points["point"] = (_Stateless,)
+
+    await extension.call_extensions_async("point", None, data={})
+    assert extension.get_stats() == {}
+
+    extension.set_stats_enabled(True)
+    await extension.call_extensions_async("point", None, data={})
+    await extension.call_extensions_async("point", None, data={})
+    await extension.call_extensions_async("empty", None, data={})
+
+    stats = extension.get_stats()
+    assert stats["point"]["calls"] == 2
+    assert stats["point"]["executions"] == 2
+    assert stats["point"]["seconds"] >= 0
+    assert stats["empty"] == {"calls": 1, "executions": 0, "seconds": 0.0}
+
+
+def test_extensions_bound_to_an_agent_do_not_keep_it_alive(registry):
+    points, _ = registry
+    points["point"] = (_Stateless,)
+
+    class _Agent:
+        config = SimpleNamespace(profile="default")
+        context = SimpleNamespace(get_data=lambda key: None)
+
+    agent = _Agent()
+    extension.call_extensions_sync("point", agent, data={})
+    extension.call_extensions_sync("point", agent, data={})
+    # every call gets its own instance, background work may still use self.agent
+    assert created.count(_Stateless) == 2
+
+    ref = weakref.ref(agent)
+    del agent
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers import history
+from plugins._model_config.helpers import model_config
+
+
+def _recount(record) -> int:
+    """Token count computed from scratch, ignoring every cached value."""
+    if isinstance(record, history.Message):
+        return history.tokens.approximate_tokens(record.output_text())
+    if isinstance(record, history.Topic):
+        if record.summary:
+            return history.tokens.approximate_tokens(record.summary)
+        return sum(_recount(m) for m in record.messages)
+    if isinstance(record, history.Bulk):
+        if record.summary:
+            return history.tokens.approximate_tokens(record.summary)
+        return sum(_recount(r) for r in record.records)
+    return (
+        sum(_recount(b) for b in record.bulks)
+        + sum(_recount(t) for t in record.topics)
+        + _recount(record.current)
+    )
+
+
+def _assert_ledger(hist: history.History) -> None:
+    assert hist.get_tokens() == _recount(hist)
+    assert hist.get_bulks_tokens() == sum(_recount(b) for b in hist.bulks)
+    assert hist.get_topics_tokens() == sum(_recount(t) for t in hist.topics)
+    assert hist.get_current_topic_tokens() == _recount(hist.current)
+
+
+@pytest.fixture
+def hist(monkeypatch) -> history.History:
+    config = {"ctx_length": 100000, "ctx_history": 1.0}
+    monkeypatch.setattr(history.tokens, "approximate_tokens", lambda text, mode="count": len(text))
+    monkeypatch.setattr(history, "get_chat_model_config", lambda agent=None: config)
+    monkeypatch.setattr(model_config, "get_chat_model_config", lambda agent=None: config)
+
+    async def call_utility_model(system, message):
+        return "summary"
+
+    agent = SimpleNamespace(
+        config=config,
+        call_utility_model=call_utility_model,
+        read_prompt=lambda name, **kwargs: name,
+        parse_prompt=lambda name, **kwargs: kwargs.get("summary", ""),
+    )
+    return history.History(agent=agent)
+
+
+def _fill(hist: history.History, topics: int, messages: int) -> None:
+    for t in range(topics):
+        for m in range(messages):
+            hist.add_message(ai=bool(m % 2), content=f"topic {t} message {m} " + "x" * 40)
+        hist.new_topic()
+
+
+def test_add_message_and_new_topic_keep_the_ledger(hist) -> None:
+    _assert_ledger(hist)  # cache the empty sums, later changes update them
+    hist.add_message(ai=False, content="hello")
+    _assert_ledger(hist)
+    hist.add_message(ai=True, content="world", tokens=3)  # counted as given
+    assert hist.get_tokens() == _recount(hist) - _recount(hist.current.messages[-1]) + 3
+
+    hist.current.messages[-1].invalidate_tokens()
+    hist.current.invalidate_tokens()
+    _assert_ledger(hist)
+
+    hist.new_topic()
+    _assert_ledger(hist)
+    hist.new_topic()  # empty current topic is kept
+    assert len(hist.topics) == 1
+    hist.add_message(ai=False, content="next")
+    _assert_ledger(hist)
+
+
+def test_pop_message_and_summary_keep_the_ledger(hist) -> None:
+    _fill(hist, topics=2, messages=4)
+    hist.add_message(ai=False, content="current")
+    hist.add_message(ai=True, content="reply")
+    _assert_ledger(hist)
+
+    hist.current.pop_message()
+    _assert_ledger(hist)
+
+    asyncio.run(hist.topics[0].summarize())
+    _assert_ledger(hist)
+    # messages added to a summarized topic are hidden behind the summary
+    hist.current.summary = "current summary"
+    hist.current.invalidate_tokens()
+    _assert_ledger(hist)
+    hist.add_message(ai=False, content="after summary")
+    _assert_ledger(hist)
+
+    hist.topics[1].messages[0].set_summary("short")
+    hist.topics[1].invalidate_tokens()
+    _assert_ledger(hist)
+
+
+def test_compress_keeps_the_ledger(hist) -> None:
+    _fill(hist, topics=6, messages=6)
+    for m in range(6):
+        hist.add_message(ai=bool(m % 2), content=f"current message {m} " + "y" * 40)
+    total = hist.get_tokens()
+    _assert_ledger(hist)
+
+    hist.agent.config["ctx_length"] = total // 2
+    assert asyncio.run(hist.compress())
+    assert hist.bulks  # topics were moved to bulks
+    _assert_ledger(hist)
+    assert hist.get_tokens() < total
+
+    asyncio.run(hist.merge_bulks_by(2))
+    _assert_ledger(hist)
+
+
+def test_moving_topics_to_bulks_keeps_the_ledger(hist) -> None:
+    # topics too short for attention compression are moved to bulks right away
+    _fill(hist, topics=4, messages=2)
+    _assert_ledger(hist)
+
+    assert asyncio.run(hist.compress_topics())
+    assert len(hist.bulks) == 1 and len(hist.topics) == 1
+    _assert_ledger(hist)
+
+    assert asyncio.run(hist.compress_topics())
+    assert len(hist.bulks) == 2 and not hist.topics
+    _assert_ledger(hist)
+
+    assert asyncio.run(hist.compress_bulks())
+    assert len(hist.bulks) == 1
+    _assert_ledger(hist)
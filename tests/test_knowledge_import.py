@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from plugins._memory.helpers import knowledge_import
+
+
+def _load(directory: Path, index: dict, stats: knowledge_import.PreloadStats) -> dict:
+    return asyncio.run(
+        knowledge_import.load_knowledge(None, str(directory), index, {"area": "main"}, stats=stats)
+    )
+
+
+def _persisted(index: dict) -> dict:
+    # what preload_knowledge keeps in knowledge_import.json
+    return {
+        key: {k: v for k, v in data.items() if k not in ("documents", "state")}
+        for key, data in index.items()
+        if data["state"] != "removed"
+    }
+
+
+def test_unchanged_files_are_not_hashed_or_parsed(tmp_path, monkeypatch):
+    (tmp_path / "a.md").write_text("first", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("second", encoding="utf-8")
+
+    stats = knowledge_import.PreloadStats()
+    index = _load(tmp_path, {}, stats)
+    assert {data["state"] for data in index.values()} == {"changed"}
+    assert (stats.files, stats.hashed, stats.parsed) == (2, 2, 2)
+
+    hashed = []
+    checksum = knowledge_import.calculate_checksum
+    monkeypatch.setattr(knowledge_import, "calculate_checksum", lambda path: hashed.append(path) or checksum(path))
+    stats = knowledge_import.PreloadStats()
+    index = _load(tmp_path, _persisted(index), stats)
+    assert {data["state"] for data in index.values()} == {"original"}
+    assert hashed == [] and stats.parsed == 0
+
+    # a new mtime with the same content is hashed but not parsed again
+    os.utime(tmp_path / "a.md", ns=(1, 1))
+    stats = knowledge_import.PreloadStats()
+    index = _load(tmp_path, _persisted(index), stats)
+    assert hashed == [str(tmp_path / "a.md")]
+    assert {data["state"] for data in index.values()} == {"original"}
+    assert set(stats.seconds) == {"scan", "check", "parse"}
+
+
+def test_chunk_hash_ignores_volatile_metadata():
+    meta = {"source_file": "a.md", "area": "main"}
+    base = knowledge_import.calculate_chunk_hash("text", meta)
+
+    assert knowledge_import.calculate_chunk_hash("text", {**meta, "id": "x", "timestamp": "now"}) == base
+    assert knowledge_import.calculate_chunk_hash("text", {**meta, "area": "fragments"}) != base
+    assert knowledge_import.calculate_chunk_hash("text 2", meta) != base
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def test_output_returns_items_changed_since_version_in_log_order() -> None:
+    from helpers.log import Log
+
+    log = Log()
+    first = log.log(type="info", heading="first")
+    log.log(type="info", heading="second")
+    seen = log.version
+
+    log.log(type="info", heading="third")
+    first.stream(content="more")
+
+    output = log.output(start=seen)
+    assert [item["heading"] for item in output.items] == ["first", "third"]
+    assert output.end == log.version
+    assert log.output(start=log.version).items == []
+    assert [item["heading"] for item in log.output().items] == ["first", "second", "third"]
+
+
+def test_repeated_updates_keep_one_index_entry_per_item() -> None:
+    from helpers.log import Log
+
+    log = Log()
+    item = log.log(type="response", heading="streaming")
+    for _ in range(20):
+        item.stream(content="x")
+
+    assert log.version == 21
+    assert len(log._changed) == 1
+    assert log.output(start=log.version - 1).items[0]["content"] == "x" * 20
+
+    log.reset()
+    assert log.version == 0
+    assert log.output().items == []
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers import metadata_index
+from plugins._memory.helpers import memory_index
+from plugins._memory.helpers.memory_index import IndexConfig
+
+
+def _vectors(n: int = 2000, dim: int = 32) -> np.ndarray:
+    vectors = np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_flat_index_is_kept_below_train_threshold() -> None:
+    index = memory_index.build_index(32, IndexConfig(), _vectors(100))
+
+    assert not memory_index.needs_rebuild(index, IndexConfig(type="hnsw", train_threshold=1000))
+    assert memory_index.needs_rebuild(index, IndexConfig(type="hnsw", train_threshold=100))
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "ivf_pq"])
+def test_rebuild_keeps_vectors_and_supports_removal(index_type: str) -> None:
+    vectors = _vectors()
+    flat = memory_index.build_index(32, IndexConfig(), vectors)
+    mapping = {i: f"doc{i}" for i in range(len(vectors))}
+    config = IndexConfig(type=index_type, train_threshold=0, pq_bits=4)
+
+    index, new_mapping = memory_index.rebuild_index(flat, mapping, config)
+    assert memory_index.get_index_type(index) == index_type
+    assert index.ntotal == len(vectors)
+    assert new_mapping == mapping
+
+    assert memory_index.remove_labels(index, [3, 4])
+    assert index.ntotal == len(vectors) - 2
+    _, labels = index.search(vectors[10:11], 5)
+    assert 3 not in labels[0] and 4 not in labels[0]
+
+
+def test_hnsw_keeps_deleted_vectors_as_tombstones() -> None:
+    vectors = _vectors(200)
+    index = memory_index.build_index(32, IndexConfig(type="hnsw"), vectors)
+    mapping = {i: f"doc{i}" for i in range(len(vectors))}
+
+    assert not memory_index.remove_labels(index, [3, 4])
+    del mapping[3], mapping[4]
+    tombstones = memory_index.get_tombstones(index, mapping)
+    assert tombstones == {3, 4}
+    assert not memory_index.needs_compaction(index, len(tombstones))
+    assert memory_index.needs_compaction(index, 40)
+
+    params, _selector = metadata_index.exclude_params(index, tombstones)
+    _, labels = index.search(vectors[3:5], 5, params=params)
+    assert not {3, 4} & set(labels.ravel().tolist())
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hashlib
+import sys
+import threading
+from pathlib import Path
+
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from plugins._memory.helpers import memory_persistence
+
+
+class _Embeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0, 0.0, 0.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _db() -> FAISS:
+    return FAISS(_Embeddings(), faiss.IndexFlatIP(4), InMemoryDocstore(), {})
+
+
+def _load(path: Path) -> FAISS:
+    return FAISS.load_local(str(path), _Embeddings(), allow_dangerous_deserialization=True)
+
+
+def _vectors(texts):
+    return _Embeddings().embed_documents(texts)
+
+
+def test_journal_replays_on_top_of_snapshot(tmp_path: Path) -> None:
+    db = _db()
+    persister = memory_persistence.MemoryPersister(str(tmp_path))
+    persister.attach(db)
+    persister.add(db, ["a", "b"], ["alpha", "beta"], [{"n": 1}, {"n": 2}], _vectors(["alpha", "beta"]))
+    persister.save()
+    assert not (tmp_path / memory_persistence.JOURNAL_FILE).exists()
+
+    persister.delete(db, ["a"])
+    persister.add(db, ["b", "c"], ["beta2", "gamma"], [{"n": 3}, {"n": 4}], _vectors(["beta2", "gamma"]))
+    persister.cancel()
+
+    loaded = _load(tmp_path)
+    assert set(loaded.docstore._dict) == {"a", "b"}
+    assert persister.replay(loaded) == 2
+    assert {k: d.page_content for k, d in loaded.docstore._dict.items()} == {"b": "beta2", "c": "gamma"}
+    assert loaded.index.ntotal == 2
+
+
+def test_snapshot_hash_matches_index_file(tmp_path: Path) -> None:
+    db = _db()
+    db.add_texts(["alpha"], ids=["a"])
+    memory_persistence.save_db(db, str(tmp_path))
+
+    index_bytes = (tmp_path / memory_persistence.INDEX_FILE).read_bytes()
+    stored = (tmp_path / memory_persistence.HASH_FILE).read_text()
+    assert stored == hashlib.sha256(index_bytes).hexdigest()
+
+
+def test_torn_journal_tail_is_ignored(tmp_path: Path) -> None:
+    db = _db()
+    persister = memory_persistence.MemoryPersister(str(tmp_path))
+    persister.add(db, ["a"], ["alpha"], [{}], _vectors(["alpha"]))
+    persister.cancel()
+    with open(tmp_path / memory_persistence.JOURNAL_FILE, "ab") as f:
+        f.write(b"\x80\x05garbage")
+
+    replayed = _db()
+    assert persister.replay(replayed) == 1
+    assert set(replayed.docstore._dict) == {"a"}
+
+
+def test_save_serializes_a_copy_taken_under_the_lock(tmp_path: Path, monkeypatch) -> None:
+    db = _db()
+    persister = memory_persistence.MemoryPersister(str(tmp_path))
+    persister.attach(db)
+    persister.add(db, ["a"], ["alpha"], [{}], _vectors(["alpha"]))
+
+    serialize = memory_persistence._serialize
+
+    def mutate_while_serializing(*args):
+        # the lock is free while serializing, the mutation lands in the journal only
+        writer = threading.Thread(
+            target=persister.add, args=(db, ["b"], ["beta"], [{}], _vectors(["beta"]))
+        )
+        writer.start()
+        writer.join(timeout=5)
+        assert not writer.is_alive()
+        return serialize(*args)
+
+    monkeypatch.setattr(memory_persistence, "_serialize", mutate_while_serializing)
+    persister.save()
+    persister.cancel()
+
+    loaded = _load(tmp_path)
+    assert set(loaded.docstore._dict) == {"a"}
+    assert loaded.index.ntotal == 1
+    assert persister.replay(loaded) == 1
+    assert set(loaded.docstore._dict) == {"a", "b"}
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import faiss
+
+from helpers import metadata_index
+from helpers.metadata_index import MetadataFilter, MetadataIndex
+
+
+def _index() -> MetadataIndex:
+    index = MetadataIndex()
+    docs = {
+        "a": {"area": "main", "timestamp": "2024-01-01 10:00:00"},
+        "b": {"area": "fragments", "timestamp": "2024-02-01 10:00:00"},
+        "c": {"area": "solutions", "timestamp": "2024-03-01 10:00:00", "knowledge_source": True},
+        "d": {"other": 1},
+    }
+    index.rebuild({k: SimpleNamespace(metadata=v) for k, v in docs.items()})
+    return index
+
+
+def _filter(condition: str) -> MetadataFilter:
+    return MetadataFilter(condition, lambda data: False)
+
+
+def test_equality_and_or_are_exact() -> None:
+    index = _index()
+
+    assert _filter("area == 'main'").candidates(index) == ({"a"}, True)
+    assert _filter("area == 'main' or area == 'fragments'").candidates(index) == ({"a", "b"}, True)
+    assert _filter("area in ['main', 'solutions']").candidates(index) == ({"a", "c"}, True)
+    assert _filter("area in ('main', 'missing')").candidates(index) == ({"a"}, True)
+    assert _filter("timestamp >= '2024-02-01'").candidates(index) == ({"b", "c"}, True)
+
+
+def test_unindexed_fields_fall_back_to_evaluation() -> None:
+    index = _index()
+
+    assert _filter("other == 1").candidates(index) is None
+    assert _filter("area == 'main' or other == 1").candidates(index) is None
+    # the indexed part still narrows the candidates, the rest is evaluated per document
+    assert _filter("area == 'solutions' and other == 1").candidates(index) == ({"c"}, False)
+
+
+def test_remove_updates_index() -> None:
+    index = _index()
+    index.remove("a")
+    index.add("b", {"area": "main"})
+
+    assert _filter("area == 'main'").candidates(index) == ({"b"}, True)
+    assert _filter("area == 'fragments'").candidates(index) == (set(), True)
+
+
+def test_search_params_restrict_results() -> None:
+    vectors = np.random.default_rng(0).standard_normal((100, 8)).astype(np.float32)
+    index = faiss.IndexFlatIP(8)
+    index.add(vectors)
+
+    params, _selector = metadata_index.search_params(index, [3, 7, 11])
+    _, labels = index.search(vectors[:1], 5, params=params)
+
+    assert set(labels[0]) - {-1} == {3, 7, 11}
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _make_context(ctxid: str, monkeypatch):
+    from agent import AgentContext, AgentContextType
+    from helpers.history import History
+    from helpers.log import Log
+
+    agent = SimpleNamespace(number=0, data={})
+    agent.history = History(agent=agent)
+    context = SimpleNamespace(
+        id=ctxid,
+        name="chat",
+        type=AgentContextType.USER,
+        created_at=datetime(2024, 1, 1),
+        last_message=datetime(2024, 1, 1),
+        agent0=agent,
+        streaming_agent=agent,
+        log=Log(),
+        data={},
+        output_data={},
+        task=None,
+    )
+    # only chats that are still open get saved
+    monkeypatch.setitem(AgentContext._contexts, ctxid, context)
+    return context
+
+
+def _read_saved(folder: Path) -> tuple[dict, list[dict], list[dict]]:
+    manifest = json.loads((folder / "manifest.json").read_text())
+
+    def read(name):
+        return json.loads((folder / "segments" / name).read_text())
+
+    current = manifest["agents"][0]["history"]["current"]
+    messages = [m for name in current["messages"] for m in read(name)]
+    log_items = [item for name in manifest["log"]["segments"] for item in read(name)]
+    return manifest, messages, log_items
+
+
+def test_save_writes_only_changed_segments(tmp_path, monkeypatch) -> None:
+    from helpers import persist_chat
+
+    monkeypatch.setattr(persist_chat, "CHATS_FOLDER", str(tmp_path))
+    written: list[str] = []
+    write = persist_chat._write_file_atomic
+    monkeypatch.setattr(
+        persist_chat,
+        "_write_file_atomic",
+        lambda path, content: (written.append(os.path.basename(path)), write(path, content)),
+    )
+
+    context = _make_context("ctx-segments", monkeypatch)
+    for i in range(20):
+        context.agent0.history.add_message(ai=bool(i % 2), content=f"message {i}", tokens=1)
+    items = [context.log.log(type="info", heading=f"item {i}") for i in range(120)]
+
+    persist_chat.save_tmp_chat(context)
+    assert len(written) == 3 + 3 + 1  # message segments, log segments, manifest
+
+    written.clear()
+    context.agent0.history.add_message(ai=False, content="message 20", tokens=1)
+    items[3].update(content="updated")
+    persist_chat.save_tmp_chat(context)
+    assert len(written) == 3  # last message segment, first log segment, manifest
+
+    manifest, messages, log_items = _read_saved(tmp_path / "ctx-segments")
+    assert messages == context.agent0.history.to_dict()["current"]["messages"]
+    assert log_items == [item.output() for item in context.log.logs]
+    referenced = set(manifest["log"]["segments"]) | set(
+        manifest["agents"][0]["history"]["current"]["messages"]
+    )
+    assert set(os.listdir(tmp_path / "ctx-segments" / "segments")) == referenced
+
+
+def test_changed_topic_and_reset_log_are_rewritten(tmp_path, monkeypatch) -> None:
+    from helpers import persist_chat
+
+    monkeypatch.setattr(persist_chat, "CHATS_FOLDER", str(tmp_path))
+    context = _make_context("ctx-rewrite", monkeypatch)
+    history = context.agent0.history
+    for i in range(4):
+        history.add_message(ai=False, content=f"message {i}", tokens=1)
+    context.log.log(type="info", heading="before reset")
+    persist_chat.save_tmp_chat(context)
+
+    history.current.pop_message()
+    history.add_message(ai=False, content="replaced", tokens=1)
+    context.log.reset()
+    context.log.log(type="info", heading="after reset")
+    persist_chat.save_tmp_chat(context)
+
+    _manifest, messages, log_items = _read_saved(tmp_path / "ctx-rewrite")
+    assert [m["content"] for m in messages] == [
+        "message 0",
+        "message 1",
+        "message 2",
+        "replaced",
+    ]
+    assert [item["heading"] for item in log_items] == ["after reset"]
+
+
+def test_save_after_removal_does_not_recreate_the_chat(tmp_path, monkeypatch) -> None:
+    from agent import AgentContext
+    from helpers import persist_chat
+
+    monkeypatch.setattr(persist_chat, "CHATS_FOLDER", str(tmp_path))
+    context = _make_context("ctx-removed", monkeypatch)
+    context.agent0.history.add_message(ai=False, content="message", tokens=1)
+    persist_chat.save_tmp_chat(context)
+    assert (tmp_path / "ctx-removed").exists()
+
+    AgentContext.remove(context.id)
+    persist_chat.remove_chat(context.id)
+    persist_chat.save_tmp_chat(context)  # requested by a monologue still finishing
+    assert not (tmp_path / "ctx-removed").exists()
+
+
+def test_queued_save_writes_the_snapshot_taken_on_the_loop(tmp_path, monkeypatch) -> None:
+    import asyncio
+
+    from agent import AgentContext
+    from helpers import persist_chat
+
+    monkeypatch.setattr(persist_chat, "CHATS_FOLDER", str(tmp_path))
+    context = _make_context("ctx-snapshot", monkeypatch)
+    context.agent0.history.add_message(ai=False, content="before", tokens=1)
+
+    writes: list[tuple] = []
+
+    async def to_thread(func, *args):
+        writes.append((func, args))
+
+    monkeypatch.setattr(asyncio, "to_thread", to_thread)
+    asyncio.run(persist_chat.save_tmp_chat_async(context))
+    assert not (tmp_path / "ctx-snapshot").exists()
+
+    # the loop keeps changing the chat while the worker thread writes
+    context.agent0.history.add_message(ai=False, content="after", tokens=1)
+    context.log.log(type="info", heading="after")
+    (func, args), = writes
+    func(*args)
+    _manifest, messages, log_items = _read_saved(tmp_path / "ctx-snapshot")
+    assert [m["content"] for m in messages] == ["before"]
+    assert log_items == []
+
+    # a queued save is dropped when the chat is removed before it is written
+    writes.clear()
+    asyncio.run(persist_chat.save_tmp_chat_async(context))
+    AgentContext.remove(context.id)
+    persist_chat.remove_chat(context.id)
+    (func, args), = writes
+    func(*args)
+    assert not (tmp_path / "ctx-snapshot").exists()
+
+
+def test_context_window_is_saved_without_rendering_the_prompt(tmp_path, monkeypatch) -> None:
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    from agent import Agent, ContextWindow
+    from helpers import persist_chat
+
+    monkeypatch.setattr(persist_chat, "CHATS_FOLDER", str(tmp_path))
+    context = _make_context("ctx-window", monkeypatch)
+    window = ContextWindow([SystemMessage(content="system"), HumanMessage(content="hello")])
+    context.agent0.data[Agent.DATA_NAME_CTX_WINDOW] = window
+
+    persist_chat.save_tmp_chat(context)
+    manifest, _messages, _log_items = _read_saved(tmp_path / "ctx-window")
+    assert Agent.DATA_NAME_CTX_WINDOW not in manifest["agents"][0]["data"]
+    assert window._text is None
+
+    tokens = window.tokens  # requested by ctx_window_get or token_status
+    persist_chat.save_tmp_chat(context)
+    manifest, _messages, _log_items = _read_saved(tmp_path / "ctx-window")
+    assert manifest["agents"][0]["data"][Agent.DATA_NAME_CTX_WINDOW] == {"tokens": tokens}
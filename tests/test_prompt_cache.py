@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from agent import ContextWindow
+from helpers import history
+
+
+def _outputs(*contents: str) -> list[history.OutputMessage]:
+    return [{"ai": bool(i % 2), "content": content} for i, content in enumerate(contents)]
+
+
+def test_only_messages_after_the_unchanged_prefix_are_converted(monkeypatch) -> None:
+    converted: list[object] = []
+    convert = history._output_message_langchain
+    monkeypatch.setattr(
+        history,
+        "_output_message_langchain",
+        lambda message: (converted.append(message["content"]), convert(message))[1],
+    )
+    cache = history.LangchainOutputCache()
+
+    outputs = _outputs("question", "answer")
+    first = cache.output_langchain(outputs)
+    assert converted == ["question", "answer"]
+    assert [type(m) for m in first] == [HumanMessage, AIMessage]
+
+    converted.clear()
+    outputs = outputs + _outputs("follow up")
+    second = cache.output_langchain(outputs)
+    assert converted == ["follow up"]
+    assert second[0] is first[0] and second[1] is first[1]
+
+
+def test_equal_but_new_content_is_converted_again(monkeypatch) -> None:
+    converted: list[object] = []
+    convert = history._output_message_langchain
+    monkeypatch.setattr(
+        history,
+        "_output_message_langchain",
+        lambda message: (converted.append(message["content"]), convert(message))[1],
+    )
+    cache = history.LangchainOutputCache()
+
+    shared = {"tool": "result"}
+    question = "q"
+    cache.output_langchain([{"ai": False, "content": question}, {"ai": True, "content": shared}])
+    converted.clear()
+
+    # the prefix is compared by identity, a summarized or replaced record is a new object
+    cache.output_langchain([{"ai": False, "content": question}, {"ai": True, "content": dict(shared)}])
+    assert converted == [{"tool": "result"}]
+
+
+def test_context_window_renders_only_when_requested(monkeypatch) -> None:
+    import agent
+
+    rendered: list[int] = []
+    counted: list[str] = []
+    template = agent.ChatPromptTemplate.from_messages
+
+    def from_messages(messages):
+        rendered.append(len(messages))
+        return template(messages)
+
+    monkeypatch.setattr(agent.ChatPromptTemplate, "from_messages", from_messages)
+    monkeypatch.setattr(agent.tokens, "approximate_tokens", lambda text: counted.append(text) or 7)
+
+    window = ContextWindow([SystemMessage(content="system"), HumanMessage(content="hello")])
+    assert rendered == [] and counted == []
+
+    assert window.tokens == 7
+    assert window.to_dict() == {"text": window.text, "tokens": 7}
+    assert "hello" in window.text
+    assert rendered == [2] and len(counted) == 1
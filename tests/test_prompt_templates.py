@@ -0,0 +1,90 @@
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers import files, prompt_templates
+
+
+def _write(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def test_read_prompt_file_renders_conditions_placeholders_and_includes(tmp_path):
+    _write(
+        tmp_path / "main.md",
+        "Hi {{name}}{{if admin}} (admin{{if level > 1}} L{{level}}{{endif}}){{endif}}\n"
+        "{{ include 'part.md' }}|{{ include 'none.md' }}|{{unknown}}",
+    )
+    _write(tmp_path / "part.md", "part of {{name}}")
+
+    dirs = [str(tmp_path)]
+    assert files.read_prompt_file("main.md", dirs, name="Ann", admin=True, level=2) == (
+        "Hi Ann (admin L2)\npart of Ann|{{ include 'none.md' }}|{{unknown}}"
+    )
+    assert files.read_prompt_file("main.md", dirs, name="Bob", admin=False, level=2) == (
+        "Hi Bob\npart of Bob|{{ include 'none.md' }}|{{unknown}}"
+    )
+    # failing conditions leave the rest of the text unprocessed, as before
+    assert files.read_prompt_file("main.md", dirs, name="Cy", level=2).startswith(
+        "Hi Cy{{if admin}} (admin{{if level > 1}} L2{{endif}}){{endif}}"
+    )
+
+
+def test_include_original_and_values_with_template_syntax(tmp_path):
+    high, low = tmp_path / "high", tmp_path / "low"
+    _write(high / "main.md", "override [{{ include original }}] {{value}}")
+    _write(low / "main.md", "base {{value}}")
+    _write(low / "other.md", "other")
+
+    dirs = [str(high), str(low)]
+    assert files.read_prompt_file("main.md", dirs, value="v") == "override [base v] v"
+    # values are not compiled, the string pipeline keeps expanding includes inside them
+    assert files.read_prompt_file("main.md", dirs, value="{{ include 'other.md' }}") == (
+        "override [base other] other"
+    )
+
+
+def test_templates_are_cached_until_the_file_changes(tmp_path):
+    path = tmp_path / "main.md"
+    _write(path, "one {{x}}")
+    dirs = [str(tmp_path)]
+
+    assert files.read_prompt_file("main.md", dirs, x=1) == "one 1"
+    template = prompt_templates.get_template("main.md", dirs)
+    assert prompt_templates.get_template("main.md", dirs) is template
+
+    _write(path, "two {{x}} and more")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert files.read_prompt_file("main.md", dirs, x=1) == "two 1 and more"
+    assert prompt_templates.get_template("main.md", dirs) is not template
+
+
+def test_variables_plugin_is_imported_once(tmp_path, monkeypatch):
+    _write(tmp_path / "vars.md", "{{greeting}} {{name}}")
+    _write(
+        tmp_path / "vars.py",
+        "from helpers.files import VariablesPlugin\n"
+        "class Vars(VariablesPlugin):\n"
+        "    def get_variables(self, file, backup_dirs=None, **kwargs):\n"
+        "        return {'greeting': 'hello', 'name': 'plugin'}\n",
+    )
+    imports: list[str] = []
+    load_classes = prompt_templates.modules.load_classes_from_file
+
+    def counting_load_classes(file, *args, **kwargs):
+        imports.append(file)
+        return load_classes(file, *args, **kwargs)
+
+    monkeypatch.setattr(prompt_templates.modules, "load_classes_from_file", counting_load_classes)
+
+    dirs = [str(tmp_path)]
+    assert files.read_prompt_file("vars.md", dirs) == "hello plugin"
+    # explicit arguments override plugin variables
+    assert files.read_prompt_file("vars.md", dirs, name="you") == "hello you"
+    assert len(imports) == 1
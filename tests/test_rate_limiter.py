@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers.rate_limiter import RateLimiter
+
+
+def test_usage_expires_after_timeframe() -> None:
+    async def run():
+        limiter = RateLimiter(seconds=1, requests=5)
+        limiter.add(requests=3)
+        limiter.add(requests=2)
+        assert await limiter.get_total("requests") == 5
+        await asyncio.sleep(1.05)
+        assert await limiter.get_total("requests") == 0
+
+    asyncio.run(run())
+
+
+def test_wait_wakes_when_usage_leaves_window() -> None:
+    async def run():
+        limiter = RateLimiter(seconds=1, requests=1)
+        limiter.add(requests=2)
+        started = time.monotonic()
+        await limiter.wait()
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+    # no polling quantum, the waiter wakes right after the window passes
+    assert 0.9 <= elapsed < 1.5
+
+
+def test_waiters_are_served_in_order() -> None:
+    async def run():
+        limiter = RateLimiter(seconds=1, requests=1)
+        limiter.add(requests=2)
+        order: list[int] = []
+
+        async def waiter(i: int):
+            await limiter.wait()
+            order.append(i)
+
+        tasks = []
+        for i in range(3):
+            tasks.append(asyncio.create_task(waiter(i)))
+            await asyncio.sleep(0.01)
+        assert limiter.get_metrics()["queue_depth"] == 3
+        await asyncio.gather(*tasks)
+        return order, limiter.get_metrics()
+
+    order, metrics = asyncio.run(run())
+    assert order == [0, 1, 2]
+    assert metrics["queue_depth"] == 0
+    assert metrics["waits"]["count"] == 3
+
+
+def test_callback_can_skip_waiting() -> None:
+    calls: list[tuple[str, int, int]] = []
+
+    async def callback(msg: str, key: str, total: int, limit: int) -> bool:
+        calls.append((key, total, limit))
+        return True
+
+    async def run():
+        limiter = RateLimiter(seconds=60, input=10)
+        limiter.add(input=20)
+        await limiter.wait(callback)
+
+    asyncio.run(run())
+    assert calls == [("input", 20, 10)]
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def test_masker_matches_longest_value_first_and_skips_short_values() -> None:
+    from helpers.secrets import SecretsMasker
+
+    masker = SecretsMasker({"SHORT": "abc", "TOKEN": "tok-123", "LONG": "tok-123-ext"})
+
+    assert masker.mask("a tok-123-ext and tok-123, abc") == (
+        "a §§secret(LONG) and §§secret(TOKEN), abc"
+    )
+    assert SecretsMasker({}).mask("tok-123") == "tok-123"
+
+
+def test_manager_reuses_masker_until_cache_is_cleared(tmp_path) -> None:
+    from helpers.secrets import SecretsManager
+
+    secrets_file = tmp_path / "secrets.env"
+    secrets_file.write_text("API_KEY=key-value-1\n")
+    manager = SecretsManager(str(secrets_file))
+
+    masker = manager.get_masker()
+    assert manager.get_masker() is masker
+    assert manager.mask_values("use key-value-1 (re.escape: .*)") == "use §§secret(API_KEY) (re.escape: .*)"
+    assert manager.mask_values("key-value-1", placeholder="<{key}>") == "<API_KEY>"
+
+    secrets_file.write_text("API_KEY=key-value-2\n")
+    manager.clear_cache()
+    assert manager.get_masker() is not masker
+    assert manager.mask_values("key-value-1 key-value-2") == "key-value-1 §§secret(API_KEY)"
+
+
+def test_streaming_filter_holds_partial_secret_across_chunks() -> None:
+    from helpers.secrets import StreamingSecretsFilter
+
+    stream = StreamingSecretsFilter({"PASSWORD": "hunter2"})
+    out = stream.process_chunk("login with hun") + stream.process_chunk("ter2 now")
+    out += stream.finalize()
+
+    assert out == "login with §§secret(PASSWORD) now"
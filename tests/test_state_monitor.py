@@ -101,3 +101,62 @@ async def test_state_monitor_namespace_identity_prevents_cross_namespace_state_p
 
     assert captured
     assert all(ns == ns_a for ns, _ in captured)
+
+
+@pytest.mark.asyncio
+async def test_state_monitor_pushes_context_deltas_after_full_snapshot(monkeypatch) -> None:
+    import asyncio
+
+    from helpers.state_monitor import StateMonitor
+    from helpers.state_snapshot import StateRequestV1
+
+    loop = asyncio.get_running_loop()
+    emitted: list[dict] = []
+
+    class FakeManager:
+        def __init__(self):
+            self._dispatcher_loop = loop
+
+        async def emit_to(self, namespace, sid, event_type, payload, **_kwargs):
+            emitted.append(payload)
+
+    ctx_a = {"id": "a", "created_at": "2024-01-01", "log_version": 1}
+    ctx_b = {"id": "b", "created_at": "2024-01-02", "log_version": 1}
+    task_c = {"id": "c", "created_at": "2024-01-03", "state": "idle"}
+    lists = {"contexts": [ctx_a, ctx_b], "tasks": [task_c]}
+
+    async def _fake_snapshot(**_kwargs):
+        return {
+            "log_version": 0,
+            "notifications_version": 0,
+            "logs": [],
+            "contexts": list(lists["contexts"]),
+            "tasks": list(lists["tasks"]),
+            "notifications": [],
+        }
+
+    monkeypatch.setattr("helpers.state_monitor.build_snapshot_from_request", _fake_snapshot)
+
+    namespace, sid = "/ws", "sid-1"
+    monitor = StateMonitor(debounce_seconds=60.0)
+    monitor.bind_manager(FakeManager(), handler_id="tester")
+    monitor.register_sid(namespace, sid)
+    request = StateRequestV1(context=None, log_from=0, notifications_from=0, timezone="UTC")
+    monitor.update_projection(namespace, sid, request=request, seq_base=1)
+
+    await monitor._flush_push((namespace, sid))
+    lists["contexts"] = [ctx_a, {**ctx_b, "log_version": 2}]
+    lists["tasks"] = []
+    await monitor._flush_push((namespace, sid))
+
+    assert "delta" not in emitted[0]
+    assert emitted[0]["snapshot"]["contexts"] == [ctx_a, ctx_b]
+    assert emitted[1]["snapshot"]["contexts"] == [{**ctx_b, "log_version": 2}]
+    assert emitted[1]["snapshot"]["tasks"] == []
+    assert emitted[1]["delta"] == {"contexts_removed": [], "tasks_removed": ["c"]}
+
+    # a new state_request (e.g. after a sequence gap) starts over with a full snapshot
+    monitor.update_projection(namespace, sid, request=request, seq_base=1)
+    await monitor._flush_push((namespace, sid))
+    assert "delta" not in emitted[2]
+    assert emitted[2]["snapshot"]["contexts"] == lists["contexts"]
@@ -21,6 +21,7 @@ class FakeSocketIOServer:
 
         self.emit = AsyncMock()
         self.disconnect = AsyncMock()
+        self.enter_room = AsyncMock()
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers import extension
+from helpers.extension import Extension
+
+
+calls: list[tuple[str, str, str]] = []
+
+
+class _BatchRecorder(Extension):
+    async def execute(self, stream_data=None, **kwargs):
+        calls.append(("batch", stream_data["chunk"], stream_data["full"]))
+
+
+class _ChunkTagger(Extension):
+    stream_delivery = extension.STREAM_DELIVERY_CHUNK
+
+    async def execute(self, stream_data=None, **kwargs):
+        calls.append(("chunk", stream_data["chunk"], stream_data["full"]))
+        stream_data["chunk"] = f"<{stream_data['chunk']}>"
+
+
+@pytest.fixture(autouse=True)
+def _extensions(monkeypatch):
+    calls.clear()
+    monkeypatch.setattr(
+        extension,
+        "_get_extension_classes",
+        lambda *args, **kwargs: [_BatchRecorder, _ChunkTagger, _BatchRecorder],
+    )
+
+
+@pytest.mark.asyncio
+async def test_stream_extensions_choose_batch_or_chunk_delivery():
+    stream_data = {"chunk": "bcd", "full": "abcd"}
+
+    await extension.call_stream_extensions_async(
+        "response_stream_chunk", None, stream_data=stream_data, parts=["b", "c", "d"]
+    )
+
+    assert calls == [
+        ("batch", "bcd", "abcd"),
+        ("chunk", "b", "ab"),
+        ("chunk", "c", "abc"),
+        ("chunk", "d", "abcd"),
+        ("batch", "<b><c><d>", "abcd"),
+    ]
+    assert stream_data == {"chunk": "<b><c><d>", "full": "abcd"}
+
+
+@pytest.mark.asyncio
+async def test_stream_extensions_rewritten_batch_is_delivered_whole():
+    stream_data = {"chunk": "snapshot", "full": "snapshot"}
+
+    await extension.call_stream_extensions_async(
+        "response_stream_chunk", None, stream_data=stream_data, parts=["snap", "x"]
+    )
+
+    assert [call[0:2] for call in calls] == [
+        ("batch", "snapshot"),
+        ("chunk", "snapshot"),
+        ("batch", "<snapshot>"),
+    ]
@@ -94,3 +94,40 @@ async def test_unified_call_stops_after_canonical_root_snapshot(monkeypatch):
     assert stream.index == 1
     assert len(seen) == 1
     assert seen[0][1] == '{"tool_name":"response","tool_args":{"text":"hello"}} trailing text'
+
+
+@pytest.mark.asyncio
+async def test_unified_call_coalesces_stream_deltas(monkeypatch):
+    stream = _AsyncChunkStream([_chunk(text) for text in ["a", "b", "c", "d", "e"]])
+
+    async def fake_acompletion(*args, **kwargs):
+        assert "a0_stream_coalesce_ms" not in kwargs
+        return stream
+
+    async def fake_rate_limiter(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(models, "acompletion", fake_acompletion)
+    monkeypatch.setattr(models, "apply_rate_limiter", fake_rate_limiter)
+
+    wrapper = models.LiteLLMChatWrapper(
+        model="test-model",
+        provider="openai",
+        model_config=None,
+    )
+
+    seen: list[tuple[str, str, list[str]]] = []
+
+    async def response_callback(chunk: str, full: str, parts: list[str] | None = None):
+        seen.append((chunk, full, parts or []))
+        return None
+
+    response, _ = await wrapper.unified_call(
+        messages=[],
+        response_callback=response_callback,
+        a0_stream_coalesce_ms=10_000,
+    )
+
+    # the first delta goes out right away, the rest waits for the window or the end of the stream
+    assert response == "abcde"
+    assert seen == [("a", "a", ["a"]), ("bcde", "abcde", ["b", "c", "d", "e"])]
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers import tokens
+
+
+def test_count_many_matches_single_counts() -> None:
+    texts = ["", "hello world", "x" * (tokens.CACHE_MIN_CHARS + 10), "def f():\n    return 1\n"]
+
+    assert tokens.count_many(texts) == [tokens.count_tokens(t) for t in texts]
+
+
+def test_long_text_counts_are_cached_by_content() -> None:
+    tokenizer = tokens.Tokenizer()
+    text = "repeated system prompt fragment " * 20
+
+    first = tokenizer.count(text)
+    assert len(tokenizer._counts) == 1
+    assert tokenizer.count(text) == first
+    assert len(tokenizer._counts) == 1
+
+
+def test_cache_is_bounded() -> None:
+    tokenizer = tokens.Tokenizer(max_entries=2)
+    for i in range(5):
+        tokenizer.count(f"{i} " + "y" * tokens.CACHE_MIN_CHARS)
+
+    assert len(tokenizer._counts) == 2
+
+
+def test_estimate_mode_does_not_encode() -> None:
+    assert tokens.approximate_tokens("", mode="estimate") == 0
+    assert tokens.approximate_tokens("abcd" * 100, mode="estimate") == int(100 * tokens.APPROX_BUFFER)
@@ -18,6 +18,9 @@ class _FakeSocketIO:
     async def disconnect(self, *_args, **_kwargs):  # pragma: no cover - helper stub
         return None
 
+    async def enter_room(self, *_args, **_kwargs):  # pragma: no cover - helper stub
+        return None
+
 
 def test_ws_result_ok_clones_payload():
     payload = {"value": 1}
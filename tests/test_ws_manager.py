@@ -14,8 +14,10 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from helpers.ws import ConnectionNotFoundError, WsHandler
 from helpers.ws_manager import (
+    WsJson,
     WsManager,
     WsResult,
+    BROADCAST_ROOM,
     BUFFER_TTL,
     DIAGNOSTIC_EVENT,
     LIFECYCLE_CONNECT_EVENT,
@@ -29,6 +31,7 @@ class FakeSocketIOServer:
     def __init__(self):
         self.emit = AsyncMock()
         self.disconnect = AsyncMock()
+        self.enter_room = AsyncMock()
 
 
 class DummyHandler(WsHandler):
@@ -102,7 +105,9 @@ async def test_broadcast_performance_smoke(monkeypatch):
     await manager.broadcast(NAMESPACE, "perf_event", {"ok": True})
     duration_ms = (time.perf_counter() - start) * 1000
 
-    assert socketio.emit.await_count == 50
+    # a single emit to the namespace room reaches all connections
+    assert socketio.emit.await_count == 1
+    assert socketio.emit.await_args.kwargs == {"to": BROADCAST_ROOM, "namespace": NAMESPACE}
     assert duration_ms < 300
 
 
@@ -476,7 +481,11 @@ async def test_broadcast_excludes_multiple_sids():
     assert envelope["handlerId"] == "custom.broadcast"
     assert envelope["correlationId"] == "corr-b"
     assert "eventId" in envelope and "ts" in envelope
-    assert awaited_call.kwargs == {"to": "sid-2", "namespace": NAMESPACE}
+    assert awaited_call.kwargs == {
+        "to": BROADCAST_ROOM,
+        "namespace": NAMESPACE,
+        "skip_sid": ["sid-1", "sid-3"],
+    }
 
 
 @pytest.mark.asyncio
@@ -843,3 +852,70 @@ async def test_lifecycle_events_broadcast(monkeypatch):
     events = [call.args[1] for call in broadcast_mock.await_args_list]
     assert LIFECYCLE_CONNECT_EVENT in events
     assert LIFECYCLE_DISCONNECT_EVENT in events
+
+
+@pytest.mark.asyncio
+async def test_connect_joins_broadcast_room():
+    socketio = FakeSocketIOServer()
+    manager = WsManager(socketio, threading.RLock())
+
+    await manager.handle_connect(NAMESPACE, "sid-room")
+
+    socketio.enter_room.assert_awaited_once_with(
+        "sid-room", BROADCAST_ROOM, namespace=NAMESPACE
+    )
+
+
+@pytest.mark.asyncio
+async def test_emits_from_other_threads_are_flushed_in_one_loop_tick(monkeypatch):
+    socketio = FakeSocketIOServer()
+    manager = WsManager(socketio, threading.RLock())
+    for idx in range(5):
+        await manager.handle_connect(NAMESPACE, f"sid-{idx}")
+    # Drain lifecycle broadcast tasks from handle_connect
+    for _ in range(10):
+        await asyncio.sleep(0)
+    socketio.emit.reset_mock()
+
+    flushes = 0
+    pending: list[int] = []
+    flush = manager._flush_emit_queue  # noqa: SLF001
+
+    def _counting_flush():
+        nonlocal flushes
+        flushes += 1
+        flush()
+        pending.append(len(manager._emit_tasks))  # noqa: SLF001
+
+    monkeypatch.setattr(manager, "_flush_emit_queue", _counting_flush)
+
+    async def _emit_all():
+        await asyncio.gather(
+            *(
+                manager.emit_to(NAMESPACE, f"sid-{idx}", "thread_event", {"idx": idx})
+                for idx in range(5)
+            )
+        )
+
+    worker = threading.Thread(target=asyncio.run, args=(_emit_all(),))
+    worker.start()
+    # keep the dispatcher loop busy until every emit is queued
+    while len(manager._emit_queue) < 5:  # noqa: SLF001
+        time.sleep(0.001)
+    await asyncio.to_thread(worker.join)
+
+    assert flushes == 1
+    assert [call.kwargs["to"] for call in socketio.emit.await_args_list] == [
+        f"sid-{idx}" for idx in range(5)
+    ]
+    # emit tasks are referenced until they finish
+    assert pending == [5]
+    assert not manager._emit_tasks  # noqa: SLF001
+
+
+def test_ws_json_falls_back_for_payloads_orjson_cannot_encode():
+    payload = {"text": "žluťoučký", 1: [1.5, None], "big": 2**70}
+
+    encoded = WsJson.dumps(payload, separators=(",", ":"))
+
+    assert WsJson.loads(encoded) == {"text": "žluťoučký", "1": [1.5, None], "big": 2**70}
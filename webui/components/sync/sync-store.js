@@ -39,6 +39,33 @@ function debug(...args) {
   console.debug(...args);
 }
 
+// Contexts and tasks known from state_push, pushes after the first one only carry changes.
+// Kept outside the store so the maps are not wrapped in reactive proxies.
+const pushedEntities = {
+  contexts: new Map(),
+  tasks: new Map(),
+};
+
+function mergePushedSnapshot(snapshot, delta) {
+  for (const kind of ["contexts", "tasks"]) {
+    const entries = Array.isArray(snapshot[kind]) ? snapshot[kind] : [];
+    const known = pushedEntities[kind];
+    if (!delta) {
+      known.clear();
+    } else {
+      for (const id of delta[`${kind}_removed`] || []) known.delete(id);
+    }
+    for (const entry of entries) {
+      if (entry && entry.id !== undefined) known.set(entry.id, entry);
+    }
+  }
+  return {
+    ...snapshot,
+    contexts: [...pushedEntities.contexts.values()],
+    tasks: [...pushedEntities.tasks.values()],
+  };
+}
+
 function isRestartToastActive() {
   return (
     Array.isArray(notificationStore.toastStack) &&
@@ -493,7 +520,11 @@ const model = {
     }
 
     if (data.snapshot && typeof data.snapshot === "object") {
-      await applySnapshot(data.snapshot, {
+      const snapshot = mergePushedSnapshot(
+        data.snapshot,
+        data.delta && typeof data.delta === "object" ? data.delta : null,
+      );
+      await applySnapshot(snapshot, {
         onLogGuidReset: async () => {
           debug("[syncStore] log_guid reset -> resync (forceFull)");
           await this.sendStateRequest({ forceFull: true });